@@ -0,0 +1,16 @@
+-- Migration: 2.84.0_keyset_pagination_indexes
+-- Description: Indexes for MCP list_projects / list_tickets keyset pagination
+--              (ORDER BY created_at DESC, id DESC with a (created_at, id) cursor)
+
+-- MySQL 5.7 doesn't support IF NOT EXISTS for indexes, so we use a procedure
+DROP PROCEDURE IF EXISTS add_keyset_pagination_indexes;
+DELIMITER //
+CREATE PROCEDURE add_keyset_pagination_indexes()
+BEGIN
+    DECLARE CONTINUE HANDLER FOR 1061 BEGIN END; -- Duplicate key name
+    CREATE INDEX idx_projects_status_created ON projects(status, created_at DESC, id);
+    CREATE INDEX idx_tickets_project_status_created ON tickets(project_id, status, created_at DESC, id);
+END //
+DELIMITER ;
+CALL add_keyset_pagination_indexes();
+DROP PROCEDURE IF EXISTS add_keyset_pagination_indexes;
@@ -0,0 +1,16 @@
+-- Migration: 2.84.0_ticket_number_counters
+-- Description: Per-project counter for atomic ticket number allocation (MCP create_ticket)
+
+CREATE TABLE IF NOT EXISTS `project_ticket_counters` (
+  `project_id` int NOT NULL,
+  `last_num` int unsigned NOT NULL DEFAULT '0' COMMENT 'Highest ticket number allocated for the project',
+  PRIMARY KEY (`project_id`),
+  CONSTRAINT `fk_ticket_counter_project` FOREIGN KEY (`project_id`) REFERENCES `projects` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Next ticket number per project';
+
+-- Seed from existing tickets (PROJ-0007 -> 7)
+INSERT INTO project_ticket_counters (project_id, last_num)
+SELECT project_id, MAX(CAST(SUBSTRING_INDEX(ticket_number, '-', -1) AS UNSIGNED))
+FROM tickets
+GROUP BY project_id
+ON DUPLICATE KEY UPDATE last_num = GREATEST(last_num, VALUES(last_num));
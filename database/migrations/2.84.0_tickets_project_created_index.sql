@@ -0,0 +1,14 @@
+-- Migration: 2.84.0_tickets_project_created_index
+-- Description: Index for MCP list_tickets / get_project (WHERE project_id = ? ORDER BY created_at DESC)
+
+-- MySQL 5.7 doesn't support IF NOT EXISTS for indexes, so we use a procedure
+DROP PROCEDURE IF EXISTS add_tickets_project_created_index;
+DELIMITER //
+CREATE PROCEDURE add_tickets_project_created_index()
+BEGIN
+    DECLARE CONTINUE HANDLER FOR 1061 BEGIN END; -- Duplicate key name
+    CREATE INDEX idx_tickets_project_created ON tickets(project_id, created_at DESC);
+END //
+DELIMITER ;
+CALL add_tickets_project_created_index();
+DROP PROCEDURE IF EXISTS add_tickets_project_created_index;
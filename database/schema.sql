@@ -270,7 +270,8 @@ CREATE TABLE `projects` (
   UNIQUE KEY `code` (`code`),
   KEY `idx_status` (`status`),
   KEY `idx_db_name` (`db_name`),
-  KEY `idx_projects_status_updated` (`status`, `updated_at` DESC)
+  KEY `idx_projects_status_updated` (`status`, `updated_at` DESC),
+  KEY `idx_projects_status_created` (`status`, `created_at` DESC, `id`)
 ) ENGINE=InnoDB AUTO_INCREMENT=1 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 /*!40101 SET character_set_client = @saved_cs_client */;
 
@@ -400,6 +401,8 @@ CREATE TABLE `tickets` (
   KEY `idx_tickets_retry_after` (`retry_after`),
   KEY `idx_tickets_status_updated` (`status`, `updated_at` DESC),
   KEY `idx_tickets_project_updated` (`project_id`, `updated_at` DESC),
+  KEY `idx_tickets_project_created` (`project_id`, `created_at` DESC),
+  KEY `idx_tickets_project_status_created` (`project_id`, `status`, `created_at` DESC, `id`),
   CONSTRAINT `tickets_ibfk_1` FOREIGN KEY (`project_id`) REFERENCES `projects` (`id`) ON DELETE CASCADE,
   CONSTRAINT `fk_parent_ticket` FOREIGN KEY (`parent_ticket_id`) REFERENCES `tickets` (`id`) ON DELETE SET NULL
 ) ENGINE=InnoDB AUTO_INCREMENT=1 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
@@ -423,6 +426,21 @@ CREATE TABLE `ticket_dependencies` (
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 /*!40101 SET character_set_client = @saved_cs_client */;
 
+--
+-- Table structure for table `project_ticket_counters`
+--
+
+DROP TABLE IF EXISTS `project_ticket_counters`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!50503 SET character_set_client = utf8mb4 */;
+CREATE TABLE `project_ticket_counters` (
+  `project_id` int NOT NULL,
+  `last_num` int unsigned NOT NULL DEFAULT '0' COMMENT 'Highest ticket number allocated for the project',
+  PRIMARY KEY (`project_id`),
+  CONSTRAINT `fk_ticket_counter_project` FOREIGN KEY (`project_id`) REFERENCES `projects` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Next ticket number per project';
+/*!40101 SET character_set_client = @saved_cs_client */;
+
 --
 -- Table structure for table `usage_stats`
 --
@@ -19,14 +19,17 @@ if SCRIPT_DIR not in sys.path:
     sys.path.insert(0, SCRIPT_DIR)
 
 import signal
+import atexit
 import smtplib
 import threading
+import queue
 import urllib.request
 import urllib.error
 import shutil
 import zipfile
 import tempfile
 import select
+import re
 from datetime import datetime
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
@@ -65,9 +68,13 @@ CONFIG_FILE = "/etc/codehero/system.conf"
 PID_FILE = "/var/run/codehero/daemon.pid"
 LOG_FILE = "/var/log/codehero/daemon.log"
 GLOBAL_CONTEXT_FILE = "/etc/codehero/global-context.md"
+# KEY=value lines of system.conf; comment lines never match (key can't start with '#')
+CONFIG_LINE_RE = re.compile(r'^[ \t]*([^#\s=][^=\n]*)=([^\n]*)$', re.MULTILINE)
 STUCK_TIMEOUT_MINUTES = 30
 POLL_INTERVAL = 3
 MAX_PARALLEL_PROJECTS = 10
+RUN_USER = os.getenv('USER', 'unknown')
+WORKER_SHUTDOWN_TIMEOUT = 5  # Total seconds to wait for all workers on shutdown
 
 # Rate limit and retry cooldown settings (defaults, can be overridden in system.conf)
 RATE_LIMIT_COOLDOWN_MINUTES = 30  # Wait time after hitting API rate limit
@@ -104,9 +111,22 @@ def send_telegram(message, parse_mode="HTML"):
 # Telegram polling for replies
 TELEGRAM_LAST_UPDATE_ID = 0
 
+# (epoch second, formatted string) of the last log timestamp - reused within the same second
+_LOG_TS_CACHE = (0, '')
+
+def log_timestamp():
+    """Current local time as 'YYYY-mm-dd HH:MM:SS', formatted at most once per second"""
+    global _LOG_TS_CACHE
+    now = int(time.time())
+    cached = _LOG_TS_CACHE
+    if cached[0] != now:
+        cached = (now, time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now)))
+        _LOG_TS_CACHE = cached
+    return cached[1]
+
 def log_debug(message):
     """Write debug message to log file"""
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    timestamp = log_timestamp()
     try:
         with open(LOG_FILE, 'a') as f:
             f.write(f"[{timestamp}] [DEBUG] {message}\n")
@@ -2366,10 +2386,17 @@ class TelegramPoller(threading.Thread):
 class ClaudeDaemon:
     """Main daemon - manages project workers"""
 
+    _pid_cleanup_registered = False  # atexit hook is per process, not per instance
+
     def __init__(self):
         self.running = True
+        # Set to cut the main loop's poll sleep short (e.g. on SIGTERM)
+        self._wakeup = threading.Event()
         self.config = self.load_config()
         self.db_pool = self.create_db_pool()
+        # Long-lived connection for main-loop housekeeping (see get_housekeeping_db)
+        self._hk_conn = None
+        self._stmt_daemon_status = None
         self.workers = {}
         self.workers_lock = threading.Lock()
         self.max_parallel = int(self.config.get('MAX_PARALLEL_PROJECTS', MAX_PARALLEL_PROJECTS))
@@ -2415,6 +2442,13 @@ class ClaudeDaemon:
             except Exception as e:
                 self.log(f"Failed to initialize Smart Context Manager: {e}", "WARNING")
 
+        # Outgoing alert emails are sent by a background worker over one SMTP session
+        self._mail_q = queue.Queue(maxsize=256)
+        self._mail_thread = None
+        if self.config.get('SMTP_ENABLED', 'false').lower() == 'true':
+            self._mail_thread = threading.Thread(target=self._mail_worker, name='mail-worker', daemon=True)
+            self._mail_thread.start()
+
         # Initialize Watchdog (will be started in run())
         self.watchdog = None
         # Initialize Telegram Poller (will be started in run())
@@ -2737,16 +2771,16 @@ Reply with ONLY one word: COMPLETED, QUESTION, or ERROR"""
 
     def load_config(self):
         config = {}
-        if os.path.exists(CONFIG_FILE):
+        try:
             with open(CONFIG_FILE, 'r') as f:
-                for line in f:
-                    line = line.strip()
-                    if '=' in line and not line.startswith('#'):
-                        key, value = line.split('=', 1)
-                        # Remove inline comments (but be careful with # in passwords)
-                        if ' #' in value:
-                            value = value.split(' #')[0]
-                        config[key.strip()] = value.strip().strip('"').strip("'")
+                content = f.read()
+        except FileNotFoundError:
+            return config
+        for key, value in CONFIG_LINE_RE.findall(content):
+            # Remove inline comments (but be careful with # in passwords)
+            if ' #' in value:
+                value = value.split(' #')[0]
+            config[key.strip()] = value.strip().strip('"').strip("'")
         return config
     
     def create_db_pool(self):
@@ -2791,9 +2825,84 @@ Reply with ONLY one word: COMPLETED, QUESTION, or ERROR"""
         # All retries failed - log and raise
         self.log(f"Database connection failed after {max_retries} attempts: {last_error}", "ERROR")
         raise last_error
-    
+
+    def request_stop(self, signum=None, frame=None):
+        """Signal handler: stop the main loop without waiting out POLL_INTERVAL"""
+        self.running = False
+        self._wakeup.set()
+
+    def get_housekeeping_db(self):
+        """Get the long-lived connection reused by the main loop's housekeeping queries"""
+        if self._hk_conn is not None:
+            try:
+                self._hk_conn.ping(reconnect=False)
+                return self._hk_conn
+            except Exception:
+                self.close_housekeeping_db()
+        self._hk_conn = self.get_db()
+        return self._hk_conn
+
+    def close_housekeeping_db(self):
+        """Release the housekeeping connection (and its prepared statements) back to the pool"""
+        if self._stmt_daemon_status is not None:
+            try:
+                self._stmt_daemon_status.close()
+            except Exception:
+                pass
+            self._stmt_daemon_status = None
+        if self._hk_conn is not None:
+            try:
+                self._hk_conn.close()
+            except Exception:
+                pass
+            self._hk_conn = None
+
+    def set_daemon_status(self, state):
+        """Record daemon lifecycle state ('running' / 'stopped') in daemon_status"""
+        try:
+            conn = self.get_housekeeping_db()
+            if self._stmt_daemon_status is None:
+                self._stmt_daemon_status = conn.cursor(prepared=True)
+            self._stmt_daemon_status.execute(
+                "UPDATE daemon_status SET status=%s, started_at=IF(%s='running', NOW(), started_at) WHERE id=1",
+                (state, state)
+            )
+            # Only commit when the row actually changed
+            if self._stmt_daemon_status.rowcount > 0:
+                conn.commit()
+        except Exception as e:
+            self.log(f"Error updating daemon status to {state}: {e}", "WARNING")
+            self.close_housekeeping_db()
+
+    def write_pid_file(self):
+        """Write PID_FILE atomically (temp file + fsync + rename) so it is never truncated"""
+        os.makedirs(os.path.dirname(PID_FILE), exist_ok=True)
+        tmp_path = PID_FILE + '.tmp'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.write(fd, str(os.getpid()).encode())
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.rename(tmp_path, PID_FILE)
+        # Also clean up if we exit without reaching the end of run(); startup
+        # retries build a new daemon each time, so register only once
+        if not ClaudeDaemon._pid_cleanup_registered:
+            ClaudeDaemon._pid_cleanup_registered = True
+            atexit.register(self.remove_pid_file)
+
+    def remove_pid_file(self):
+        """Remove PID_FILE if it still belongs to this process"""
+        try:
+            with open(PID_FILE, 'r') as f:
+                if f.read().strip() != str(os.getpid()):
+                    return
+            os.remove(PID_FILE)
+        except OSError:
+            pass
+
     def log(self, message, level="INFO"):
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        timestamp = log_timestamp()
         log_line = f"[{timestamp}] [{level}] {message}"
         try:
             os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
@@ -3060,38 +3169,95 @@ Answer briefly:"""
             return "Could not generate summary. Check the web panel for details."
 
     def send_email(self, subject, body):
-        if self.config.get('SMTP_ENABLED', 'false').lower() != 'true':
+        """Queue an alert email; delivery happens on the mail worker thread"""
+        if self._mail_thread is None:
             return
         try:
+            self._mail_q.put_nowait((subject, body))
+        except queue.Full:
+            self.log(f"Email queue full, dropping: {subject}", "WARNING")
+
+    def _smtp_connect(self):
+        server = smtplib.SMTP(self.config.get('SMTP_HOST', 'smtp.gmail.com'),
+                              int(self.config.get('SMTP_PORT', '587')), timeout=30)
+        if self.config.get('SMTP_USE_TLS', 'true').lower() == 'true':
+            server.starttls()
+        server.login(self.config.get('SMTP_USER', ''), self.config.get('SMTP_PASSWORD', ''))
+        return server
+
+    def _mail_worker(self):
+        """Drain the mail queue, keeping the SMTP session open between messages"""
+        server = None
+        while True:
+            item = self._mail_q.get()
+            if item is None:
+                break
+            subject, body = item
+
             msg = MIMEMultipart()
             msg['From'] = self.config.get('SMTP_USER', '')
             msg['To'] = self.config.get('ALERT_EMAIL', '')
             msg['Subject'] = f"[CodeHero] {subject}"
             msg.attach(MIMEText(body, 'plain'))
-            
-            server = smtplib.SMTP(self.config.get('SMTP_HOST', 'smtp.gmail.com'),
-                                 int(self.config.get('SMTP_PORT', '587')))
-            if self.config.get('SMTP_USE_TLS', 'true').lower() == 'true':
-                server.starttls()
-            server.login(self.config.get('SMTP_USER', ''), self.config.get('SMTP_PASSWORD', ''))
-            server.send_message(msg)
-            server.quit()
-            self.log(f"Email sent: {subject}")
-        except Exception as e:
-            self.log(f"Email error: {e}", "ERROR")
-    
+
+            # A failure on a reused session is most likely a stale socket
+            # (disconnect, reset, broken pipe): reconnect and send once more
+            for _ in range(2):
+                reused = server is not None
+                try:
+                    if server is None:
+                        server = self._smtp_connect()
+                    server.send_message(msg)
+                    self.log(f"Email sent: {subject}")
+                    break
+                except (smtplib.SMTPException, OSError) as e:
+                    try:
+                        if server:
+                            server.close()
+                    except Exception:
+                        pass
+                    server = None
+                    if not reused:
+                        self.log(f"Email error: {e}", "ERROR")
+                        break
+                except Exception as e:
+                    self.log(f"Email error: {e}", "ERROR")
+                    try:
+                        if server:
+                            server.close()
+                    except Exception:
+                        pass
+                    server = None
+                    break
+
+        if server:
+            try:
+                server.quit()
+            except Exception:
+                pass
+
+    def stop_mail_worker(self, timeout=5):
+        """Flush queued emails and close the SMTP session"""
+        if self._mail_thread is None:
+            return
+        try:
+            self._mail_q.put(None, timeout=1)
+        except queue.Full:
+            return
+        self._mail_thread.join(timeout=timeout)
+
     def get_projects_with_open_tickets(self):
         try:
             conn = self.get_db()
             cursor = conn.cursor(dictionary=True)
             cursor.execute("""
-                SELECT DISTINCT p.id, p.name, p.code, COALESCE(p.web_path, p.app_path) as work_path,
+                SELECT p.id, p.name, p.code, COALESCE(p.web_path, p.app_path) as work_path,
                        p.global_context, p.project_context,
                        (SELECT COUNT(*) FROM tickets WHERE project_id = p.id AND status IN ('open', 'new', 'pending')) as open_count
                 FROM projects p
-                JOIN tickets t ON t.project_id = p.id
-                WHERE t.status IN ('open', 'new', 'pending')
-                AND p.status = 'active'
+                WHERE p.status = 'active'
+                AND EXISTS (SELECT 1 FROM tickets t
+                            WHERE t.project_id = p.id AND t.status IN ('open', 'new', 'pending'))
                 ORDER BY
                     (SELECT MIN(CASE priority WHEN 'critical' THEN 1 WHEN 'high' THEN 2 WHEN 'medium' THEN 3 ELSE 4 END)
                      FROM tickets WHERE project_id = p.id AND status IN ('open', 'new', 'pending')) ASC
@@ -3110,70 +3276,70 @@ Answer briefly:"""
             for pid in dead:
                 del self.workers[pid]
 
-        # Also reset orphaned in_progress tickets (no active worker)
-        self.reset_orphaned_tickets()
-
-    def reset_orphaned_tickets(self):
-        """Reset in_progress tickets that have no active worker"""
+    def run_housekeeping(self):
+        """Per-poll ticket housekeeping as one transaction on the housekeeping connection"""
         try:
-            conn = self.get_db()
+            conn = self.get_housekeeping_db()
+            conn.start_transaction()
             cursor = conn.cursor(dictionary=True)
-
-            # Get all in_progress tickets
-            cursor.execute("""
-                SELECT t.id, t.ticket_number, t.project_id
-                FROM tickets t
-                WHERE t.status = 'in_progress'
-            """)
-            in_progress = cursor.fetchall()
-
-            # Check which ones have no active worker
-            with self.workers_lock:
-                active_project_ids = set(self.workers.keys())
-
-            orphaned = [t for t in in_progress if t['project_id'] not in active_project_ids]
-
-            if orphaned:
-                orphan_ids = [t['id'] for t in orphaned]
-                cursor.execute(f"""
-                    UPDATE tickets
-                    SET status = 'open', updated_at = NOW()
-                    WHERE id IN ({','.join(['%s']*len(orphan_ids))})
-                """, orphan_ids)
+            try:
+                orphaned = self.reset_orphaned_tickets(cursor)
+                closed = self.auto_close_expired_reviews(cursor)
                 conn.commit()
-                for t in orphaned:
-                    self.log(f"Reset orphaned ticket {t['ticket_number']} to open")
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
 
-            cursor.close()
-            conn.close()
+            for t in orphaned:
+                self.log(f"Reset orphaned ticket {t['ticket_number']} to open")
+            if closed > 0:
+                self.log(f"Auto-closed {closed} expired awaiting_input ticket(s)")
         except Exception as e:
-            self.log(f"Error resetting orphaned tickets: {e}", "ERROR")
+            self.log(f"Error in housekeeping: {e}", "ERROR")
+            self.close_housekeeping_db()
+
+    def reset_orphaned_tickets(self, cursor):
+        """Reset in_progress tickets that have no active worker; returns the reset tickets"""
+        # Get all in_progress tickets
+        cursor.execute("""
+            SELECT t.id, t.ticket_number, t.project_id
+            FROM tickets t
+            WHERE t.status = 'in_progress'
+        """)
+        in_progress = cursor.fetchall()
+
+        # Check which ones have no active worker
+        with self.workers_lock:
+            active_project_ids = set(self.workers.keys())
 
-    def auto_close_expired_reviews(self):
-        """Auto-close awaiting_input tickets that have passed their 7-day deadline"""
-        try:
-            conn = self.get_db()
-            cursor = conn.cursor()
-            cursor.execute("""
+        orphaned = [t for t in in_progress if t['project_id'] not in active_project_ids]
+
+        if orphaned:
+            orphan_ids = [t['id'] for t in orphaned]
+            cursor.execute(f"""
                 UPDATE tickets
-                SET status = 'done',
-                    closed_at = NOW(),
-                    closed_by = 'Claude',
-                    close_reason = 'auto_closed_7days',
-                    review_deadline = NULL,
-                    updated_at = NOW()
-                WHERE status = 'awaiting_input'
-                AND review_deadline IS NOT NULL
-                AND review_deadline < NOW()
-            """)
-            affected = cursor.rowcount
-            conn.commit()
-            cursor.close()
-            conn.close()
-            if affected > 0:
-                self.log(f"Auto-closed {affected} expired awaiting_input ticket(s)")
-        except Exception as e:
-            self.log(f"Error auto-closing tickets: {e}", "ERROR")
+                SET status = 'open', updated_at = NOW()
+                WHERE id IN ({','.join(['%s']*len(orphan_ids))})
+            """, orphan_ids)
+        return orphaned
+
+    def auto_close_expired_reviews(self, cursor):
+        """Auto-close awaiting_input tickets that have passed their 7-day deadline; returns count"""
+        cursor.execute("""
+            UPDATE tickets
+            SET status = 'done',
+                closed_at = NOW(),
+                closed_by = 'Claude',
+                close_reason = 'auto_closed_7days',
+                review_deadline = NULL,
+                updated_at = NOW()
+            WHERE status = 'awaiting_input'
+            AND review_deadline IS NOT NULL
+            AND review_deadline < NOW()
+        """)
+        return cursor.rowcount
 
     def recover_orphaned_tickets(self):
         """Reset tickets that were left in_progress from a previous daemon run (e.g., after reboot)"""
@@ -3183,6 +3349,7 @@ Answer briefly:"""
         for attempt in range(5):
             try:
                 conn = self.get_db()
+                conn.start_transaction()
                 cursor = conn.cursor()
 
                 # Reset in_progress tickets back to open
@@ -3228,21 +3395,12 @@ Answer briefly:"""
                     self.log(f"Startup recovery failed after 5 attempts", "ERROR")
 
     def run(self):
-        self.log(f"Claude Daemon v3 started (user: {os.getenv('USER', 'unknown')})")
+        self.log(f"Claude Daemon v3 started (user: {RUN_USER})")
         self.log(f"Max parallel projects: {self.max_parallel}")
         
-        os.makedirs(os.path.dirname(PID_FILE), exist_ok=True)
-        with open(PID_FILE, 'w') as f:
-            f.write(str(os.getpid()))
-        
-        try:
-            conn = self.get_db()
-            cursor = conn.cursor()
-            cursor.execute("UPDATE daemon_status SET status='running', started_at=NOW() WHERE id=1")
-            conn.commit()
-            cursor.close()
-            conn.close()
-        except: pass
+        self.write_pid_file()
+
+        self.set_daemon_status('running')
 
         # Recover any orphaned tickets from previous run
         self.recover_orphaned_tickets()
@@ -3259,7 +3417,7 @@ Answer briefly:"""
         while self.running:
             try:
                 self.cleanup_dead_workers()
-                self.auto_close_expired_reviews()
+                self.run_housekeeping()
                 self.process_scheduled_reviews()  # Auto-review system
                 projects = self.get_projects_with_open_tickets()
                 
@@ -3299,13 +3457,13 @@ Answer briefly:"""
                             active_count += 1
                             self.log(f"Started worker for {project['name']} ({project['open_count']} tickets)")
                 
-                time.sleep(POLL_INTERVAL)
+                self._wakeup.wait(POLL_INTERVAL)
                 
             except KeyboardInterrupt:
                 break
             except Exception as e:
                 self.log(f"Error: {e}", "ERROR")
-                time.sleep(POLL_INTERVAL)
+                self._wakeup.wait(POLL_INTERVAL)
         
         # Stop Watchdog
         if self.watchdog:
@@ -3319,23 +3477,22 @@ Answer briefly:"""
 
         self.log("Stopping all workers...")
         with self.workers_lock:
-            for worker in self.workers.values():
-                worker.stop()
-
-        for worker in self.workers.values():
-            worker.join(timeout=5)
+            workers = list(self.workers.values())
+        # Signal every worker first so they all wind down concurrently
+        for worker in workers:
+            worker.stop()
+
+        # Then wait against one shared deadline, not 5s per worker
+        deadline = time.monotonic() + WORKER_SHUTDOWN_TIMEOUT
+        for worker in workers:
+            worker.join(timeout=max(0, deadline - time.monotonic()))
         
-        try:
-            conn = self.get_db()
-            cursor = conn.cursor()
-            cursor.execute("UPDATE daemon_status SET status='stopped' WHERE id=1")
-            conn.commit()
-            cursor.close()
-            conn.close()
-        except: pass
-        
-        if os.path.exists(PID_FILE):
-            os.remove(PID_FILE)
+        self.stop_mail_worker()
+
+        self.set_daemon_status('stopped')
+        self.close_housekeeping_db()
+
+        self.remove_pid_file()
         self.log("Claude Daemon stopped")
 
 
@@ -3347,8 +3504,8 @@ if __name__ == '__main__':
     for attempt in range(max_retries):
         try:
             daemon = ClaudeDaemon()
-            signal.signal(signal.SIGTERM, lambda s, f: setattr(daemon, 'running', False))
-            signal.signal(signal.SIGINT, lambda s, f: setattr(daemon, 'running', False))
+            signal.signal(signal.SIGTERM, daemon.request_stop)
+            signal.signal(signal.SIGINT, daemon.request_stop)
             daemon.run()
             break
         except mysql.connector.Error as e:
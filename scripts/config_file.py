@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Shared helpers for the update_*_config.py scripts"""
+import json
+import os
+from functools import lru_cache
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# PATH is split once per run; every tool lookup reuses it
+PATH_DIRS = tuple(d for d in os.environ.get('PATH', os.defpath).split(os.pathsep) if d)
+
+
+def load_config(config_path, create_dir=False):
+    """Read a JSON config file; a missing file gives an empty config"""
+    try:
+        with open(config_path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        if create_dir:
+            os.makedirs(os.path.dirname(config_path), exist_ok=True)
+        return {}
+
+
+def dump_config(config):
+    """Config as indented JSON bytes (orjson when installed)"""
+    if orjson is not None:
+        return orjson.dumps(config, option=orjson.OPT_INDENT_2)
+    return json.dumps(config, indent=2).encode()
+
+
+def save_config(config_path, config):
+    """Write config as indented JSON, atomically and only if it changed.
+
+    Returns False when the file already held exactly this content.
+    """
+    data = dump_config(config)
+    try:
+        with open(config_path, 'rb') as f:
+            if f.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+
+    # Write a sibling temp file and rename it over the original, so a crash
+    # never leaves a truncated config behind
+    tmp_path = config_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, config_path)
+    return True
+
+
+@lru_cache(maxsize=None)
+def _path_index():
+    """Map file name -> candidate paths in PATH order, one scan per directory"""
+    index = {}
+    for directory in PATH_DIRS:
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    index.setdefault(entry.name, []).append(entry.path)
+        except OSError:
+            continue
+    return index
+
+
+@lru_cache(maxsize=None)
+def which(name):
+    """shutil.which() for POSIX: only the indexed candidates for name are stat'ed"""
+    for path in _path_index().get(name, ()):
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+    return None
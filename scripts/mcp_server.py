@@ -4,13 +4,26 @@ CodeHero MCP Server
 Provides tools for Claude to manage projects and tickets via the CodeHero API.
 """
 
+import asyncio
+import io
 import json
+import re
 import sys
 import os
+import threading
+import time
 import mysql.connector
-from datetime import datetime
+from mysql.connector import pooling
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
 from typing import Any, Dict, List, Optional
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Database configuration - read from system config or use defaults
 def load_db_config():
     """Load database config from system.conf or use defaults."""
@@ -44,24 +57,125 @@ def load_db_config():
 
 DB_CONFIG = load_db_config()
 
+# Everything str.isalnum() rejects (\W is Unicode-aware; _ is a word char but not alnum)
+NON_ALNUM_RE = re.compile(r'[\W_]+')
+
+DB_POOL_SIZE = 8
+_db_pool = None
+
+def get_db_pool():
+    """Shared connection pool, created on first use."""
+    global _db_pool
+    if _db_pool is None:
+        # autocommit keeps reads fresh without a per-checkout session reset;
+        # handlers that need atomicity call conn.start_transaction()
+        _db_pool = pooling.MySQLConnectionPool(
+            pool_name='codehero_mcp',
+            pool_size=DB_POOL_SIZE,
+            pool_reset_session=False,
+            autocommit=True,
+            **DB_CONFIG
+        )
+    return _db_pool
+
 def get_db_connection():
-    """Get a database connection."""
-    return mysql.connector.connect(**DB_CONFIG)
+    """Get a pooled database connection (close() returns it to the pool)."""
+    try:
+        conn = get_db_pool().get_connection()
+    except mysql.connector.errors.PoolError:
+        # Pool exhausted - fall back to a one-off connection
+        return mysql.connector.connect(autocommit=True, **DB_CONFIG)
+    if conn.in_transaction:
+        conn.rollback()  # Left open by a failed handler
+    return conn
+
+class DbConnectionSource:
+    """Pool-shaped handle for SmartContextManager.
+
+    Every tool worker may already hold a pooled connection, so connections
+    handed to it come from get_db_connection(), which falls back to a one-off
+    connection instead of raising PoolError when the pool is exhausted.
+    """
+
+    @staticmethod
+    def get_connection():
+        return get_db_connection()
+
+# (connection_id, sql) -> server-side prepared cursor, reused across pool checkouts
+_prepared_cursors = {}
+
+def execute_prepared(conn, sql: str, params: tuple) -> List[Dict[str, Any]]:
+    """Run a hot SELECT through a cached prepared statement and return dict rows.
+
+    The server parses and plans the statement once per pooled connection; later
+    calls only send the bound parameters.
+    """
+    if not isinstance(conn, pooling.PooledMySQLConnection):
+        # One-off fallback connection - not worth preparing
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            columns = cursor.column_names
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
 
-def serialize_row(row: dict) -> dict:
-    """Convert datetime objects to ISO format strings for JSON serialization."""
-    from datetime import datetime, date
-    if row is None:
-        return None
-    result = {}
-    for key, value in row.items():
-        if isinstance(value, datetime):
-            result[key] = value.isoformat()
-        elif isinstance(value, date):
-            result[key] = value.isoformat()
-        else:
-            result[key] = value
-    return result
+    key = (conn.connection_id, sql)
+    cursor = _prepared_cursors.get(key)
+    if cursor is None:
+        cursor = conn.cursor(prepared=True)
+        _prepared_cursors[key] = cursor
+    try:
+        cursor.execute(sql, params)
+        columns = cursor.column_names
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    except mysql.connector.Error:
+        _prepared_cursors.pop(key, None)
+        raise
+
+def _json_default(obj):
+    """Fallback encoder for types neither orjson nor json handle natively."""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (bytes, bytearray)):
+        return obj.decode('utf-8', errors='replace')
+    if isinstance(obj, set):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def to_json(obj) -> str:
+    """Compact JSON text for tool results (datetimes become ISO strings)."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_json_default, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj, default=_json_default)
+
+# Short-lived cache for read-mostly tool results: (handler, args JSON) -> (expires_at, result)
+RESPONSE_CACHE_TTL = 5
+_response_cache = {}
+_response_cache_lock = threading.Lock()
+
+def ttl_cached(fn):
+    """Cache a tool handler's result for RESPONSE_CACHE_TTL seconds per distinct args."""
+    def wrapper(args: Dict[str, Any]) -> Dict[str, Any]:
+        key = (fn.__name__, json.dumps(args, sort_keys=True, default=str))
+        now = time.monotonic()
+        with _response_cache_lock:
+            hit = _response_cache.get(key)
+        if hit and hit[0] > now:
+            return hit[1]
+        result = fn(args)
+        with _response_cache_lock:
+            _response_cache[key] = (now + RESPONSE_CACHE_TTL, result)
+        return result
+    wrapper.__name__ = fn.__name__
+    wrapper.__doc__ = fn.__doc__
+    return wrapper
+
+def clear_response_cache():
+    with _response_cache_lock:
+        _response_cache.clear()
 
 def log_error(msg: str):
     """Log error to stderr."""
@@ -88,7 +202,11 @@ TOOLS = [
                 },
                 "limit": {
                     "type": "integer",
-                    "description": "Maximum number of projects to return. Default: 20"
+                    "description": "Maximum number of projects to return (1-200). Default: 20"
+                },
+                "cursor": {
+                    "type": "string",
+                    "description": "Pagination cursor: pass next_cursor from the previous response to get the next page"
                 }
             },
             "required": []
@@ -177,7 +295,11 @@ TOOLS = [
                 },
                 "limit": {
                     "type": "integer",
-                    "description": "Maximum number of tickets to return. Default: 20"
+                    "description": "Maximum number of tickets to return (1-200). Default: 20"
+                },
+                "cursor": {
+                    "type": "string",
+                    "description": "Pagination cursor: pass next_cursor from the previous response to get the next page"
                 }
             },
             "required": ["project_id"]
@@ -618,7 +740,7 @@ def handle_get_context_defaults(args: Dict[str, Any]) -> Dict[str, Any]:
         "content": [
             {
                 "type": "text",
-                "text": json.dumps(result, indent=2)
+                "text": to_json(result)
             }
         ]
     }
@@ -631,6 +753,7 @@ def handle_reload(args: Dict[str, Any]) -> Dict[str, Any]:
     # Send response first, then exit
     # Claude Code will restart the MCP server automatically
     def delayed_exit():
+        flush_output()  # Don't lose buffered responses
         os._exit(0)
 
     import threading
@@ -638,56 +761,103 @@ def handle_reload(args: Dict[str, Any]) -> Dict[str, Any]:
 
     return {"content": [{"type": "text", "text": "MCP server reloading... Next call will use updated code."}]}
 
+MAX_LIST_LIMIT = 200
+
+def clamp_limit(value, default: int = 20) -> int:
+    """Bound a caller-supplied LIMIT to 1..MAX_LIST_LIMIT (bad values get the default)."""
+    try:
+        limit = int(value) if value is not None else default
+    except (TypeError, ValueError):
+        limit = default
+    return min(max(limit, 1), MAX_LIST_LIMIT)
+
+def parse_page_cursor(value: Optional[str]):
+    """Decode a list cursor ("<created_at ISO>|<id>") into (datetime, id); None if absent."""
+    if not value:
+        return None
+    created_at, _, row_id = str(value).rpartition('|')
+    return datetime.fromisoformat(created_at), int(row_id)
+
+def next_page_cursor(rows: List[Dict[str, Any]], limit) -> Optional[str]:
+    """Cursor for the page after `rows`, or None when this was the last page."""
+    if not rows or len(rows) < int(limit):
+        return None
+    last = rows[-1]
+    return f"{last['created_at'].isoformat()}|{last['id']}"
+
+# Columns returned by get_project / get_ticket. Large context blobs, permission
+# JSON and secrets (db_password, secure_key) are left out of the responses.
+PROJECT_DETAIL_COLUMNS = """
+    id, name, code, description, project_type, tech_stack, status,
+    web_path, app_path, reference_path, preview_url, ai_model, default_execution_mode,
+    db_name, db_user, db_host, git_enabled, total_tokens, total_duration_seconds,
+    created_at, updated_at
+"""
+TICKET_DETAIL_COLUMNS = """
+    t.id, t.project_id, t.ticket_number, t.title, t.description, t.status, t.priority,
+    t.ticket_type, t.sequence_order, t.parent_ticket_id, t.execution_mode, t.ai_model,
+    t.deps_include_awaiting, t.awaiting_reason, t.retry_count, t.result_summary,
+    t.review_deadline, t.total_tokens, t.total_duration_seconds,
+    t.created_at, t.updated_at, t.closed_at, t.closed_by, t.close_reason
+"""
+
+@ttl_cached
 def handle_list_projects(args: Dict[str, Any]) -> Dict[str, Any]:
     """List all projects."""
     status = args.get('status', 'active')
-    limit = args.get('limit', 20)
+    limit = clamp_limit(args.get('limit'))
+    try:
+        after = parse_page_cursor(args.get('cursor'))
+    except ValueError:
+        return {"content": [{"type": "text", "text": "Error: invalid cursor"}]}
+
+    conditions = []
+    params = []
+    if status != 'all':
+        conditions.append("p.status = %s")
+        params.append(status)
+    if after:
+        conditions.append("(p.created_at < %s OR (p.created_at = %s AND p.id < %s))")
+        params.extend((after[0], after[0], after[1]))
+    params.append(limit)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
 
     conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
 
     try:
-        if status == 'all':
-            query = """
-                SELECT id, name, description, project_type, tech_stack, status,
-                       created_at, code,
-                       (SELECT COUNT(*) FROM tickets WHERE project_id = projects.id) as ticket_count,
-                       (SELECT COUNT(*) FROM tickets WHERE project_id = projects.id AND status IN ('open', 'in_progress')) as open_tickets
-                FROM projects
-                ORDER BY created_at DESC
-                LIMIT %s
-            """
-            cursor.execute(query, (limit,))
-        else:
-            query = """
-                SELECT id, name, description, project_type, tech_stack, status,
-                       created_at, code,
-                       (SELECT COUNT(*) FROM tickets WHERE project_id = projects.id) as ticket_count,
-                       (SELECT COUNT(*) FROM tickets WHERE project_id = projects.id AND status IN ('open', 'in_progress')) as open_tickets
-                FROM projects
-                WHERE status = %s
-                ORDER BY created_at DESC
-                LIMIT %s
-            """
-            cursor.execute(query, (status, limit))
-
-        projects = cursor.fetchall()
-
-        # Convert datetime to string
-        for p in projects:
-            if p.get('created_at'):
-                p['created_at'] = p['created_at'].isoformat()
+        # Ticket counts come from one grouped pass over tickets(project_id, status)
+        # instead of two correlated subqueries per project row
+        query = f"""
+            SELECT p.id, p.name, p.description, p.project_type, p.tech_stack, p.status,
+                   p.created_at, p.code,
+                   COALESCE(tc.total, 0) as ticket_count,
+                   COALESCE(tc.open_cnt, 0) as open_tickets
+            FROM projects p
+            LEFT JOIN (
+                SELECT project_id, COUNT(*) as total,
+                       COUNT(CASE WHEN status IN ('open', 'in_progress') THEN 1 END) as open_cnt
+                FROM tickets
+                GROUP BY project_id
+            ) tc ON tc.project_id = p.id
+            {where}
+            ORDER BY p.created_at DESC, p.id DESC
+            LIMIT %s
+        """
+        projects = execute_prepared(conn, query, tuple(params))
 
         return {
             "content": [
                 {
                     "type": "text",
-                    "text": json.dumps({"projects": projects, "count": len(projects)}, indent=2)
+                    "text": to_json({
+                        "projects": projects,
+                        "count": len(projects),
+                        "next_cursor": next_page_cursor(projects, limit)
+                    })
                 }
             ]
         }
     finally:
-        cursor.close()
         conn.close()
 
 def handle_get_project(args: Dict[str, Any]) -> Dict[str, Any]:
@@ -703,9 +873,9 @@ def handle_get_project(args: Dict[str, Any]) -> Dict[str, Any]:
 
     try:
         if project_id:
-            cursor.execute("SELECT * FROM projects WHERE id = %s", (project_id,))
+            cursor.execute(f"SELECT {PROJECT_DETAIL_COLUMNS} FROM projects WHERE id = %s", (project_id,))
         else:
-            cursor.execute("SELECT * FROM projects WHERE name = %s", (project_name,))
+            cursor.execute(f"SELECT {PROJECT_DETAIL_COLUMNS} FROM projects WHERE name = %s", (project_name,))
 
         project = cursor.fetchone()
 
@@ -722,16 +892,12 @@ def handle_get_project(args: Dict[str, Any]) -> Dict[str, Any]:
         """, (project['id'],))
         tickets = cursor.fetchall()
 
-        # Serialize all rows (converts datetime to ISO format)
-        project = serialize_row(project)
-        tickets = [serialize_row(t) for t in tickets]
-
         result = {
             "project": project,
             "recent_tickets": tickets
         }
 
-        return {"content": [{"type": "text", "text": json.dumps(result, indent=2)}]}
+        return {"content": [{"type": "text", "text": to_json(result)}]}
     finally:
         cursor.close()
         conn.close()
@@ -794,7 +960,7 @@ def handle_create_project(args: Dict[str, Any]) -> Dict[str, Any]:
                     pass
 
     # Generate code from name (up to 8 characters)
-    original_code = ''.join(c.upper() for c in name if c.isalnum())[:8]
+    original_code = NON_ALNUM_RE.sub('', name).upper()[:8]
     if not original_code:
         original_code = 'PROJ'
     code = original_code
@@ -804,20 +970,27 @@ def handle_create_project(args: Dict[str, Any]) -> Dict[str, Any]:
     cursor = conn.cursor(dictionary=True)
 
     try:
+        # One lookup covers the name check, the code and all its numbered variants
+        suffix_base = original_code[:5]
+        # name_hit repeats the WHERE comparison, so it follows the column collation
+        # (case-insensitive, trailing spaces ignored) like the old name lookup
+        cursor.execute("""
+            SELECT name = %s AS name_hit, code FROM projects
+            WHERE name = %s OR code = %s OR code LIKE %s
+        """, (name, name, code, f"{suffix_base}%"))
+        rows = cursor.fetchall()
+
         # Check if project name exists
-        cursor.execute("SELECT id FROM projects WHERE name = %s", (name,))
-        if cursor.fetchone():
+        if any(row['name_hit'] for row in rows):
             return {"content": [{"type": "text", "text": f"Error: Project '{name}' already exists"}]}
 
         # Check code uniqueness and modify if needed
-        cursor.execute("SELECT id, name FROM projects WHERE code = %s", (code,))
-        existing = cursor.fetchone()
-        if existing:
+        taken = {row['code'] for row in rows}
+        if code in taken:
             # Add number to make unique
             for i in range(1, 100):
-                new_code = f"{original_code[:5]}{i}"
-                cursor.execute("SELECT code FROM projects WHERE code = %s", (new_code,))
-                if not cursor.fetchone():
+                new_code = f"{suffix_base}{i}"
+                if new_code not in taken:
                     code = new_code
                     code_was_changed = True
                     break
@@ -892,13 +1065,16 @@ def handle_create_project(args: Dict[str, Any]) -> Dict[str, Any]:
         # Generate secure key for project URL authentication
         secure_key = secrets.token_urlsafe(24)[:32]
 
-        # Insert project
-        cursor.execute("""
-            INSERT INTO projects (name, description, project_type, tech_stack, web_path, app_path, code, status,
-                                  db_name, db_user, db_password, db_host, ai_model, secure_key, global_context, project_context)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, 'active', %s, %s, %s, %s, %s, %s, %s, %s)
-        """, (name, description, project_type, tech_stack, web_path, app_path, code,
-              db_name, db_user, db_password, db_host, ai_model, secure_key, global_context, project_context))
+        # Insert project (UNIQUE(code) catches a concurrent create that took the same code)
+        try:
+            cursor.execute("""
+                INSERT INTO projects (name, description, project_type, tech_stack, web_path, app_path, code, status,
+                                      db_name, db_user, db_password, db_host, ai_model, secure_key, global_context, project_context)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, 'active', %s, %s, %s, %s, %s, %s, %s, %s)
+            """, (name, description, project_type, tech_stack, web_path, app_path, code,
+                  db_name, db_user, db_password, db_host, ai_model, secure_key, global_context, project_context))
+        except mysql.connector.IntegrityError:
+            return {"content": [{"type": "text", "text": f"Error: Project code '{code}' was taken by another project, please retry"}]}
 
         conn.commit()
         project_id = cursor.lastrowid
@@ -926,7 +1102,7 @@ def handle_create_project(args: Dict[str, Any]) -> Dict[str, Any]:
             "message": msg
         }
 
-        return {"content": [{"type": "text", "text": json.dumps(result, indent=2)}]}
+        return {"content": [{"type": "text", "text": to_json(result)}]}
     except Exception as e:
         return {"content": [{"type": "text", "text": f"Error creating project: {str(e)}"}]}
     finally:
@@ -940,40 +1116,39 @@ def handle_list_tickets(args: Dict[str, Any]) -> Dict[str, Any]:
         return {"content": [{"type": "text", "text": "Error: project_id is required"}]}
 
     status = args.get('status', 'all')
-    limit = args.get('limit', 20)
+    limit = clamp_limit(args.get('limit'))
+    try:
+        after = parse_page_cursor(args.get('cursor'))
+    except ValueError:
+        return {"content": [{"type": "text", "text": "Error: invalid cursor"}]}
+
+    conditions = ["project_id = %s"]
+    params = [project_id]
+    if status != 'all':
+        conditions.append("status = %s")
+        params.append(status)
+    if after:
+        conditions.append("(created_at < %s OR (created_at = %s AND id < %s))")
+        params.extend((after[0], after[0], after[1]))
+    params.append(limit)
 
     conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
 
     try:
-        if status == 'all':
-            cursor.execute("""
-                SELECT id, ticket_number, title, status, priority, created_at, updated_at
-                FROM tickets
-                WHERE project_id = %s
-                ORDER BY created_at DESC
-                LIMIT %s
-            """, (project_id, limit))
-        else:
-            cursor.execute("""
-                SELECT id, ticket_number, title, status, priority, created_at, updated_at
-                FROM tickets
-                WHERE project_id = %s AND status = %s
-                ORDER BY created_at DESC
-                LIMIT %s
-            """, (project_id, status, limit))
-
-        tickets = cursor.fetchall()
-
-        for t in tickets:
-            if t.get('created_at'):
-                t['created_at'] = t['created_at'].isoformat()
-            if t.get('updated_at'):
-                t['updated_at'] = t['updated_at'].isoformat()
-
-        return {"content": [{"type": "text", "text": json.dumps({"tickets": tickets, "count": len(tickets)}, indent=2)}]}
+        tickets = execute_prepared(conn, f"""
+            SELECT id, ticket_number, title, status, priority, created_at, updated_at
+            FROM tickets
+            WHERE {' AND '.join(conditions)}
+            ORDER BY created_at DESC, id DESC
+            LIMIT %s
+        """, tuple(params))
+
+        return {"content": [{"type": "text", "text": to_json({
+            "tickets": tickets,
+            "count": len(tickets),
+            "next_cursor": next_page_cursor(tickets, limit)
+        })}]}
     finally:
-        cursor.close()
         conn.close()
 
 def handle_get_ticket(args: Dict[str, Any]) -> Dict[str, Any]:
@@ -985,25 +1160,26 @@ def handle_get_ticket(args: Dict[str, Any]) -> Dict[str, Any]:
         return {"content": [{"type": "text", "text": "Error: Either ticket_id or ticket_number is required"}]}
 
     conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
+    # Plain tuple cursor: the conversation can be long, so skip per-row dict building
+    cursor = conn.cursor()
 
     try:
         if ticket_id:
-            cursor.execute("""
-                SELECT t.*, p.name as project_name, p.code
+            rows = execute_prepared(conn, f"""
+                SELECT {TICKET_DETAIL_COLUMNS}, p.name as project_name, p.code
                 FROM tickets t
                 JOIN projects p ON t.project_id = p.id
                 WHERE t.id = %s
             """, (ticket_id,))
         else:
-            cursor.execute("""
-                SELECT t.*, p.name as project_name, p.code
+            rows = execute_prepared(conn, f"""
+                SELECT {TICKET_DETAIL_COLUMNS}, p.name as project_name, p.code
                 FROM tickets t
                 JOIN projects p ON t.project_id = p.id
                 WHERE t.ticket_number = %s
             """, (ticket_number,))
 
-        ticket = cursor.fetchone()
+        ticket = rows[0] if rows else None
 
         if not ticket:
             return {"content": [{"type": "text", "text": "Error: Ticket not found"}]}
@@ -1015,22 +1191,71 @@ def handle_get_ticket(args: Dict[str, Any]) -> Dict[str, Any]:
             WHERE ticket_id = %s
             ORDER BY created_at ASC
         """, (ticket['id'],))
-        messages = cursor.fetchall()
-
-        # Convert all datetime fields
-        ticket = serialize_row(ticket)
-        messages = [serialize_row(m) for m in messages]
+        messages = [
+            {"role": role, "content": content, "created_at": created_at}
+            for role, content, created_at in cursor.fetchall()
+        ]
 
         result = {
             "ticket": ticket,
             "conversation": messages
         }
 
-        return {"content": [{"type": "text", "text": json.dumps(result, indent=2)}]}
+        return {"content": [{"type": "text", "text": to_json(result)}]}
     finally:
         cursor.close()
         conn.close()
 
+def _last_insert_id(cursor) -> int:
+    """Value set by LAST_INSERT_ID(expr) in the statement just run"""
+    if cursor.lastrowid:
+        return cursor.lastrowid
+    cursor.execute("SELECT LAST_INSERT_ID() as num")
+    return cursor.fetchone()['num']
+
+def _max_ticket_number(cursor, project_id: int) -> int:
+    """Highest number used by the project's tickets (PROJ-0007 -> 7); plain read, no locks"""
+    cursor.execute("""
+        SELECT COALESCE(MAX(CAST(SUBSTRING_INDEX(ticket_number, '-', -1) AS UNSIGNED)), 0) as num
+        FROM tickets WHERE project_id = %s
+    """, (project_id,))
+    return cursor.fetchone()['num']
+
+def allocate_ticket_number(cursor, project_id: int, code: str, count: int = 1) -> int:
+    """Atomically reserve the next `count` ticket numbers for a project.
+
+    Returns the first reserved number; the block is consecutive. Only the
+    counter row is touched (and locked until commit), bumped with
+    LAST_INSERT_ID(expr) so the new value comes back in the same round-trip.
+    The tickets table is scanned only to seed a missing counter row, or to
+    skip ahead when numbers were taken elsewhere (e.g. the web panel).
+    """
+    cursor.execute("""
+        INSERT INTO project_ticket_counters (project_id, last_num)
+        VALUES (%s, LAST_INSERT_ID(%s))
+        ON DUPLICATE KEY UPDATE last_num = LAST_INSERT_ID(last_num + %s)
+    """, (project_id, count, count))
+    seed = cursor.rowcount == 1  # New row: the project has no counter yet
+    last_num = _last_insert_id(cursor)
+
+    if not seed:
+        # Point lookups on the unique ticket_number key
+        numbers = [f"{code}-{num:04d}" for num in range(last_num - count + 1, last_num + 1)]
+        cursor.execute(f"""
+            SELECT 1 FROM tickets WHERE ticket_number IN ({','.join(['%s'] * count)}) LIMIT 1
+        """, numbers)
+        seed = cursor.fetchone() is not None
+
+    if seed:
+        cursor.execute("""
+            UPDATE project_ticket_counters
+            SET last_num = LAST_INSERT_ID(GREATEST(last_num, %s + %s))
+            WHERE project_id = %s
+        """, (_max_ticket_number(cursor, project_id), count, project_id))
+        last_num = _last_insert_id(cursor)
+
+    return last_num - count + 1
+
 def handle_create_ticket(args: Dict[str, Any]) -> Dict[str, Any]:
     """Create a new ticket with optional type, sequence, and dependencies."""
     project_id = args.get('project_id')
@@ -1073,23 +1298,9 @@ def handle_create_ticket(args: Dict[str, Any]) -> Dict[str, Any]:
 
         code = project['code']
 
-        # Get next ticket number
-        cursor.execute("""
-            SELECT ticket_number FROM tickets
-            WHERE project_id = %s
-            ORDER BY id DESC LIMIT 1
-        """, (project_id,))
-        last_ticket = cursor.fetchone()
-
-        if last_ticket:
-            # Extract number from ticket_number like "PROJ-0001"
-            try:
-                last_num = int(last_ticket['ticket_number'].split('-')[1])
-                next_num = last_num + 1
-            except:
-                next_num = 1
-        else:
-            next_num = 1
+        # Counter row stays locked until commit, so concurrent creates can't share a number
+        conn.start_transaction()
+        next_num = allocate_ticket_number(cursor, project_id, code)
 
         ticket_number = f"{code}-{next_num:04d}"
         status = 'open' if auto_start else 'open'
@@ -1101,7 +1312,6 @@ def handle_create_ticket(args: Dict[str, Any]) -> Dict[str, Any]:
         """, (project_id, ticket_number, title, description, status, priority,
               ticket_type, sequence_order, parent_ticket_id, execution_mode, deps_include_awaiting, ai_model))
 
-        conn.commit()
         ticket_id = cursor.lastrowid
 
         # Handle dependencies
@@ -1115,7 +1325,6 @@ def handle_create_ticket(args: Dict[str, Any]) -> Dict[str, Any]:
                         INSERT IGNORE INTO ticket_dependencies (ticket_id, depends_on_ticket_id)
                         VALUES (%s, %s)
                     """, (ticket_id, dep_ticket['id']))
-            conn.commit()
 
         # Add initial message if description provided
         if description:
@@ -1123,7 +1332,9 @@ def handle_create_ticket(args: Dict[str, Any]) -> Dict[str, Any]:
                 INSERT INTO conversation_messages (ticket_id, role, content)
                 VALUES (%s, 'user', %s)
             """, (ticket_id, description))
-            conn.commit()
+
+        # Ticket, dependencies and initial message land together
+        conn.commit()
 
         result = {
             "success": True,
@@ -1137,8 +1348,10 @@ def handle_create_ticket(args: Dict[str, Any]) -> Dict[str, Any]:
             "message": f"Ticket {ticket_number} created successfully"
         }
 
-        return {"content": [{"type": "text", "text": json.dumps(result, indent=2)}]}
+        return {"content": [{"type": "text", "text": to_json(result)}]}
     except Exception as e:
+        if conn.in_transaction:
+            conn.rollback()
         return {"content": [{"type": "text", "text": f"Error creating ticket: {str(e)}"}]}
     finally:
         cursor.close()
@@ -1153,18 +1366,16 @@ def handle_update_ticket(args: Dict[str, Any]) -> Dict[str, Any]:
     conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
 
-    try:
-        # Check ticket exists
-        cursor.execute("SELECT id, ticket_number FROM tickets WHERE id = %s", (ticket_id,))
-        ticket = cursor.fetchone()
-
-        if not ticket:
-            return {"content": [{"type": "text", "text": f"Error: Ticket ID {ticket_id} not found"}]}
+    reply = args.get('reply')
 
+    try:
         updates = []
         params = []
 
-        if 'status' in args:
+        if reply:
+            # A reply hands the ticket back to the daemon, so it always reopens
+            updates.append("status = 'open'")
+        elif 'status' in args:
             updates.append("status = %s")
             params.append(args['status'])
 
@@ -1178,19 +1389,26 @@ def handle_update_ticket(args: Dict[str, Any]) -> Dict[str, Any]:
                 updates.append("ai_model = %s")
                 params.append(ai_model)
 
+        conn.start_transaction()
+
         if updates:
             updates.append("updated_at = NOW()")
             params.append(ticket_id)
             cursor.execute(f"UPDATE tickets SET {', '.join(updates)} WHERE id = %s", params)
 
-        # Add reply if provided
-        if 'reply' in args and args['reply']:
+        # rowcount counts changed rows (the pool has no FOUND_ROWS flag), so an
+        # unchanged ticket would look missing - existence is checked here instead
+        cursor.execute("SELECT ticket_number FROM tickets WHERE id = %s", (ticket_id,))
+        ticket = cursor.fetchone()
+        if not ticket:
+            conn.rollback()
+            return {"content": [{"type": "text", "text": f"Error: Ticket ID {ticket_id} not found"}]}
+
+        if reply:
             cursor.execute("""
                 INSERT INTO conversation_messages (ticket_id, role, content)
                 VALUES (%s, 'user', %s)
-            """, (ticket_id, args['reply']))
-            # Set ticket to open so daemon picks it up
-            cursor.execute("UPDATE tickets SET status = 'open', updated_at = NOW() WHERE id = %s", (ticket_id,))
+            """, (ticket_id, reply))
 
         conn.commit()
 
@@ -1201,8 +1419,10 @@ def handle_update_ticket(args: Dict[str, Any]) -> Dict[str, Any]:
             "message": f"Ticket {ticket['ticket_number']} updated successfully"
         }
 
-        return {"content": [{"type": "text", "text": json.dumps(result, indent=2)}]}
+        return {"content": [{"type": "text", "text": to_json(result)}]}
     except Exception as e:
+        if conn.in_transaction:
+            conn.rollback()
         return {"content": [{"type": "text", "text": f"Error updating ticket: {str(e)}"}]}
     finally:
         cursor.close()
@@ -1286,32 +1506,41 @@ def handle_kill_switch(args: Dict[str, Any]) -> Dict[str, Any]:
             "message": f"Kill switch activated for {ticket['ticket_number']}. Process {'stopped' if killed else 'stopping'}."
         }
 
-        return {"content": [{"type": "text", "text": json.dumps(result, indent=2)}]}
+        return {"content": [{"type": "text", "text": to_json(result)}]}
     except Exception as e:
         return {"content": [{"type": "text", "text": f"Error: {str(e)}"}]}
     finally:
         cursor.close()
         conn.close()
 
+# tickets.status enum values
+TICKET_STATUSES = ('new', 'open', 'pending', 'in_progress', 'awaiting_input',
+                   'done', 'failed', 'stuck', 'skipped', 'timeout')
+DASHBOARD_STATUS_COUNTS = ',\n'.join(
+    f"COUNT(CASE WHEN status = '{s}' THEN 1 END) as `{s}`" for s in TICKET_STATUSES
+)
+
+@ttl_cached
 def handle_dashboard_stats(args: Dict[str, Any]) -> Dict[str, Any]:
     """Get dashboard statistics."""
     conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
 
     try:
-        # Project counts
-        cursor.execute("SELECT COUNT(*) as total FROM projects")
-        total_projects = cursor.fetchone()['total']
-
-        cursor.execute("SELECT COUNT(*) as active FROM projects WHERE status = 'active'")
-        active_projects = cursor.fetchone()['active']
-
-        # Ticket counts
-        cursor.execute("SELECT COUNT(*) as total FROM tickets")
-        total_tickets = cursor.fetchone()['total']
-
-        cursor.execute("SELECT status, COUNT(*) as count FROM tickets GROUP BY status")
-        ticket_stats = {row['status']: row['count'] for row in cursor.fetchall()}
+        # Project totals, ticket total and per-status counts in one fixed-width row
+        cursor.execute(f"""
+            SELECT (SELECT COUNT(*) FROM projects) as total_projects,
+                   (SELECT COUNT(*) FROM projects WHERE status = 'active') as active_projects,
+                   COUNT(*) as total_tickets,
+                   {DASHBOARD_STATUS_COUNTS}
+            FROM tickets
+        """)
+        totals = cursor.fetchone()
+        total_projects = totals['total_projects']
+        active_projects = totals['active_projects']
+        total_tickets = totals['total_tickets']
+        # Only statuses that occur, as the GROUP BY version returned
+        ticket_stats = {s: totals[s] for s in TICKET_STATUSES if totals[s]}
 
         # Recent activity
         cursor.execute("""
@@ -1323,10 +1552,6 @@ def handle_dashboard_stats(args: Dict[str, Any]) -> Dict[str, Any]:
         """)
         recent = cursor.fetchall()
 
-        for r in recent:
-            if r.get('updated_at'):
-                r['updated_at'] = r['updated_at'].isoformat()
-
         result = {
             "projects": {
                 "total": total_projects,
@@ -1339,7 +1564,7 @@ def handle_dashboard_stats(args: Dict[str, Any]) -> Dict[str, Any]:
             "recent_activity": recent
         }
 
-        return {"content": [{"type": "text", "text": json.dumps(result, indent=2)}]}
+        return {"content": [{"type": "text", "text": to_json(result)}]}
     finally:
         cursor.close()
         conn.close()
@@ -1379,7 +1604,7 @@ def handle_delete_ticket(args: Dict[str, Any]) -> Dict[str, Any]:
             "ticket_number": ticket_number,
             "message": f"Ticket {ticket_number} deleted successfully"
         }
-        return {"content": [{"type": "text", "text": json.dumps(result, indent=2)}]}
+        return {"content": [{"type": "text", "text": to_json(result)}]}
     except Exception as e:
         return {"content": [{"type": "text", "text": f"Error: {str(e)}"}]}
     finally:
@@ -1415,21 +1640,13 @@ def handle_bulk_create_tickets(args: Dict[str, Any]) -> Dict[str, Any]:
 
         code = project['code']
 
-        # Get current max ticket number
-        cursor.execute("""
-            SELECT ticket_number FROM tickets
-            WHERE project_id = %s
-            ORDER BY id DESC LIMIT 1
-        """, (project_id,))
-        last_ticket = cursor.fetchone()
+        # All tickets are created (or rolled back) together
+        conn.start_transaction()
 
-        if last_ticket:
-            try:
-                next_num = int(last_ticket['ticket_number'].split('-')[1]) + 1
-            except:
-                next_num = 1
-        else:
-            next_num = 1
+        # Reserve one consecutive block of numbers for every ticket that will be
+        # inserted; the counter row stays locked until commit
+        ticket_count = sum(1 for t in tickets_data if t.get('title', '').strip())
+        next_num = allocate_ticket_number(cursor, project_id, code, ticket_count) if ticket_count else 1
 
         created_tickets = []
         ticket_id_map = {}  # Map sequence position to ticket_id for dependencies
@@ -1516,11 +1733,11 @@ def handle_bulk_create_tickets(args: Dict[str, Any]) -> Dict[str, Any]:
         # If there are warnings (e.g., self-dependencies), rollback and return error
         if warnings:
             conn.rollback()
-            return {"content": [{"type": "text", "text": json.dumps({
+            return {"content": [{"type": "text", "text": to_json({
                 "success": False,
                 "errors": warnings,
                 "message": "Dependency errors detected. No tickets were created. Please fix the depends_on values and try again."
-            }, indent=2)}]}
+            })}]}
 
         conn.commit()
 
@@ -1532,8 +1749,10 @@ def handle_bulk_create_tickets(args: Dict[str, Any]) -> Dict[str, Any]:
             "deps_include_awaiting": deps_include_awaiting,
             "message": f"Created {len(created_tickets)} tickets successfully (mode: {execution_mode or 'project_default'}, relaxed: {deps_include_awaiting})"
         }
-        return {"content": [{"type": "text", "text": json.dumps(result, indent=2)}]}
+        return {"content": [{"type": "text", "text": to_json(result)}]}
     except Exception as e:
+        if conn.in_transaction:
+            conn.rollback()
         return {"content": [{"type": "text", "text": f"Error: {str(e)}"}]}
     finally:
         cursor.close()
@@ -1666,7 +1885,7 @@ def handle_get_project_progress(args: Dict[str, Any]) -> Dict[str, Any]:
             "tickets": tickets_list
         }
 
-        return {"content": [{"type": "text", "text": json.dumps(result, indent=2)}]}
+        return {"content": [{"type": "text", "text": to_json(result)}]}
     except Exception as e:
         return {"content": [{"type": "text", "text": f"Error: {str(e)}"}]}
     finally:
@@ -1709,7 +1928,7 @@ def handle_retry_ticket(args: Dict[str, Any]) -> Dict[str, Any]:
             "ticket_number": ticket['ticket_number'],
             "message": f"Ticket {ticket['ticket_number']} reset for retry"
         }
-        return {"content": [{"type": "text", "text": json.dumps(result, indent=2)}]}
+        return {"content": [{"type": "text", "text": to_json(result)}]}
     except Exception as e:
         return {"content": [{"type": "text", "text": f"Error: {str(e)}"}]}
     finally:
@@ -1762,7 +1981,7 @@ def handle_set_ticket_sequence(args: Dict[str, Any]) -> Dict[str, Any]:
             "is_forced": is_forced,
             "message": f"Ticket {ticket['ticket_number']} updated"
         }
-        return {"content": [{"type": "text", "text": json.dumps(result, indent=2)}]}
+        return {"content": [{"type": "text", "text": to_json(result)}]}
     except Exception as e:
         return {"content": [{"type": "text", "text": f"Error: {str(e)}"}]}
     finally:
@@ -1838,7 +2057,7 @@ def handle_start_ticket(args: Dict[str, Any]) -> Dict[str, Any]:
             "is_subticket": is_subticket,
             "message": msg
         }
-        return {"content": [{"type": "text", "text": json.dumps(result, indent=2)}]}
+        return {"content": [{"type": "text", "text": to_json(result)}]}
     except Exception as e:
         return {"content": [{"type": "text", "text": f"Error: {str(e)}"}]}
     finally:
@@ -2017,7 +2236,7 @@ def handle_import_project(args: Dict[str, Any]) -> Dict[str, Any]:
                 "message": f"Project imported successfully to {dest_path}. Use codehero_analyze_project to build the project map."
             }
 
-            return {"content": [{"type": "text", "text": json.dumps(result_data, indent=2)}]}
+            return {"content": [{"type": "text", "text": to_json(result_data)}]}
 
         finally:
             # Cleanup temp directory
@@ -2077,28 +2296,20 @@ def handle_analyze_project(args: Dict[str, Any]) -> Dict[str, Any]:
             """, (project_id,))
             existing_map = cursor.fetchone()
             if existing_map:
-                return {"content": [{"type": "text", "text": json.dumps({
+                return {"content": [{"type": "text", "text": to_json({
                     "success": True,
                     "project_id": project_id,
                     "message": "Project map already exists and is valid. Use force=true to re-analyze.",
                     "generated_at": existing_map['generated_at'].isoformat() if existing_map['generated_at'] else None
-                }, indent=2)}]}
+                })}]}
 
         # Import smart_context and run analysis
         import sys
         sys.path.insert(0, '/opt/codehero/scripts')
         try:
-            from smart_context import SmartContextManager
-            import mysql.connector.pooling
-
-            # Create a simple pool for the context manager
-            pool = mysql.connector.pooling.MySQLConnectionPool(
-                pool_name="analysis_pool",
-                pool_size=1,
-                **DB_CONFIG
-            )
+            from smart_context import SmartContextManager, summarize_tree
 
-            scm = SmartContextManager(pool)
+            scm = SmartContextManager(DbConnectionSource())
 
             # Collect all paths to analyze (web_path, app_path, reference_path)
             def has_content(path):
@@ -2144,23 +2355,20 @@ def handle_analyze_project(args: Dict[str, Any]) -> Dict[str, Any]:
 
                 for i, path in enumerate(paths_to_analyze):
                     label = path_labels[i]
-                    # Get stats for this path
-                    file_count, size_kb = scm._get_project_stats(path)
+                    # Tree, stats, extensions and entry points in one walk
+                    tree, file_count, size_kb, ext_histogram, entries = scm._scan_project(path)
                     combined_files += file_count
                     combined_size += size_kb
 
-                    # Get tree output
-                    tree = scm._get_tree_output(path)
                     if tree:
                         combined_tree.append(f"=== {label.upper()} ({path}) ===\n{tree}")
 
                     # Detect language
-                    lang = scm._detect_language(path)
+                    lang = scm._detect_language(ext_histogram)
                     if lang and lang != 'unknown':
                         languages[lang] = languages.get(lang, 0) + file_count
 
                     # Detect entry points
-                    entries = scm._detect_entry_points(path)
                     for ep in entries:
                         all_entry_points.append(f"[{label}] {ep}")
 
@@ -2189,7 +2397,7 @@ def handle_analyze_project(args: Dict[str, Any]) -> Dict[str, Any]:
                     expires_at = VALUES(expires_at)
                 """, (
                     project_id,
-                    '\n\n'.join(combined_tree)[:5000],
+                    summarize_tree('\n\n'.join(combined_tree)),
                     json.dumps(all_entry_points),
                     json.dumps([]),
                     json.dumps(list(all_tech_stack)),
@@ -2224,7 +2432,7 @@ def handle_analyze_project(args: Dict[str, Any]) -> Dict[str, Any]:
                         except:
                             pass
 
-                return {"content": [{"type": "text", "text": json.dumps({
+                return {"content": [{"type": "text", "text": to_json({
                     "success": True,
                     "project_id": project_id,
                     "project_name": project['name'],
@@ -2235,7 +2443,7 @@ def handle_analyze_project(args: Dict[str, Any]) -> Dict[str, Any]:
                     "tech_stack": tech_stack,
                     "entry_points": entry_points,
                     "message": "Project analyzed successfully. Map is now available for AI tickets."
-                }, indent=2)}]}
+                })}]}
             else:
                 return {"content": [{"type": "text", "text": "Error: Analysis returned no result"}]}
 
@@ -2290,11 +2498,11 @@ def handle_import_from_backup(args: Dict[str, Any]) -> Dict[str, Any]:
                 result = json.loads(resp.read().decode('utf-8'))
 
             if result.get('success'):
-                return {"content": [{"type": "text", "text": json.dumps({
+                return {"content": [{"type": "text", "text": to_json({
                     "success": True,
                     "project_id": result.get('project_id'),
                     "message": result.get('message')
-                }, indent=2)}]}
+                })}]}
             else:
                 return {"content": [{"type": "text", "text": f"Error: {result.get('message', 'Unknown error')}"}]}
 
@@ -2335,14 +2543,14 @@ def handle_export_for_migration(args: Dict[str, Any]) -> Dict[str, Any]:
                 result = json.loads(resp.read().decode('utf-8'))
 
             if result.get('success'):
-                return {"content": [{"type": "text", "text": json.dumps({
+                return {"content": [{"type": "text", "text": to_json({
                     "success": True,
                     "message": result.get('message'),
                     "filename": result.get('filename'),
                     "size_bytes": result.get('size'),
                     "download_url": result.get('download_url'),
                     "backup_path": f"/var/backups/codehero/migrations/{result.get('filename')}"
-                }, indent=2)}]}
+                })}]}
             else:
                 return {"content": [{"type": "text", "text": f"Error: {result.get('message', 'Unknown error')}"}]}
 
@@ -2380,80 +2588,132 @@ TOOL_HANDLERS = {
     "codehero_get_context_defaults": handle_get_context_defaults,
 }
 
-def handle_request(request: Dict[str, Any]) -> Dict[str, Any]:
-    """Handle incoming JSON-RPC request."""
-    method = request.get('method', '')
-    request_id = request.get('id')
-    params = request.get('params', {})
+# Tools that never write - calling them leaves the response cache intact
+READ_ONLY_TOOLS = {
+    "codehero_list_projects",
+    "codehero_get_project",
+    "codehero_list_tickets",
+    "codehero_get_ticket",
+    "codehero_dashboard_stats",
+    "codehero_get_project_progress",
+    "codehero_get_context_defaults",
+}
+
+# TOOLS is static, so the tools/list result is serialized once at import
+TOOLS_LIST_RESULT_JSON = json.dumps({"tools": TOOLS})
+
+def tools_list_response_line(request_id) -> str:
+    """Full tools/list response line built around the pre-serialized result."""
+    return f'{{"jsonrpc": "2.0", "id": {json.dumps(request_id)}, "result": {TOOLS_LIST_RESULT_JSON}}}\n'
+
+# Required arguments per tool, taken from the declared inputSchema
+TOOL_REQUIRED_ARGS = {
+    tool["name"]: tuple(tool["inputSchema"]["required"])
+    for tool in TOOLS
+    if tool["inputSchema"].get("required")
+}
+
+# Tool-error response line; only the id and message are serialized per call
+ERROR_RESULT_LINE = '{"jsonrpc": "2.0", "id": %s, "result": {"content": [{"type": "text", "text": %s}], "isError": true}}\n'
 
-    if method == 'initialize':
+def missing_args_response_line(request_id, params: Dict[str, Any]) -> Optional[str]:
+    """Error line for a tools/call lacking a required argument, else None."""
+    required = TOOL_REQUIRED_ARGS.get(params.get('name'))
+    if not required:
+        return None
+    args = params.get('arguments') or {}
+    for arg in required:
+        if not args.get(arg):
+            return ERROR_RESULT_LINE % (json.dumps(request_id), json.dumps(f"Error: {arg} is required"))
+    return None
+
+def rpc_initialize(request_id, params: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "jsonrpc": "2.0",
+        "id": request_id,
+        "result": {
+            "protocolVersion": "2024-11-05",
+            "capabilities": {
+                "tools": {}
+            },
+            "serverInfo": {
+                "name": "codehero-mcp",
+                "version": "1.0.0"
+            }
+        }
+    }
+
+def rpc_initialized(request_id, params: Dict[str, Any]) -> None:
+    return None  # No response needed
+
+def rpc_tools_list(request_id, params: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "jsonrpc": "2.0",
+        "id": request_id,
+        "result": {
+            "tools": TOOLS
+        }
+    }
+
+def rpc_tools_call(request_id, params: Dict[str, Any]) -> Dict[str, Any]:
+    tool_name = params.get('name')
+    tool_args = params.get('arguments', {})
+
+    handler = TOOL_HANDLERS.get(tool_name)
+    if handler is None:
         return {
             "jsonrpc": "2.0",
             "id": request_id,
-            "result": {
-                "protocolVersion": "2024-11-05",
-                "capabilities": {
-                    "tools": {}
-                },
-                "serverInfo": {
-                    "name": "codehero-mcp",
-                    "version": "1.0.0"
-                }
+            "error": {
+                "code": -32601,
+                "message": f"Unknown tool: {tool_name}"
             }
         }
 
-    elif method == 'notifications/initialized':
-        return None  # No response needed
-
-    elif method == 'tools/list':
+    try:
+        result = handler(tool_args)
+        if tool_name not in READ_ONLY_TOOLS:
+            # Anything that may have written invalidates cached reads
+            clear_response_cache()
+        return {
+            "jsonrpc": "2.0",
+            "id": request_id,
+            "result": result
+        }
+    except Exception as e:
+        log_error(f"Tool {tool_name} error: {str(e)}")
         return {
             "jsonrpc": "2.0",
             "id": request_id,
             "result": {
-                "tools": TOOLS
+                "content": [{"type": "text", "text": f"Error: {str(e)}"}],
+                "isError": True
             }
         }
 
-    elif method == 'tools/call':
-        tool_name = params.get('name')
-        tool_args = params.get('arguments', {})
+def rpc_ping(request_id, params: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "jsonrpc": "2.0",
+        "id": request_id,
+        "result": {}
+    }
 
-        if tool_name in TOOL_HANDLERS:
-            try:
-                result = TOOL_HANDLERS[tool_name](tool_args)
-                return {
-                    "jsonrpc": "2.0",
-                    "id": request_id,
-                    "result": result
-                }
-            except Exception as e:
-                log_error(f"Tool {tool_name} error: {str(e)}")
-                return {
-                    "jsonrpc": "2.0",
-                    "id": request_id,
-                    "result": {
-                        "content": [{"type": "text", "text": f"Error: {str(e)}"}],
-                        "isError": True
-                    }
-                }
-        else:
-            return {
-                "jsonrpc": "2.0",
-                "id": request_id,
-                "error": {
-                    "code": -32601,
-                    "message": f"Unknown tool: {tool_name}"
-                }
-            }
+# JSON-RPC method -> handler(request_id, params); returns the response or None
+METHOD_DISPATCH = {
+    'initialize': rpc_initialize,
+    'notifications/initialized': rpc_initialized,
+    'tools/list': rpc_tools_list,
+    'tools/call': rpc_tools_call,
+    'ping': rpc_ping,
+}
 
-    elif method == 'ping':
-        return {
-            "jsonrpc": "2.0",
-            "id": request_id,
-            "result": {}
-        }
+def handle_request(request: Dict[str, Any]) -> Dict[str, Any]:
+    """Handle incoming JSON-RPC request."""
+    method = request.get('method', '')
+    request_id = request.get('id')
 
-    else:
+    fn = METHOD_DISPATCH.get(method)
+    if fn is None:
         return {
             "jsonrpc": "2.0",
             "id": request_id,
@@ -2462,32 +2722,113 @@ def handle_request(request: Dict[str, Any]) -> Dict[str, Any]:
                 "message": f"Method not found: {method}"
             }
         }
-
-def main():
-    """Main entry point - stdio JSON-RPC server."""
-    log_info("Starting CodeHero MCP Server...")
+    return fn(request_id, request.get('params', {}))
+
+# Responses go through one 64KB buffer that is flushed only when no further
+# request is waiting, so bursts (ping, tools/list, ...) cost one write() syscall
+_out = None
+
+def _output():
+    global _out
+    if _out is None:
+        _out = io.BufferedWriter(io.FileIO(sys.stdout.fileno(), 'wb', closefd=False), buffer_size=65536)
+    return _out
+
+def write_response(response: Optional[Dict[str, Any]]):
+    """Queue one JSON-RPC response line for stdout."""
+    if response is None:
+        return
+    out = _output()
+    if orjson is not None:
+        # Envelope straight to UTF-8 bytes - no intermediate str or encode() copy
+        out.write(orjson.dumps(response, default=_json_default, option=orjson.OPT_APPEND_NEWLINE))
+    else:
+        out.write(json.dumps(response, default=_json_default).encode() + b'\n')
+
+def flush_output():
+    _output().flush()
+
+async def serve():
+    """Read requests from stdin; tool calls run concurrently on a thread pool."""
+    loop = asyncio.get_running_loop()
+    # One worker per pooled DB connection
+    executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix='mcp-tool')
+    in_flight = set()
+    lines = asyncio.Queue()
+
+    def pump_stdin():
+        # Raw bytes: the JSON parser decodes UTF-8 itself
+        for raw in sys.stdin.buffer:
+            loop.call_soon_threadsafe(lines.put_nowait, raw)
+        loop.call_soon_threadsafe(lines.put_nowait, None)
+
+    threading.Thread(target=pump_stdin, name='mcp-stdin', daemon=True).start()
+
+    def flush_if_idle():
+        # More requests queued - the main loop flushes once it has drained them
+        if lines.empty():
+            flush_output()
+
+    def tool_done(future):
+        # Runs on the event loop thread, so stdout writes never interleave
+        in_flight.discard(future)
+        try:
+            write_response(future.result())
+        except Exception as e:
+            log_error(f"Error: {e}")
+        flush_if_idle()
 
     while True:
+        line = await lines.get()
+        if line is None:
+            break
+
+        if line.isspace():
+            continue
+
         try:
-            line = sys.stdin.readline()
-            if not line:
-                break
+            # Both parsers accept bytes and ignore surrounding whitespace,
+            # so no decode() or strip() copy is needed
+            request = orjson.loads(line) if orjson is not None else json.loads(line)
+            method = request.get('method')
 
-            line = line.strip()
-            if not line:
+            if method == 'tools/list':
+                _output().write(tools_list_response_line(request.get('id')).encode())
                 continue
 
-            request = json.loads(line)
-            response = handle_request(request)
+            if method == 'tools/call':
+                # Obvious bad calls are answered here without a worker hop
+                error_line = missing_args_response_line(request.get('id'), request.get('params') or {})
+                if error_line is not None:
+                    _output().write(error_line.encode())
+                    continue
+
+                # Tool handlers block on MySQL/subprocesses - overlap them instead of
+                # serializing; responses are matched to requests by id
+                future = loop.run_in_executor(executor, handle_request, request)
+                in_flight.add(future)
+                future.add_done_callback(tool_done)
+                continue
 
-            if response is not None:
-                sys.stdout.write(json.dumps(response) + '\n')
-                sys.stdout.flush()
+            write_response(handle_request(request))
 
         except json.JSONDecodeError as e:
             log_error(f"JSON decode error: {e}")
         except Exception as e:
             log_error(f"Error: {e}")
+        finally:
+            flush_if_idle()
+
+    # stdin closed - let in-flight tool calls finish and answer
+    if in_flight:
+        await asyncio.wait(in_flight)
+    executor.shutdown(wait=True)
+    flush_output()
+
+def main():
+    """Main entry point - stdio JSON-RPC server."""
+    log_info("Starting CodeHero MCP Server...")
+    asyncio.run(serve())
 
 if __name__ == '__main__':
     main()
@@ -5,17 +5,457 @@ Handles: Project Maps, Project Knowledge, Conversation Extractions
 """
 
 import os
+import hashlib
 import json
+import re
 import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
 from datetime import datetime, timedelta
 from typing import Optional, Dict, List, Any
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    tomllib = None
+
 # Token thresholds
 MAX_TOTAL_TOKENS = 100000       # Max tokens for conversation history
 RECENT_TOKENS_BUDGET = 50000    # Budget for recent messages (full verbatim)
 EXTRACTION_THRESHOLD = 50000    # When to trigger extraction
 MAX_SINGLE_MESSAGE = 10000      # Truncate messages larger than this
 PROJECT_MAP_EXPIRY_DAYS = 7     # Refresh project map after this
+TREE_OUTPUT_LIMIT = 2000        # structure_summary is stored cut to this size
+LOOKUP_CACHE_TTL = 60           # Seconds to reuse preferences/map/knowledge rows
+HAIKU_WINDOW_MESSAGES = 30      # Conversation lines per Haiku extraction call
+HAIKU_MAX_WINDOWS = 4           # Concurrent Haiku calls per extraction
+EXTRACTION_CACHE_TTL = 10       # Seconds to reuse the latest ticket extraction
+
+TREE_IGNORE_DIRS = frozenset({'__pycache__', 'node_modules', '.git'})
+STATS_IGNORE_DIRS = frozenset({'__pycache__', 'node_modules', '.git', 'venv', '.venv'})
+LANGUAGE_IGNORE_DIRS = STATS_IGNORE_DIRS | {'vendor', 'bin', 'obj'}
+
+# Source file extension -> language, for primary language detection
+LANG_MAP = {
+    # Web
+    '.html': 'HTML', '.htm': 'HTML', '.css': 'CSS',
+    '.scss': 'SCSS', '.sass': 'Sass', '.less': 'Less',
+    # JavaScript/TypeScript
+    '.js': 'JavaScript', '.ts': 'TypeScript', '.jsx': 'React',
+    '.tsx': 'React/TypeScript', '.mjs': 'JavaScript', '.cjs': 'JavaScript',
+    '.vue': 'Vue', '.svelte': 'Svelte',
+    # Python
+    '.py': 'Python', '.pyx': 'Cython', '.pyw': 'Python',
+    # PHP
+    '.php': 'PHP', '.phtml': 'PHP',
+    # C/C++
+    '.c': 'C', '.h': 'C', '.cpp': 'C++', '.hpp': 'C++',
+    '.cc': 'C++', '.cxx': 'C++', '.hxx': 'C++', '.c++': 'C++', '.h++': 'C++',
+    # C#
+    '.cs': 'C#',
+    # Java/Kotlin
+    '.java': 'Java', '.kt': 'Kotlin', '.kts': 'Kotlin',
+    # Go
+    '.go': 'Go',
+    # Rust
+    '.rs': 'Rust',
+    # Ruby
+    '.rb': 'Ruby', '.erb': 'Ruby/ERB',
+    # Swift/Objective-C
+    '.swift': 'Swift', '.m': 'Objective-C', '.mm': 'Objective-C++',
+    # Dart/Flutter
+    '.dart': 'Dart',
+    # Lua
+    '.lua': 'Lua',
+    # Perl
+    '.pl': 'Perl', '.pm': 'Perl',
+    # Shell
+    '.sh': 'Shell', '.bash': 'Bash', '.zsh': 'Zsh',
+    # SQL
+    '.sql': 'SQL',
+    # Scala
+    '.scala': 'Scala',
+    # Elixir/Erlang
+    '.ex': 'Elixir', '.exs': 'Elixir', '.erl': 'Erlang',
+    # Haskell
+    '.hs': 'Haskell',
+    # R
+    '.r': 'R', '.R': 'R',
+}
+SUPPORTED_EXTENSIONS = frozenset(LANG_MAP)
+
+# Common entry point files, looked up in the project root and ENTRY_POINT_SUBDIRS
+ENTRY_FILES = {
+    # Web
+    'index.html': 'Web entry point',
+    'index.htm': 'Web entry point',
+    'index.php': 'PHP entry point',
+    # Python
+    'app.py': 'Python app entry',
+    'main.py': 'Python main entry',
+    'server.py': 'Python server entry',
+    'manage.py': 'Django management',
+    'wsgi.py': 'WSGI entry',
+    'asgi.py': 'ASGI entry',
+    '__main__.py': 'Python package entry',
+    # JavaScript/TypeScript
+    'index.js': 'JavaScript entry',
+    'index.ts': 'TypeScript entry',
+    'app.js': 'JavaScript app entry',
+    'app.ts': 'TypeScript app entry',
+    'server.js': 'Node.js server',
+    'server.ts': 'Node.js server (TS)',
+    # C/C++
+    'main.c': 'C entry point',
+    'main.cpp': 'C++ entry point',
+    'main.cc': 'C++ entry point',
+    # C#
+    'Program.cs': 'C# entry point',
+    'Startup.cs': 'ASP.NET startup',
+    # Java
+    'Main.java': 'Java entry point',
+    'Application.java': 'Java/Spring entry',
+    # Go
+    'main.go': 'Go entry point',
+    # Rust
+    'main.rs': 'Rust entry point',
+    'lib.rs': 'Rust library entry',
+    # Ruby
+    'app.rb': 'Ruby app entry',
+    'config.ru': 'Rack config',
+    # Swift
+    'main.swift': 'Swift entry point',
+    'AppDelegate.swift': 'iOS app delegate',
+    # Dart/Flutter
+    'main.dart': 'Dart/Flutter entry',
+    # Kotlin
+    'Main.kt': 'Kotlin entry point',
+    'Application.kt': 'Kotlin app entry',
+}
+ENTRY_POINT_SUBDIRS = ('src', 'app', 'lib')
+
+# Dependency manifests read (in one batch) for tech stack detection
+MANIFEST_FILES = ('requirements.txt', 'package.json', 'composer.json', 'pom.xml',
+                  'build.gradle', 'go.mod', 'Cargo.toml', 'Gemfile')
+MANIFEST_MAX_SIZE = 65536
+
+# Framework signatures per dependency file: lowercase substring -> tech stack tag
+FILE_SIGNATURES = {
+    'requirements.txt': {
+        'flask': 'Flask', 'django': 'Django', 'fastapi': 'FastAPI',
+        'sqlalchemy': 'SQLAlchemy', 'pytest': 'pytest', 'numpy': 'NumPy',
+        'pandas': 'Pandas', 'tensorflow': 'TensorFlow',
+        'pytorch': 'PyTorch', 'torch': 'PyTorch',
+    },
+    '.csproj': {
+        'microsoft.aspnetcore': 'ASP.NET Core',
+        'microsoft.entityframeworkcore': 'Entity Framework',
+        'blazor': 'Blazor',
+    },
+    'pom.xml': {'spring-boot': 'Spring Boot', 'spring-framework': 'Spring'},
+    'build.gradle': {'spring-boot': 'Spring Boot', 'android': 'Android'},
+    'go.mod': {'gin-gonic': 'Gin', 'echo': 'Echo', 'fiber': 'Fiber'},
+    'Cargo.toml': {'actix-web': 'Actix', 'rocket': 'Rocket', 'tokio': 'Tokio'},
+    'Gemfile': {'rails': 'Ruby on Rails', 'sinatra': 'Sinatra'},
+}
+
+# One pattern per file: the lookahead reports every needle at every
+# position (overlaps included), so one sweep replaces a scan per needle
+SIGNATURE_PATTERNS = {
+    kind: re.compile('(?=(' + '|'.join(re.escape(needle) for needle in sorted(sigs, key=len, reverse=True)) + '))')
+    for kind, sigs in FILE_SIGNATURES.items()
+}
+
+# File paths mentioned in conversation messages (whole path, not just the extension)
+FILE_REFERENCE_RE = re.compile(r'[\w./]+\.(?:py|js|ts|jsx|tsx|php|html|css|sql|json|yaml|yml|md)\b')
+
+_CACHE_MISS = object()
+
+# project_knowledge columns holding JSON arrays (add_project_knowledge appends to these)
+KNOWLEDGE_LIST_FIELDS = frozenset({'coding_patterns', 'known_gotchas', 'error_solutions', 'performance_notes',
+                                   'architecture_decisions', 'ci_cd_notes', 'security_considerations',
+                                   'sensitive_files'})
+
+# Column value types that still hold undecoded JSON text
+JSON_TEXT_TYPES = frozenset({str, bytes, bytearray})
+
+# JSON columns decoded by the getters (only those the getters select)
+USER_PREFERENCES_JSON_FIELDS = ('programming_style', 'learned_quirks')
+PROJECT_MAP_JSON_FIELDS = ('entry_points', 'tech_stack')
+PROJECT_KNOWLEDGE_JSON_FIELDS = ('coding_patterns', 'known_gotchas', 'error_solutions', 'architecture_decisions')
+KNOWLEDGE_MERGE_JSON_FIELDS = ('known_gotchas', 'error_solutions', 'architecture_decisions',
+                               'learned_from_tickets')
+EXTRACTION_JSON_FIELDS = ('important_notes', 'decisions', 'problems_solved', 'files_modified',
+                          'blocking_issues', 'error_patterns')
+
+
+def to_json(obj: Any) -> str:
+    """json.dumps, through orjson when it is installed (compact, UTF-8 kept as is)"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj)
+
+
+def summarize_tree(tree_output: str) -> str:
+    """Cut a tree listing to TREE_OUTPUT_LIMIT for structure_summary"""
+    if len(tree_output) > TREE_OUTPUT_LIMIT:
+        return tree_output[:TREE_OUTPUT_LIMIT] + "\n... (truncated)"
+    return tree_output
+
+
+def parse_json(text: str) -> Any:
+    """json.loads, through orjson when it is installed (str or bytes)"""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def match_signatures(kind: str, content: str) -> List[str]:
+    """Tech stack tags whose FILE_SIGNATURES[kind] needle occurs in content"""
+    found = {m.group(1) for m in SIGNATURE_PATTERNS[kind].finditer(content.lower())}
+    return [tag for needle, tag in FILE_SIGNATURES[kind].items() if needle in found]
+
+
+def decode_json_fields(row: Dict, fields) -> None:
+    """Decode a row's JSON columns in place
+
+    mysql-connector hands JSON columns back as text (str, or bytes on some
+    builds); values that don't parse are left as they are.
+    """
+    try:
+        for field in fields:
+            value = row.get(field)
+            if value and type(value) in JSON_TEXT_TYPES:
+                row[field] = parse_json(value)
+    except ValueError:
+        # Rare malformed column: redo field by field (decoded ones are skipped)
+        for field in fields:
+            value = row.get(field)
+            if value and type(value) in JSON_TEXT_TYPES:
+                try:
+                    row[field] = parse_json(value)
+                except ValueError:
+                    pass
+
+
+def unique_items(lists) -> List:
+    """Concatenate lists, dropping repeats but keeping first-seen order"""
+    seen = {}
+    for items in lists:
+        if not isinstance(items, list):
+            continue
+        for item in items:
+            key = item if isinstance(item, str) else to_json(item)
+            seen.setdefault(key, item)
+    return list(seen.values())
+
+
+def cargo_dependencies(cargo_toml: str) -> Optional[set]:
+    """Lowercased crate names from a Cargo.toml's dependency tables, or None if unparseable"""
+    if tomllib is None:
+        return None
+    try:
+        manifest = tomllib.loads(cargo_toml)
+    except tomllib.TOMLDecodeError:
+        return None
+    crates = set()
+    for table in ('dependencies', 'dev-dependencies', 'build-dependencies'):
+        deps = manifest.get(table)
+        if isinstance(deps, dict):
+            crates.update(name.lower() for name in deps)
+    return crates
+
+
+# Haiku extraction prompt, split around the conversation and file list
+HAIKU_PROMPT_HEAD = b"""Analyze this conversation and extract key information in JSON format.
+
+CONVERSATION:
+"""
+
+HAIKU_PROMPT_FILES = b"""
+
+FILES MENTIONED: """
+
+HAIKU_PROMPT_TAIL = b"""
+
+Respond with ONLY a JSON object (no markdown, no explanation):
+{
+    "decisions": ["decision 1", "decision 2", ...],
+    "problems_solved": ["problem 1: solution", "problem 2: solution", ...],
+    "current_status": "Brief status of where things stand",
+    "key_info": "Most important technical details to remember (configs, values, patterns used)",
+    "important_notes": ["note 1", "note 2", ...]
+}
+
+IMPORTANT_NOTES EXTRACTION:
+Extract any user instructions, warnings, rules, or things to always remember.
+Understand the SEMANTIC MEANING, not just keywords. Look for:
+- Explicit rules ("never do X", "always do Y")
+- Warnings about gotchas, pitfalls, or things to avoid
+- User preferences expressed strongly or repeatedly
+- Constraints or limitations the user mentioned
+- Things the user emphasized (via caps, repetition, or strong language)
+- Any instruction about HOW the AI should behave or work
+
+These notes will be shown to the AI in EVERY future conversation about this ticket.
+
+Keep each item concise (under 100 chars). Focus on technical decisions and implementations."""
+
+# ═══════════════════════════════════════════════════════════════════════════
+# PLATFORM CONTEXT BLOCKS (static per project settings, rendered once)
+# ═══════════════════════════════════════════════════════════════════════════
+
+ANDROID_PROJECT_TYPES = frozenset({'capacitor', 'react_native', 'flutter', 'native_android'})
+
+ANDROID_SERVER_DEVICE = """
+Android Emulator: Server-based (Redroid)
+- ADB device: localhost:5556
+- Use 'adb connect localhost:5556' if disconnected
+- Install APK: adb -s localhost:5556 install app.apk
+- View logs: adb -s localhost:5556 logcat
+- Screen capture: adb -s localhost:5556 exec-out screencap -p > screen.png
+- The emulator runs in Docker, accessible via web interface"""
+
+ANDROID_REMOTE_DEVICE = """
+Android Device: Remote ADB
+- ADB device: {host}:{port}
+- Connect: adb connect {host}:{port}
+- Install APK: adb -s {host}:{port} install app.apk
+- View logs: adb -s {host}:{port} logcat"""
+
+# Framework-specific guidance
+ANDROID_FRAMEWORK_COMMANDS = {
+    'capacitor': """
+Capacitor.js Commands:
+- Build: npx cap build android
+- Sync: npx cap sync android
+- Open Android Studio: npx cap open android
+- Run on device: npx cap run android""",
+    'react_native': """
+React Native Commands:
+- Start Metro: npx react-native start
+- Run Android: npx react-native run-android
+- Build APK: cd android && ./gradlew assembleRelease
+- Logs: npx react-native log-android""",
+    'flutter': """
+Flutter Commands:
+- Run: flutter run
+- Build APK: flutter build apk
+- Build App Bundle: flutter build appbundle
+- Logs: flutter logs""",
+    'native_android': """
+Android Native Commands:
+- Build: ./gradlew build
+- Install: ./gradlew installDebug
+- Run tests: ./gradlew test
+- Clean: ./gradlew clean""",
+}
+
+DOTNET_TEMPLATE = """
+=== .NET DEVELOPMENT ===
+Project Type: ASP.NET Core / .NET 8
+App Directory: {app_path}
+Internal Port: {port}
+
+.NET Commands:
+- Create console app: dotnet new console
+- Create web API: dotnet new webapi
+- Create MVC app: dotnet new mvc
+- Create Blazor app: dotnet new blazor
+- Build: dotnet build
+- Run: dotnet run
+- Run with port: dotnet run --urls=http://127.0.0.1:{port}
+- Test: dotnet test
+- Publish: dotnet publish -c Release
+
+After building, the app will be accessible at:
+  https://SERVER_IP:9867/{code}/
+
+Service Management:
+- Start: sudo systemctl start codehero-dotnet-{code}
+- Stop: sudo systemctl stop codehero-dotnet-{code}
+- Status: sudo systemctl status codehero-dotnet-{code}
+- Logs: journalctl -u codehero-dotnet-{code} -f
+
+Important: After publishing, restart the service to apply changes.
+
+============================
+"""
+
+
+@lru_cache(maxsize=64)
+def android_block(project_type: str, device_type: str, remote_host: str = '', remote_port: int = 5555) -> str:
+    """Android development context for one project/device combination"""
+    parts = ["\n=== ANDROID DEVELOPMENT ===", f"Project Type: {project_type}"]
+    if device_type == 'server':
+        parts.append(ANDROID_SERVER_DEVICE)
+    elif device_type == 'remote':
+        parts.append(ANDROID_REMOTE_DEVICE.format(host=remote_host, port=remote_port))
+    if project_type in ANDROID_FRAMEWORK_COMMANDS:
+        parts.append(ANDROID_FRAMEWORK_COMMANDS[project_type])
+    parts.append("============================\n")
+    return '\n'.join(parts)
+
+
+@lru_cache(maxsize=64)
+def dotnet_block(project_code: str, dotnet_port: int, app_path: str) -> str:
+    """.NET development context for one project"""
+    return DOTNET_TEMPLATE.format(code=project_code, port=dotnet_port, app_path=app_path)
+
+
+TOKENIZER_ENCODING = "cl100k_base"
+# setup.sh/upgrade.sh pre-fetch the encoding here, so loading needs no network
+TIKTOKEN_CACHE_DIR = "/opt/codehero/cache/tiktoken"
+TOKENIZER_LOAD_TIMEOUT = 10  # seconds the first caller waits for the encoding
+_tokenizer = None
+_tokenizer_ready = threading.Event()
+_tokenizer_lock = threading.Lock()
+_tokenizer_thread = None
+
+
+def _load_tokenizer():
+    global _tokenizer
+    try:
+        _tokenizer = tiktoken.get_encoding(TOKENIZER_ENCODING)
+    except Exception:
+        pass  # e.g. encoding file not cached and no network
+    finally:
+        _tokenizer_ready.set()
+
+
+def get_tokenizer():
+    """Shared BPE encoder; None falls back to the 4-chars estimate
+
+    A missing cache makes tiktoken download the encoding with no timeout, so
+    it loads on a background thread: the first caller waits up to
+    TOKENIZER_LOAD_TIMEOUT, everyone else gets the estimate until it's ready.
+    """
+    global _tokenizer_thread
+    if _tokenizer_ready.is_set() or tiktoken is None:
+        return _tokenizer
+    with _tokenizer_lock:
+        starting = _tokenizer_thread is None
+        if starting:
+            os.environ.setdefault('TIKTOKEN_CACHE_DIR', TIKTOKEN_CACHE_DIR)
+            _tokenizer_thread = threading.Thread(target=_load_tokenizer, name='tokenizer-load', daemon=True)
+            _tokenizer_thread.start()
+    if starting:
+        _tokenizer_ready.wait(TOKENIZER_LOAD_TIMEOUT)
+    return _tokenizer
 
 
 class SmartContextManager:
@@ -24,25 +464,87 @@ class SmartContextManager:
     def __init__(self, db_pool, logger=None):
         self.db_pool = db_pool
         self.logger = logger or (lambda msg, level="INFO": print(f"[{level}] {msg}"))
+        self._lookup_cache = {}  # (kind, id) -> (expires_at, row)
+        self._lookup_cache_lock = threading.Lock()
+        self._context_cache = {}  # ('user' | 'project_map' | 'knowledge', id) -> (row version, context text)
 
     def get_db(self):
         return self.db_pool.get_connection()
 
+    @contextmanager
+    def _db(self, dictionary=False):
+        """Pooled connection + cursor, handed back to the pool even if the body raises"""
+        conn = self.get_db()
+        cursor = None
+        try:
+            cursor = conn.cursor(dictionary=dictionary)
+            yield conn, cursor
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            raise
+        finally:
+            if cursor is not None:
+                cursor.close()
+            conn.close()
+
     def log(self, message, level="INFO"):
         if callable(self.logger):
             self.logger(message, level)
 
+    def _cache_get(self, key):
+        """Cached row for key, or _CACHE_MISS if absent or expired"""
+        with self._lookup_cache_lock:
+            hit = self._lookup_cache.get(key)
+        if hit and hit[0] > time.monotonic():
+            return hit[1]
+        return _CACHE_MISS
+
+    def _cache_put(self, key, value, ttl=LOOKUP_CACHE_TTL):
+        with self._lookup_cache_lock:
+            self._lookup_cache[key] = (time.monotonic() + ttl, value)
+
+    def _cache_invalidate(self, key):
+        with self._lookup_cache_lock:
+            self._lookup_cache.pop(key, None)
+
     def count_tokens(self, text: str) -> int:
-        """Estimate token count (4 chars ≈ 1 token for English/code)"""
+        """Count BPE tokens (estimate 4 chars ≈ 1 token without tiktoken)"""
         if not text:
             return 0
+        tokenizer = get_tokenizer()
+        if tokenizer is not None:
+            return len(tokenizer.encode(text, disallowed_special=()))
         return len(text) // 4
 
+    def count_tokens_batch(self, texts: List[str]) -> List[int]:
+        """count_tokens for many texts, tokenized in one parallel batch"""
+        tokenizer = get_tokenizer()
+        if tokenizer is None or len(texts) < 2:
+            return [self.count_tokens(text) for text in texts]
+        encoded = tokenizer.encode_batch([text or '' for text in texts], disallowed_special=())
+        return [len(token_ids) for token_ids in encoded]
+
     def truncate_message(self, content: str, max_tokens: int = MAX_SINGLE_MESSAGE) -> str:
         """Truncate message if too large, keeping start and end"""
         if not content:
             return content
 
+        tokenizer = get_tokenizer()
+        if tokenizer is not None:
+            token_ids = tokenizer.encode(content, disallowed_special=())
+            tokens = len(token_ids)
+            if tokens <= max_tokens:
+                return content
+
+            # Keep first 40% and last 40% of the tokens, cut on token boundaries
+            keep = int(max_tokens * 0.4)
+            first_part = tokenizer.decode(token_ids[:keep])
+            last_part = tokenizer.decode(token_ids[-keep:]) if keep else ''
+            return f"{first_part}\n\n[... truncated {tokens - max_tokens} tokens ...]\n\n{last_part}"
+
         tokens = self.count_tokens(content)
         if tokens <= max_tokens:
             return content
@@ -59,38 +561,41 @@ class SmartContextManager:
     # ═══════════════════════════════════════════════════════════════════════════
 
     def get_user_preferences(self, user_id: str) -> Optional[Dict]:
-        """Get user preferences"""
+        """Get user preferences (cached for LOOKUP_CACHE_TTL seconds)"""
+        cached = self._cache_get(('user_preferences', user_id))
+        if cached is not _CACHE_MISS:
+            return cached
         try:
-            conn = self.get_db()
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute("""
-                SELECT * FROM user_preferences WHERE user_id = %s
-            """, (user_id,))
-            prefs = cursor.fetchone()
-            cursor.close()
-            conn.close()
-
-            if prefs:
-                # Parse JSON fields
-                for field in ['programming_style', 'comment_style', 'error_handling',
-                              'preferred_tools', 'git_style', 'editor_config',
-                              'learned_quirks', 'topics_of_interest', 'things_to_avoid']:
-                    if prefs.get(field) and isinstance(prefs[field], str):
-                        try:
-                            prefs[field] = json.loads(prefs[field])
-                        except:
-                            pass
-            return prefs
+            with self._db(dictionary=True) as (conn, cursor):
+                return self._load_user_preferences(cursor, user_id)
         except Exception as e:
             self.log(f"Error getting user preferences: {e}", "ERROR")
             return None
 
+    def _load_user_preferences(self, cursor, user_id: str) -> Optional[Dict]:
+        cursor.execute("""
+            SELECT language, response_style, skill_level, programming_style,
+                   custom_instructions, learned_quirks, updated_at
+            FROM user_preferences WHERE user_id = %s LIMIT 1
+        """, (user_id,))
+        prefs = cursor.fetchone()
+        if prefs:
+            decode_json_fields(prefs, USER_PREFERENCES_JSON_FIELDS)
+        self._cache_put(('user_preferences', user_id), prefs)
+        return prefs
+
     def build_user_context(self, user_id: str) -> str:
         """Build user context string for system prompt"""
         prefs = self.get_user_preferences(user_id)
         if not prefs:
             return ""
 
+        # Same row version as last time -> same text
+        version = prefs.get('updated_at')
+        cached = self._context_cache.get(('user', user_id))
+        if version is not None and cached and cached[0] == version:
+            return cached[1]
+
         parts = ["\n=== USER PREFERENCES ==="]
 
         if prefs.get('language'):
@@ -109,37 +614,41 @@ class SmartContextManager:
                 parts.append(f"Notes: {'; '.join(quirks)}")
 
         parts.append("========================\n")
-        return '\n'.join(parts) if len(parts) > 2 else ""
+        context = '\n'.join(parts) if len(parts) > 2 else ""
+        if version is not None:
+            self._context_cache[('user', user_id)] = (version, context)
+        return context
 
     # ═══════════════════════════════════════════════════════════════════════════
     # PROJECT MAP
     # ═══════════════════════════════════════════════════════════════════════════
 
     def get_project_map(self, project_id: int) -> Optional[Dict]:
-        """Get cached project map"""
+        """Get cached project map (cached in-process for LOOKUP_CACHE_TTL seconds)"""
+        cached = self._cache_get(('project_map', project_id))
+        if cached is not _CACHE_MISS:
+            return cached
         try:
-            conn = self.get_db()
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute("""
-                SELECT * FROM project_maps
-                WHERE project_id = %s AND (expires_at IS NULL OR expires_at > NOW())
-            """, (project_id,))
-            pmap = cursor.fetchone()
-            cursor.close()
-            conn.close()
-
-            if pmap:
-                for field in ['entry_points', 'key_files', 'tech_stack', 'dependencies', 'design_patterns']:
-                    if pmap.get(field) and isinstance(pmap[field], str):
-                        try:
-                            pmap[field] = json.loads(pmap[field])
-                        except:
-                            pass
-            return pmap
+            with self._db(dictionary=True) as (conn, cursor):
+                return self._load_project_map(cursor, project_id)
         except Exception as e:
             self.log(f"Error getting project map: {e}", "ERROR")
             return None
 
+    def _load_project_map(self, cursor, project_id: int) -> Optional[Dict]:
+        cursor.execute("""
+            SELECT structure_summary, tech_stack, entry_points, primary_language,
+                   file_count, generated_at
+            FROM project_maps
+            WHERE project_id = %s AND (expires_at IS NULL OR expires_at > NOW())
+            LIMIT 1
+        """, (project_id,))
+        pmap = cursor.fetchone()
+        if pmap:
+            decode_json_fields(pmap, PROJECT_MAP_JSON_FIELDS)
+        self._cache_put(('project_map', project_id), pmap)
+        return pmap
+
     def generate_project_map(self, project_id: int, project_path: str, claude_func=None) -> Optional[Dict]:
         """Generate project map by analyzing the project structure"""
         self.log(f"Generating project map for project {project_id}")
@@ -150,27 +659,25 @@ class SmartContextManager:
 
         try:
             # Gather project information
-            tree_output = self._get_tree_output(project_path)
-            readme_content = self._read_file_if_exists(os.path.join(project_path, 'README.md'))
-            requirements = self._read_file_if_exists(os.path.join(project_path, 'requirements.txt'))
-            package_json = self._read_file_if_exists(os.path.join(project_path, 'package.json'))
-
-            # Count files and size
-            file_count, total_size = self._get_project_stats(project_path)
+            tree_output, file_count, total_size, ext_histogram, entry_points = self._scan_project(project_path)
+            root_files = self._root_files(project_path)
+            manifests = self._read_manifests(project_path, root_files)
+            requirements = manifests.get('requirements.txt')
+            package_json = manifests.get('package.json')
 
             # Detect primary language
-            primary_language = self._detect_language(project_path)
+            primary_language = self._detect_language(ext_histogram)
 
             # Build simple map without Claude (for now)
             # TODO: Use claude_func to generate intelligent summary
             map_data = {
-                'structure_summary': tree_output[:5000] if tree_output else '',
-                'entry_points': json.dumps(self._detect_entry_points(project_path)),
-                'key_files': json.dumps([]),
-                'tech_stack': json.dumps(self._detect_tech_stack(project_path, requirements, package_json)),
-                'dependencies': json.dumps({'raw': requirements[:2000]}) if requirements else None,
+                'structure_summary': summarize_tree(tree_output) if tree_output else '',
+                'entry_points': to_json(entry_points),
+                'key_files': to_json([]),
+                'tech_stack': to_json(self._detect_tech_stack(project_path, requirements, package_json, manifests, root_files)),
+                'dependencies': to_json({'raw': requirements[:2000]}) if requirements else None,
                 'architecture_type': None,
-                'design_patterns': json.dumps([]),
+                'design_patterns': to_json([]),
                 'file_count': file_count,
                 'total_size_kb': total_size,
                 'primary_language': primary_language,
@@ -178,42 +685,42 @@ class SmartContextManager:
             }
 
             # Save to database
-            conn = self.get_db()
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                INSERT INTO project_maps
-                (project_id, structure_summary, entry_points, key_files, tech_stack,
-                 dependencies, architecture_type, design_patterns, file_count,
-                 total_size_kb, primary_language, generated_at, expires_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW(), %s)
-                ON DUPLICATE KEY UPDATE
-                structure_summary = VALUES(structure_summary),
-                entry_points = VALUES(entry_points),
-                key_files = VALUES(key_files),
-                tech_stack = VALUES(tech_stack),
-                dependencies = VALUES(dependencies),
-                file_count = VALUES(file_count),
-                total_size_kb = VALUES(total_size_kb),
-                primary_language = VALUES(primary_language),
-                generated_at = NOW(),
-                expires_at = VALUES(expires_at)
-            """, (
-                project_id, map_data['structure_summary'], map_data['entry_points'],
-                map_data['key_files'], map_data['tech_stack'], map_data['dependencies'],
-                map_data['architecture_type'], map_data['design_patterns'],
-                map_data['file_count'], map_data['total_size_kb'],
-                map_data['primary_language'], map_data['expires_at']
-            ))
+            with self._db() as (conn, cursor):
+                # One transaction for the map upsert and the project timestamp:
+                # on autocommit pools (daemon, MCP) they'd commit separately
+                conn.start_transaction()
+                cursor.execute("""
+                    INSERT INTO project_maps
+                    (project_id, structure_summary, entry_points, key_files, tech_stack,
+                     dependencies, architecture_type, design_patterns, file_count,
+                     total_size_kb, primary_language, generated_at, expires_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW(), %s)
+                    ON DUPLICATE KEY UPDATE
+                    structure_summary = VALUES(structure_summary),
+                    entry_points = VALUES(entry_points),
+                    key_files = VALUES(key_files),
+                    tech_stack = VALUES(tech_stack),
+                    dependencies = VALUES(dependencies),
+                    file_count = VALUES(file_count),
+                    total_size_kb = VALUES(total_size_kb),
+                    primary_language = VALUES(primary_language),
+                    generated_at = NOW(),
+                    expires_at = VALUES(expires_at)
+                """, (
+                    project_id, map_data['structure_summary'], map_data['entry_points'],
+                    map_data['key_files'], map_data['tech_stack'], map_data['dependencies'],
+                    map_data['architecture_type'], map_data['design_patterns'],
+                    map_data['file_count'], map_data['total_size_kb'],
+                    map_data['primary_language'], map_data['expires_at']
+                ))
 
-            # Update project timestamp
-            cursor.execute("""
-                UPDATE projects SET map_generated_at = NOW() WHERE id = %s
-            """, (project_id,))
+                # Update project timestamp
+                cursor.execute("""
+                    UPDATE projects SET map_generated_at = NOW() WHERE id = %s
+                """, (project_id,))
 
-            conn.commit()
-            cursor.close()
-            conn.close()
+                conn.commit()
+            self._cache_invalidate(('project_map', project_id))
 
             self.log(f"Project map generated: {file_count} files, {total_size}KB")
             return map_data
@@ -256,44 +763,46 @@ class SmartContextManager:
             total_files = 0
             total_size = 0
 
-            for label, path in paths_to_scan:
-                tree_output = self._get_tree_output(path)
+            if len(paths_to_scan) > 1:
+                # Independent trees (often on different mounts) - scan them concurrently
+                with ThreadPoolExecutor(max_workers=len(paths_to_scan)) as executor:
+                    scans = list(executor.map(self._scan_project, [path for _, path in paths_to_scan]))
+            else:
+                scans = [self._scan_project(paths_to_scan[0][1])]
+
+            for (label, path), (tree_output, files, size, _, _) in zip(paths_to_scan, scans):
                 if tree_output:
                     if len(paths_to_scan) > 1:
                         tree_parts.append(f"[{label}] {tree_output}")
                     else:
                         tree_parts.append(tree_output)
 
-                files, size = self._get_project_stats(path)
                 total_files += files
                 total_size += size
 
             if not tree_parts:
                 return False
 
-            combined_tree = "\n".join(tree_parts)
-
-            conn = self.get_db()
-            cursor = conn.cursor()
+            combined_tree = summarize_tree("\n".join(tree_parts))
 
-            # Update only structure_summary and file_count (fast update)
-            cursor.execute("""
-                UPDATE project_maps
-                SET structure_summary = %s, file_count = %s, total_size_kb = %s
-                WHERE project_id = %s
-            """, (combined_tree, total_files, total_size // 1024, project_id))
+            with self._db() as (conn, cursor):
+                # Update only structure_summary and file_count (fast update)
+                cursor.execute("""
+                    UPDATE project_maps
+                    SET structure_summary = %s, file_count = %s, total_size_kb = %s
+                    WHERE project_id = %s
+                """, (combined_tree, total_files, total_size // 1024, project_id))
+                map_exists = cursor.rowcount > 0
+                if map_exists:
+                    conn.commit()
 
             # If no rows updated, the map doesn't exist yet - create it
-            if cursor.rowcount == 0:
-                cursor.close()
-                conn.close()
+            if not map_exists:
                 main_path = web_path or app_path
                 self.generate_project_map(project_id, main_path)
                 return True
 
-            conn.commit()
-            cursor.close()
-            conn.close()
+            self._cache_invalidate(('project_map', project_id))
             self.log(f"Tree refreshed for project {project_id}: {total_files} files")
             return True
         except Exception as e:
@@ -306,14 +815,19 @@ class SmartContextManager:
         if not pmap:
             return ""
 
+        # refresh_project_tree rewrites the tree without touching generated_at,
+        # so the summary is part of the version
+        generated_at = pmap.get('generated_at')
+        version = (generated_at, pmap.get('structure_summary'))
+        cached = self._context_cache.get(('project_map', project_id))
+        if generated_at is not None and cached and cached[0] == version:
+            return cached[1]
+
         parts = ["\n=== PROJECT STRUCTURE ==="]
 
         if pmap.get('structure_summary'):
-            # Limit structure to reasonable size
-            structure = pmap['structure_summary']
-            if len(structure) > 2000:
-                structure = structure[:2000] + "\n... (truncated)"
-            parts.append(structure)
+            # Already cut to TREE_OUTPUT_LIMIT when it was stored
+            parts.append(pmap['structure_summary'])
 
         if pmap.get('tech_stack'):
             tech = pmap['tech_stack']
@@ -330,280 +844,226 @@ class SmartContextManager:
             parts.append(f"Primary Language: {pmap['primary_language']}")
 
         parts.append("=========================\n")
-        return '\n'.join(parts)
-
-    def _get_tree_output(self, path: str, max_depth: int = 3) -> str:
-        """Get directory tree output"""
-        try:
-            result = subprocess.run(
-                ['tree', '-L', str(max_depth), '-I', '__pycache__|node_modules|.git|*.pyc', path],
-                capture_output=True, text=True, timeout=10
-            )
-            return result.stdout if result.returncode == 0 else ""
-        except:
-            return ""
-
-    def _read_file_if_exists(self, path: str, max_size: int = 10000) -> Optional[str]:
-        """Read file content if it exists"""
-        try:
-            if os.path.exists(path) and os.path.isfile(path):
-                with open(path, 'r', errors='ignore') as f:
-                    return f.read(max_size)
-        except:
-            pass
-        return None
+        context = '\n'.join(parts)
+        if generated_at is not None:
+            self._context_cache[('project_map', project_id)] = (version, context)
+        return context
+
+    def _scan_project(self, path: str, max_depth: int = 3, tree_limit: int = TREE_OUTPUT_LIMIT) -> tuple:
+        """Walk the project once for tree text, stats, extensions and entry points
+
+        Returns (tree_output, file_count, total_size_kb, ext_histogram, entry_points).
+        The tree is a `tree -L max_depth` style listing without hidden entries,
+        TREE_IGNORE_DIRS or *.pyc, cut once it passes `tree_limit` characters.
+        Stats skip STATS_IGNORE_DIRS, the extension histogram only counts
+        SUPPORTED_EXTENSIONS outside LANGUAGE_IGNORE_DIRS, and entry points
+        are looked up in the root and ENTRY_POINT_SUBDIRS.
+        """
+        def tree_visible(name):
+            return not name.startswith('.') and name not in TREE_IGNORE_DIRS and not name.endswith('.pyc')
 
-    def _get_project_stats(self, path: str) -> tuple:
-        """Get file count and total size"""
+        def open_dir(dir_path, in_tree):
+            try:
+                with os.scandir(dir_path) as it:
+                    entries = list(it)
+            except OSError:
+                return [], 0
+            # Reversed so pop() yields entries in name order
+            entries.sort(key=lambda e: e.name, reverse=True)
+            shown = sum(1 for e in entries if tree_visible(e.name)) if in_tree else 0
+            return entries, shown
+
+        tree_lines = [path]
+        tree_size = len(path) + 1
+        tree_done = False
+        tree_dirs = 0
+        tree_files = 0
         file_count = 0
         total_size = 0
+        ext_histogram = {}
+        found_entries = set()
         try:
-            for root, dirs, files in os.walk(path):
-                # Skip common non-source directories
-                dirs[:] = [d for d in dirs if d not in ['__pycache__', 'node_modules', '.git', 'venv', '.venv']]
-                for f in files:
-                    file_count += 1
+            st = os.stat(path)
+            seen_dirs = {(st.st_dev, st.st_ino)}
+        except OSError:
+            seen_dirs = set()
+
+        # Frames: [entries, tree entries left, prefix, depth, in_tree, count_stats, count_lang, rel_dir]
+        entries, shown = open_dir(path, True)
+        stack = [[entries, shown, '', 1, True, True, True, '']]
+
+        while stack:
+            frame = stack[-1]
+            entries, _, prefix, depth, in_tree, count_stats, count_lang, rel_dir = frame
+            if not entries:
+                stack.pop()
+                continue
+
+            entry = entries.pop()
+            name = entry.name
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+
+            show = in_tree and not tree_done and tree_visible(name)
+            last = False
+            if show:
+                frame[1] -= 1
+                last = frame[1] == 0
+                line = f"{prefix}{'└── ' if last else '├── '}{name}"
+                tree_lines.append(line)
+                tree_size += len(line) + 1
+                if tree_size > tree_limit:
+                    tree_done = True
+                elif is_dir:
+                    tree_dirs += 1
+                else:
+                    tree_files += 1
+
+            if is_dir:
+                if entry.is_symlink():
+                    continue
+                child_tree = show and not tree_done and depth < max_depth
+                child_stats = count_stats and name not in STATS_IGNORE_DIRS
+                if child_tree or child_stats:
+                    # Symlinks are never followed, but a bind mount can still
+                    # loop back onto an ancestor - enter each directory once
                     try:
-                        total_size += os.path.getsize(os.path.join(root, f))
-                    except:
-                        pass
-        except:
-            pass
-        return file_count, total_size // 1024
-
-    def _detect_language(self, path: str) -> str:
-        """Detect primary programming language"""
-        extensions = {}
-
-        # All supported extensions
-        supported_extensions = [
-            # Web
-            '.html', '.htm', '.css', '.scss', '.sass', '.less',
-            # JavaScript/TypeScript
-            '.js', '.ts', '.jsx', '.tsx', '.mjs', '.cjs', '.vue', '.svelte',
-            # Python
-            '.py', '.pyx', '.pyw',
-            # PHP
-            '.php', '.phtml',
-            # C/C++
-            '.c', '.h', '.cpp', '.hpp', '.cc', '.cxx', '.hxx', '.c++', '.h++',
-            # C#
-            '.cs',
-            # Java/Kotlin
-            '.java', '.kt', '.kts',
-            # Go
-            '.go',
-            # Rust
-            '.rs',
-            # Ruby
-            '.rb', '.erb',
-            # Swift/Objective-C
-            '.swift', '.m', '.mm',
-            # Dart/Flutter
-            '.dart',
-            # Lua
-            '.lua',
-            # Perl
-            '.pl', '.pm',
-            # Shell
-            '.sh', '.bash', '.zsh',
-            # SQL
-            '.sql',
-            # Scala
-            '.scala',
-            # Elixir/Erlang
-            '.ex', '.exs', '.erl',
-            # Haskell
-            '.hs',
-            # R
-            '.r', '.R',
-        ]
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    dir_key = (st.st_dev, st.st_ino)
+                    if dir_key in seen_dirs:
+                        continue
+                    seen_dirs.add(dir_key)
+                    child_entries, child_shown = open_dir(entry.path, child_tree)
+                    stack.append([
+                        child_entries, child_shown,
+                        prefix + ('    ' if last else '│   '), depth + 1,
+                        child_tree, child_stats,
+                        child_stats and name not in LANGUAGE_IGNORE_DIRS,
+                        name if depth == 1 else None,
+                    ])
+                continue
+
+            if rel_dir is not None and name in ENTRY_FILES:
+                found_entries.add((rel_dir, name))
+
+            if not count_stats:
+                continue
+            file_count += 1
+            try:
+                total_size += entry.stat(follow_symlinks=False).st_size
+            except OSError:
+                pass
+            if count_lang:
+                # rpartition instead of splitext: no dot (or only a leading
+                # one, like .bashrc) leaves an empty head
+                head, _, ext = name.rpartition('.')
+                if not head:
+                    continue
+                ext = '.' + ext.lower()
+                if ext in SUPPORTED_EXTENSIONS:
+                    ext_histogram[ext] = ext_histogram.get(ext, 0) + 1
+
+        if not tree_done:
+            tree_lines.append('')
+            tree_lines.append(f"{tree_dirs} director{'y' if tree_dirs == 1 else 'ies'}, "
+                              f"{tree_files} file{'' if tree_files == 1 else 's'}")
+        tree_output = '\n'.join(tree_lines) + '\n'
+
+        entry_points = []
+        for subdir in ('',) + ENTRY_POINT_SUBDIRS:
+            for f, purpose in ENTRY_FILES.items():
+                if (subdir, f) in found_entries:
+                    entry_points.append({'file': f'{subdir}/{f}' if subdir else f, 'purpose': purpose})
+
+        return tree_output, file_count, total_size // 1024, ext_histogram, entry_points
 
+    def _read_file_if_exists(self, path: str, max_size: int = 10000) -> Optional[str]:
+        """Read up to max_size bytes of a file, or None if it can't be opened"""
+        # Just open it: exists() + isfile() + open() was three syscalls
         try:
-            for root, dirs, files in os.walk(path):
-                dirs[:] = [d for d in dirs if d not in ['__pycache__', 'node_modules', '.git', 'venv', '.venv', 'vendor', 'bin', 'obj']]
-                for f in files:
-                    ext = os.path.splitext(f)[1].lower()
-                    if ext in supported_extensions:
-                        extensions[ext] = extensions.get(ext, 0) + 1
-        except:
-            pass
-
-        if not extensions:
+            with open(path, 'rb') as f:
+                return f.read(max_size).decode('utf-8', 'ignore')
+        except OSError:  # missing, a directory, unreadable, ...
+            return None
+
+    def _detect_language(self, ext_histogram: Dict[str, int]) -> str:
+        """Detect primary programming language from a _scan_project extension histogram"""
+        if not ext_histogram:
             return 'unknown'
 
-        lang_map = {
-            # Web
-            '.html': 'HTML', '.htm': 'HTML', '.css': 'CSS',
-            '.scss': 'SCSS', '.sass': 'Sass', '.less': 'Less',
-            # JavaScript/TypeScript
-            '.js': 'JavaScript', '.ts': 'TypeScript', '.jsx': 'React',
-            '.tsx': 'React/TypeScript', '.mjs': 'JavaScript', '.cjs': 'JavaScript',
-            '.vue': 'Vue', '.svelte': 'Svelte',
-            # Python
-            '.py': 'Python', '.pyx': 'Cython', '.pyw': 'Python',
-            # PHP
-            '.php': 'PHP', '.phtml': 'PHP',
-            # C/C++
-            '.c': 'C', '.h': 'C', '.cpp': 'C++', '.hpp': 'C++',
-            '.cc': 'C++', '.cxx': 'C++', '.hxx': 'C++', '.c++': 'C++', '.h++': 'C++',
-            # C#
-            '.cs': 'C#',
-            # Java/Kotlin
-            '.java': 'Java', '.kt': 'Kotlin', '.kts': 'Kotlin',
-            # Go
-            '.go': 'Go',
-            # Rust
-            '.rs': 'Rust',
-            # Ruby
-            '.rb': 'Ruby', '.erb': 'Ruby/ERB',
-            # Swift/Objective-C
-            '.swift': 'Swift', '.m': 'Objective-C', '.mm': 'Objective-C++',
-            # Dart/Flutter
-            '.dart': 'Dart',
-            # Lua
-            '.lua': 'Lua',
-            # Perl
-            '.pl': 'Perl', '.pm': 'Perl',
-            # Shell
-            '.sh': 'Shell', '.bash': 'Bash', '.zsh': 'Zsh',
-            # SQL
-            '.sql': 'SQL',
-            # Scala
-            '.scala': 'Scala',
-            # Elixir/Erlang
-            '.ex': 'Elixir', '.exs': 'Elixir', '.erl': 'Erlang',
-            # Haskell
-            '.hs': 'Haskell',
-            # R
-            '.r': 'R', '.R': 'R',
-        }
+        top_ext = max(ext_histogram, key=ext_histogram.get)
+        return LANG_MAP.get(top_ext, top_ext)
 
-        top_ext = max(extensions, key=extensions.get)
-        return lang_map.get(top_ext, top_ext)
-
-    def _detect_entry_points(self, path: str) -> List[Dict]:
-        """Detect common entry points"""
-        entry_files = {
-            # Web
-            'index.html': 'Web entry point',
-            'index.htm': 'Web entry point',
-            'index.php': 'PHP entry point',
-            # Python
-            'app.py': 'Python app entry',
-            'main.py': 'Python main entry',
-            'server.py': 'Python server entry',
-            'manage.py': 'Django management',
-            'wsgi.py': 'WSGI entry',
-            'asgi.py': 'ASGI entry',
-            '__main__.py': 'Python package entry',
-            # JavaScript/TypeScript
-            'index.js': 'JavaScript entry',
-            'index.ts': 'TypeScript entry',
-            'app.js': 'JavaScript app entry',
-            'app.ts': 'TypeScript app entry',
-            'server.js': 'Node.js server',
-            'server.ts': 'Node.js server (TS)',
-            # C/C++
-            'main.c': 'C entry point',
-            'main.cpp': 'C++ entry point',
-            'main.cc': 'C++ entry point',
-            # C#
-            'Program.cs': 'C# entry point',
-            'Startup.cs': 'ASP.NET startup',
-            # Java
-            'Main.java': 'Java entry point',
-            'Application.java': 'Java/Spring entry',
-            # Go
-            'main.go': 'Go entry point',
-            # Rust
-            'main.rs': 'Rust entry point',
-            'lib.rs': 'Rust library entry',
-            # Ruby
-            'app.rb': 'Ruby app entry',
-            'config.ru': 'Rack config',
-            # Swift
-            'main.swift': 'Swift entry point',
-            'AppDelegate.swift': 'iOS app delegate',
-            # Dart/Flutter
-            'main.dart': 'Dart/Flutter entry',
-            # Kotlin
-            'Main.kt': 'Kotlin entry point',
-            'Application.kt': 'Kotlin app entry',
-        }
-        found = []
+    def _root_files(self, project_path: str) -> Dict[str, os.DirEntry]:
+        """Non-directory entries of the project root, from a single scandir"""
         try:
-            for f, purpose in entry_files.items():
-                fp = os.path.join(path, f)
-                if os.path.exists(fp):
-                    found.append({'file': f, 'purpose': purpose})
-
-            # Also check src/ and app/ subdirectories
-            for subdir in ['src', 'app', 'lib']:
-                subpath = os.path.join(path, subdir)
-                if os.path.isdir(subpath):
-                    for f, purpose in entry_files.items():
-                        fp = os.path.join(subpath, f)
-                        if os.path.exists(fp):
-                            found.append({'file': f'{subdir}/{f}', 'purpose': purpose})
-        except:
-            pass
-        return found
-
-    def _detect_tech_stack(self, project_path: str, requirements: str = None, package_json: str = None) -> List[str]:
+            with os.scandir(project_path) as it:
+                return {e.name: e for e in it if not e.is_dir()}
+        except OSError:
+            return {}
+
+    def _read_manifests(self, project_path: str, root_files: Dict[str, os.DirEntry] = None) -> Dict[str, str]:
+        """Read the MANIFEST_FILES present in the project root, concurrently"""
+        if root_files is None:
+            root_files = self._root_files(project_path)
+        names = [name for name in MANIFEST_FILES if name in root_files]
+        if not names:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(names)) as executor:
+            contents = executor.map(lambda name: self._read_file_if_exists(root_files[name].path, MANIFEST_MAX_SIZE), names)
+        return {name: content for name, content in zip(names, contents) if content is not None}
+
+    def _detect_tech_stack(self, project_path: str, requirements: str = None, package_json: str = None,
+                           manifests: Dict[str, str] = None,
+                           root_files: Dict[str, os.DirEntry] = None) -> List[str]:
         """Detect tech stack from dependency files and project structure"""
-        stack = []
+        stack = {}  # Ordered set: first detection wins the position
+        if root_files is None:
+            root_files = self._root_files(project_path) if project_path else {}
+        if manifests is None:
+            manifests = self._read_manifests(project_path, root_files) if project_path else {}
+        if requirements is None:
+            requirements = manifests.get('requirements.txt')
+        if package_json is None:
+            package_json = manifests.get('package.json')
 
         # Python (requirements.txt, Pipfile, pyproject.toml)
         if requirements:
-            if 'flask' in requirements.lower():
-                stack.append('Flask')
-            if 'django' in requirements.lower():
-                stack.append('Django')
-            if 'fastapi' in requirements.lower():
-                stack.append('FastAPI')
-            if 'sqlalchemy' in requirements.lower():
-                stack.append('SQLAlchemy')
-            if 'pytest' in requirements.lower():
-                stack.append('pytest')
-            if 'numpy' in requirements.lower():
-                stack.append('NumPy')
-            if 'pandas' in requirements.lower():
-                stack.append('Pandas')
-            if 'tensorflow' in requirements.lower():
-                stack.append('TensorFlow')
-            if 'pytorch' in requirements.lower() or 'torch' in requirements.lower():
-                stack.append('PyTorch')
+            stack.update(dict.fromkeys(match_signatures('requirements.txt', requirements)))
 
         # JavaScript/Node (package.json)
         if package_json:
             try:
-                pkg = json.loads(package_json)
+                pkg = parse_json(package_json)
                 deps = {**pkg.get('dependencies', {}), **pkg.get('devDependencies', {})}
                 if 'react' in deps:
-                    stack.append('React')
+                    stack['React'] = None
                 if 'vue' in deps:
-                    stack.append('Vue')
+                    stack['Vue'] = None
                 if 'angular' in deps or '@angular/core' in deps:
-                    stack.append('Angular')
+                    stack['Angular'] = None
                 if 'svelte' in deps:
-                    stack.append('Svelte')
+                    stack['Svelte'] = None
                 if 'express' in deps:
-                    stack.append('Express')
+                    stack['Express'] = None
                 if 'next' in deps:
-                    stack.append('Next.js')
+                    stack['Next.js'] = None
                 if 'nuxt' in deps:
-                    stack.append('Nuxt')
+                    stack['Nuxt'] = None
                 if 'nestjs' in deps or '@nestjs/core' in deps:
-                    stack.append('NestJS')
+                    stack['NestJS'] = None
                 if 'electron' in deps:
-                    stack.append('Electron')
+                    stack['Electron'] = None
                 if 'tailwindcss' in deps:
-                    stack.append('Tailwind CSS')
+                    stack['Tailwind CSS'] = None
                 if 'bootstrap' in deps:
-                    stack.append('Bootstrap')
+                    stack['Bootstrap'] = None
                 if 'jquery' in deps:
-                    stack.append('jQuery')
+                    stack['jQuery'] = None
             except:
                 pass
 
@@ -611,157 +1071,119 @@ class SmartContextManager:
         if project_path:
             try:
                 # PHP (composer.json)
-                composer_path = os.path.join(project_path, 'composer.json')
-                if os.path.exists(composer_path):
-                    with open(composer_path, 'r') as f:
-                        composer = json.load(f)
-                        require = {**composer.get('require', {}), **composer.get('require-dev', {})}
-                        if 'laravel/framework' in require:
-                            stack.append('Laravel')
-                        if 'symfony/symfony' in require or any('symfony/' in k for k in require):
-                            stack.append('Symfony')
-                        if 'codeigniter4/framework' in require:
-                            stack.append('CodeIgniter')
-                        if 'slim/slim' in require:
-                            stack.append('Slim')
+                if 'composer.json' in manifests:
+                    composer = parse_json(manifests['composer.json'])
+                    require = {**composer.get('require', {}), **composer.get('require-dev', {})}
+                    if 'laravel/framework' in require:
+                        stack['Laravel'] = None
+                    if 'symfony/symfony' in require or any('symfony/' in k for k in require):
+                        stack['Symfony'] = None
+                    if 'codeigniter4/framework' in require:
+                        stack['CodeIgniter'] = None
+                    if 'slim/slim' in require:
+                        stack['Slim'] = None
 
                 # C# (.csproj)
-                for f in os.listdir(project_path):
+                for f, entry in root_files.items():
                     if f.endswith('.csproj'):
-                        stack.append('.NET')
-                        csproj_path = os.path.join(project_path, f)
-                        with open(csproj_path, 'r') as pf:
-                            content = pf.read().lower()
-                            if 'microsoft.aspnetcore' in content:
-                                stack.append('ASP.NET Core')
-                            if 'microsoft.entityframeworkcore' in content:
-                                stack.append('Entity Framework')
-                            if 'blazor' in content:
-                                stack.append('Blazor')
+                        stack['.NET'] = None
+                        with open(entry.path, 'r') as pf:
+                            stack.update(dict.fromkeys(match_signatures('.csproj', pf.read())))
                         break
 
                 # Java (pom.xml, build.gradle)
-                pom_path = os.path.join(project_path, 'pom.xml')
-                if os.path.exists(pom_path):
-                    stack.append('Maven')
-                    with open(pom_path, 'r') as f:
-                        content = f.read().lower()
-                        if 'spring-boot' in content:
-                            stack.append('Spring Boot')
-                        if 'spring-framework' in content:
-                            stack.append('Spring')
-
-                gradle_path = os.path.join(project_path, 'build.gradle')
-                if os.path.exists(gradle_path):
-                    stack.append('Gradle')
-                    with open(gradle_path, 'r') as f:
-                        content = f.read().lower()
-                        if 'spring-boot' in content:
-                            stack.append('Spring Boot')
-                        if 'android' in content:
-                            stack.append('Android')
+                if 'pom.xml' in manifests:
+                    stack['Maven'] = None
+                    stack.update(dict.fromkeys(match_signatures('pom.xml', manifests['pom.xml'])))
+
+                if 'build.gradle' in manifests:
+                    stack['Gradle'] = None
+                    stack.update(dict.fromkeys(match_signatures('build.gradle', manifests['build.gradle'])))
 
                 # Go (go.mod)
-                go_mod_path = os.path.join(project_path, 'go.mod')
-                if os.path.exists(go_mod_path):
-                    stack.append('Go Modules')
-                    with open(go_mod_path, 'r') as f:
-                        content = f.read().lower()
-                        if 'gin-gonic' in content:
-                            stack.append('Gin')
-                        if 'echo' in content:
-                            stack.append('Echo')
-                        if 'fiber' in content:
-                            stack.append('Fiber')
+                if 'go.mod' in manifests:
+                    stack['Go Modules'] = None
+                    stack.update(dict.fromkeys(match_signatures('go.mod', manifests['go.mod'])))
 
                 # Rust (Cargo.toml)
-                cargo_path = os.path.join(project_path, 'Cargo.toml')
-                if os.path.exists(cargo_path):
-                    stack.append('Cargo')
-                    with open(cargo_path, 'r') as f:
-                        content = f.read().lower()
-                        if 'actix-web' in content:
-                            stack.append('Actix')
-                        if 'rocket' in content:
-                            stack.append('Rocket')
-                        if 'tokio' in content:
-                            stack.append('Tokio')
+                if 'Cargo.toml' in manifests:
+                    stack['Cargo'] = None
+                    # Dependency table keys when the manifest parses, else a substring scan
+                    crates = cargo_dependencies(manifests['Cargo.toml'])
+                    if crates:
+                        stack.update(dict.fromkeys(tag for crate, tag in FILE_SIGNATURES['Cargo.toml'].items() if crate in crates))
+                    else:
+                        stack.update(dict.fromkeys(match_signatures('Cargo.toml', manifests['Cargo.toml'])))
 
                 # C/C++ (CMakeLists.txt, Makefile)
-                cmake_path = os.path.join(project_path, 'CMakeLists.txt')
-                if os.path.exists(cmake_path):
-                    stack.append('CMake')
+                if 'CMakeLists.txt' in root_files:
+                    stack['CMake'] = None
 
-                makefile_path = os.path.join(project_path, 'Makefile')
-                if os.path.exists(makefile_path):
-                    stack.append('Make')
+                if 'Makefile' in root_files:
+                    stack['Make'] = None
 
                 # Flutter/Dart (pubspec.yaml)
-                pubspec_path = os.path.join(project_path, 'pubspec.yaml')
-                if os.path.exists(pubspec_path):
-                    stack.append('Flutter/Dart')
+                if 'pubspec.yaml' in root_files:
+                    stack['Flutter/Dart'] = None
 
                 # Ruby (Gemfile)
-                gemfile_path = os.path.join(project_path, 'Gemfile')
-                if os.path.exists(gemfile_path):
-                    with open(gemfile_path, 'r') as f:
-                        content = f.read().lower()
-                        if 'rails' in content:
-                            stack.append('Ruby on Rails')
-                        if 'sinatra' in content:
-                            stack.append('Sinatra')
+                if 'Gemfile' in manifests:
+                    stack.update(dict.fromkeys(match_signatures('Gemfile', manifests['Gemfile'])))
 
                 # Docker
-                if os.path.exists(os.path.join(project_path, 'Dockerfile')):
-                    stack.append('Docker')
-                if os.path.exists(os.path.join(project_path, 'docker-compose.yml')) or \
-                   os.path.exists(os.path.join(project_path, 'docker-compose.yaml')):
-                    stack.append('Docker Compose')
+                if 'Dockerfile' in root_files:
+                    stack['Docker'] = None
+                if 'docker-compose.yml' in root_files or 'docker-compose.yaml' in root_files:
+                    stack['Docker Compose'] = None
 
             except Exception:
                 pass
 
-        return list(set(stack))  # Remove duplicates
+        return list(stack)
 
     # ═══════════════════════════════════════════════════════════════════════════
     # PROJECT KNOWLEDGE
     # ═══════════════════════════════════════════════════════════════════════════
 
     def get_project_knowledge(self, project_id: int) -> Optional[Dict]:
-        """Get learned project knowledge"""
+        """Get learned project knowledge (cached for LOOKUP_CACHE_TTL seconds)"""
+        cached = self._cache_get(('project_knowledge', project_id))
+        if cached is not _CACHE_MISS:
+            return cached
         try:
-            conn = self.get_db()
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute("""
-                SELECT * FROM project_knowledge WHERE project_id = %s
-            """, (project_id,))
-            knowledge = cursor.fetchone()
-            cursor.close()
-            conn.close()
-
-            if knowledge:
-                json_fields = ['coding_patterns', 'naming_conventions', 'file_organization',
-                              'known_gotchas', 'error_solutions', 'performance_notes',
-                              'architecture_decisions', 'api_conventions', 'testing_patterns',
-                              'ci_cd_notes', 'environment_notes', 'security_considerations',
-                              'sensitive_files', 'learned_from_tickets']
-                for field in json_fields:
-                    if knowledge.get(field) and isinstance(knowledge[field], str):
-                        try:
-                            knowledge[field] = json.loads(knowledge[field])
-                        except:
-                            pass
-            return knowledge
+            with self._db(dictionary=True) as (conn, cursor):
+                return self._load_project_knowledge(cursor, project_id)
         except Exception as e:
             self.log(f"Error getting project knowledge: {e}", "ERROR")
             return None
 
+    def _load_project_knowledge(self, cursor, project_id: int) -> Optional[Dict]:
+        cursor.execute("""
+            SELECT coding_patterns, known_gotchas, error_solutions, architecture_decisions
+            FROM project_knowledge WHERE project_id = %s LIMIT 1
+        """, (project_id,))
+        knowledge = cursor.fetchone()
+        if knowledge:
+            decode_json_fields(knowledge, PROJECT_KNOWLEDGE_JSON_FIELDS)
+        self._cache_put(('project_knowledge', project_id), knowledge)
+        return knowledge
+
     def build_project_knowledge_context(self, project_id: int) -> str:
         """Build project knowledge context string for system prompt"""
         knowledge = self.get_project_knowledge(project_id)
         if not knowledge:
             return ""
 
+        # Same content hash as last time -> same text (last_updated only has
+        # second resolution, so the rendered fields themselves are the version)
+        version = hashlib.blake2b(
+            to_json([knowledge.get(field) for field in PROJECT_KNOWLEDGE_JSON_FIELDS]).encode(),
+            digest_size=8
+        ).digest()
+        cached = self._context_cache.get(('knowledge', project_id))
+        if cached and cached[0] == version:
+            return cached[1]
+
         parts = ["\n=== PROJECT KNOWLEDGE ==="]
 
         if knowledge.get('coding_patterns'):
@@ -789,45 +1211,42 @@ class SmartContextManager:
                         parts.append(f"- Decision: {dec.get('decision', '?')} (Reason: {dec.get('reason', '?')})")
 
         parts.append("=========================\n")
-        return '\n'.join(parts) if len(parts) > 2 else ""
+        context = '\n'.join(parts) if len(parts) > 2 else ""
+        self._context_cache[('knowledge', project_id)] = (version, context)
+        return context
 
     def add_project_knowledge(self, project_id: int, knowledge_type: str, value: Any):
-        """Add learned knowledge to project"""
+        """Add learned knowledge to project (skipped if an equal item is already stored)"""
+        if knowledge_type not in KNOWLEDGE_LIST_FIELDS:
+            self.log(f"Error adding project knowledge: unknown knowledge type {knowledge_type!r}", "ERROR")
+            return
         try:
-            conn = self.get_db()
-            cursor = conn.cursor(dictionary=True)
-
-            # Get existing knowledge
-            cursor.execute("SELECT * FROM project_knowledge WHERE project_id = %s", (project_id,))
-            existing = cursor.fetchone()
-
-            if existing:
-                # Update existing
-                current = existing.get(knowledge_type)
-                if current:
-                    try:
-                        current_list = json.loads(current) if isinstance(current, str) else current
-                    except:
-                        current_list = []
-                else:
-                    current_list = []
-
-                if isinstance(current_list, list):
-                    if value not in current_list:
-                        current_list.append(value)
-                        cursor.execute(f"""
-                            UPDATE project_knowledge SET {knowledge_type} = %s, last_updated = NOW()
-                            WHERE project_id = %s
-                        """, (json.dumps(current_list), project_id))
-            else:
-                # Create new
-                cursor.execute("""
-                    INSERT INTO project_knowledge (project_id, {}) VALUES (%s, %s)
-                """.format(knowledge_type), (project_id, json.dumps([value])))
-
-            conn.commit()
-            cursor.close()
-            conn.close()
+            # Compare in decoded form: JSON_CONTAINS tests containment, so an
+            # object that is a subset of a stored one would count as present
+            item = parse_json(to_json(value))
+            with self._db(dictionary=True) as (conn, cursor):
+                # The row lock serialises concurrent appends to this project
+                conn.start_transaction()
+                cursor.execute(f"""
+                    SELECT {knowledge_type} FROM project_knowledge
+                    WHERE project_id = %s FOR UPDATE
+                """, (project_id,))
+                row = cursor.fetchone() or {}
+                decode_json_fields(row, (knowledge_type,))
+                items = row.get(knowledge_type)
+                if not isinstance(items, list):
+                    items = []
+                if item in items:
+                    conn.rollback()
+                    return
+                items.append(item)
+                cursor.execute(f"""
+                    INSERT INTO project_knowledge (project_id, {knowledge_type})
+                    VALUES (%s, %s)
+                    ON DUPLICATE KEY UPDATE {knowledge_type} = VALUES({knowledge_type}), last_updated = NOW()
+                """, (project_id, to_json(items)))
+                conn.commit()
+            self._cache_invalidate(('project_knowledge', project_id))
         except Exception as e:
             self.log(f"Error adding project knowledge: {e}", "ERROR")
 
@@ -837,34 +1256,30 @@ class SmartContextManager:
 
     def get_extraction(self, ticket_id: int) -> Optional[Dict]:
         """Get latest conversation extraction for ticket"""
+        cached = self._cache_get(('extraction', ticket_id))
+        if cached is not _CACHE_MISS:
+            return cached
         try:
-            conn = self.get_db()
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute("""
-                SELECT * FROM conversation_extractions
-                WHERE ticket_id = %s
-                ORDER BY created_at DESC LIMIT 1
-            """, (ticket_id,))
-            extraction = cursor.fetchone()
-            cursor.close()
-            conn.close()
-
-            if extraction:
-                json_fields = ['decisions', 'problems_solved', 'files_modified',
-                              'blocking_issues', 'waiting_for_user', 'external_dependencies',
-                              'key_code_snippets', 'important_variables', 'tests_status',
-                              'error_patterns', 'important_notes']
-                for field in json_fields:
-                    if extraction.get(field) and isinstance(extraction[field], str):
-                        try:
-                            extraction[field] = json.loads(extraction[field])
-                        except:
-                            pass
-            return extraction
+            with self._db(dictionary=True) as (conn, cursor):
+                return self._load_extraction(cursor, ticket_id)
         except Exception as e:
             self.log(f"Error getting extraction: {e}", "ERROR")
             return None
 
+    def _load_extraction(self, cursor, ticket_id: int) -> Optional[Dict]:
+        cursor.execute("""
+            SELECT id, important_notes, decisions, problems_solved, files_modified,
+                   current_status, blocking_issues, error_patterns
+            FROM conversation_extractions
+            WHERE ticket_id = %s
+            ORDER BY created_at DESC LIMIT 1
+        """, (ticket_id,))
+        extraction = cursor.fetchone()
+        if extraction:
+            decode_json_fields(extraction, EXTRACTION_JSON_FIELDS)
+        self._cache_put(('extraction', ticket_id), extraction, EXTRACTION_CACHE_TTL)
+        return extraction
+
     def build_extraction_context(self, ticket_id: int) -> str:
         """Build extraction context string for system prompt"""
         extraction = self.get_extraction(ticket_id)
@@ -921,52 +1336,56 @@ class SmartContextManager:
         return '\n'.join(parts)
 
     def _extract_with_haiku(self, conversation_text: List[str], files: List[str]) -> Optional[Dict]:
-        """Use Claude Haiku to create intelligent extraction"""
-        try:
-            # Build prompt for Haiku
-            prompt = f"""Analyze this conversation and extract key information in JSON format.
+        """Use Claude Haiku to create intelligent extraction.
 
-CONVERSATION:
-{chr(10).join(conversation_text[-30:])}
-
-FILES MENTIONED: {', '.join(files[:20]) if files else 'None'}
-
-Respond with ONLY a JSON object (no markdown, no explanation):
-{{
-    "decisions": ["decision 1", "decision 2", ...],
-    "problems_solved": ["problem 1: solution", "problem 2: solution", ...],
-    "current_status": "Brief status of where things stand",
-    "key_info": "Most important technical details to remember (configs, values, patterns used)",
-    "important_notes": ["note 1", "note 2", ...]
-}}
-
-IMPORTANT_NOTES EXTRACTION:
-Extract any user instructions, warnings, rules, or things to always remember.
-Understand the SEMANTIC MEANING, not just keywords. Look for:
-- Explicit rules ("never do X", "always do Y")
-- Warnings about gotchas, pitfalls, or things to avoid
-- User preferences expressed strongly or repeatedly
-- Constraints or limitations the user mentioned
-- Things the user emphasized (via caps, repetition, or strong language)
-- Any instruction about HOW the AI should behave or work
+        Long conversations are split into windows of HAIKU_WINDOW_MESSAGES that
+        are extracted concurrently (each is a separate CLI subprocess) and then
+        merged; status and key info come from the most recent window.
+        """
+        recent = conversation_text[-HAIKU_WINDOW_MESSAGES * HAIKU_MAX_WINDOWS:]
+        windows = [recent[i:i + HAIKU_WINDOW_MESSAGES]
+                   for i in range(0, len(recent), HAIKU_WINDOW_MESSAGES)] or [[]]
+        if len(windows) == 1:
+            return self._extract_window_with_haiku(windows[0], files)
+
+        with ThreadPoolExecutor(max_workers=len(windows)) as executor:
+            results = list(executor.map(lambda w: self._extract_window_with_haiku(w, files), windows))
+        results = [r for r in results if isinstance(r, dict)]
+        if not results:
+            return None
 
-These notes will be shown to the AI in EVERY future conversation about this ticket.
+        merged = {key: unique_items(r.get(key) for r in results)
+                  for key in ('decisions', 'problems_solved', 'important_notes')}
+        for key in ('current_status', 'key_info'):
+            merged[key] = next((r[key] for r in reversed(results) if r.get(key)), '')
+        return merged
 
-Keep each item concise (under 100 chars). Focus on technical decisions and implementations."""
+    def _extract_window_with_haiku(self, conversation_text: List[str], files: List[str]) -> Optional[Dict]:
+        """Run one Haiku extraction over a window of conversation lines"""
+        try:
+            # Build prompt for Haiku around the pre-encoded static text
+            prompt = b''.join((
+                HAIKU_PROMPT_HEAD,
+                '\n'.join(conversation_text).encode('utf-8', errors='replace'),
+                HAIKU_PROMPT_FILES,
+                (', '.join(files[:20]) if files else 'None').encode('utf-8', errors='replace'),
+                HAIKU_PROMPT_TAIL,
+            ))
 
             # Call Claude Haiku using CLI
             result = subprocess.run(
                 ['/home/claude/.local/bin/claude', '--model', 'haiku', '--print'],
                 input=prompt,
                 capture_output=True,
-                text=True,
                 timeout=30,
                 cwd='/tmp'
             )
+            stdout = result.stdout.decode('utf-8', errors='replace')
+            stderr = result.stderr.decode('utf-8', errors='replace')
 
-            if result.returncode == 0 and result.stdout:
+            if result.returncode == 0 and stdout:
                 # Parse JSON response
-                response = result.stdout.strip()
+                response = stdout.strip()
                 # Remove markdown code blocks if present
                 if response.startswith('```'):
                     response = response.split('```')[1]
@@ -974,11 +1393,11 @@ Keep each item concise (under 100 chars). Focus on technical decisions and imple
                         response = response[4:]
                     response = response.strip()
 
-                extraction = json.loads(response)
+                extraction = parse_json(response)
                 self.log(f"Haiku extraction successful: {len(extraction.get('decisions', []))} decisions")
                 return extraction
             else:
-                self.log(f"Haiku extraction failed: {result.stderr[:200] if result.stderr else 'no output'}", "WARNING")
+                self.log(f"Haiku extraction failed: {stderr[:200] if stderr else 'no output'}", "WARNING")
                 return None
 
         except subprocess.TimeoutExpired:
@@ -998,23 +1417,24 @@ Keep each item concise (under 100 chars). Focus on technical decisions and imple
 
         try:
             # Build conversation text for summarization
-            conversation_text = []
+            # Only the tail that Haiku will see is kept (and formatted)
+            conversation_tail = deque(maxlen=HAIKU_WINDOW_MESSAGES * HAIKU_MAX_WINDOWS)
             files = set()
-            import re
 
             for msg in messages:
                 content = msg.get('content', '') or ''
                 role = msg.get('role', 'unknown')
 
                 if content and role in ['user', 'assistant']:
-                    conversation_text.append(f"[{role.upper()}]: {content[:2000]}")
+                    conversation_tail.append((role, content))
 
                     # Extract file references
-                    file_matches = re.findall(r'[\w./]+\.(py|js|ts|jsx|tsx|php|html|css|sql|json|yaml|yml|md)', content)
-                    files.update(file_matches)
+                    files.update(FILE_REFERENCE_RE.findall(content))
+
+            conversation_text = [f"[{role.upper()}]: {content[:2000]}" for role, content in conversation_tail]
 
             # Calculate tokens before
-            tokens_before = sum(self.count_tokens(m.get('content', '')) for m in messages)
+            tokens_before = sum(self.count_tokens_batch([m.get('content', '') for m in messages]))
 
             # Try to get intelligent extraction using Claude Haiku
             extraction_result = self._extract_with_haiku(conversation_text, list(files))
@@ -1034,46 +1454,46 @@ Keep each item concise (under 100 chars). Focus on technical decisions and imple
                 important_notes = []
 
             extraction_data = {
-                'decisions': json.dumps(decisions[:10]),
-                'problems_solved': json.dumps(problems[:10]),
-                'files_modified': json.dumps(list(files)[:20]),
+                'decisions': to_json(decisions[:10]),
+                'problems_solved': to_json(problems[:10]),
+                'files_modified': to_json(list(files)[:20]),
                 'current_status': current_status or f"Processed {len(messages)} messages",
-                'blocking_issues': json.dumps([]),
-                'waiting_for_user': json.dumps([]),
-                'key_code_snippets': json.dumps([key_info] if key_info else []),
-                'tests_status': json.dumps({}),
-                'error_patterns': json.dumps([]),
-                'important_notes': json.dumps(important_notes[:15]),
+                'blocking_issues': to_json([]),
+                'waiting_for_user': to_json([]),
+                'key_code_snippets': to_json([key_info] if key_info else []),
+                'tests_status': to_json({}),
+                'error_patterns': to_json([]),
+                'important_notes': to_json(important_notes[:15]),
                 'covers_msg_from_id': messages[0].get('id') if messages else None,
                 'covers_msg_to_id': messages[-1].get('id') if messages else None,
                 'messages_summarized': len(messages),
                 'tokens_before': tokens_before,
-                'tokens_after': self.count_tokens(json.dumps(decisions) + json.dumps(problems) + current_status)
+                'tokens_after': self.count_tokens(to_json(decisions) + to_json(problems) + current_status)
             }
 
-            # Save to database
-            conn = self.get_db()
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                INSERT INTO conversation_extractions
-                (ticket_id, decisions, problems_solved, files_modified, current_status,
-                 blocking_issues, waiting_for_user, key_code_snippets, tests_status, error_patterns,
-                 important_notes, covers_msg_from_id, covers_msg_to_id, messages_summarized, tokens_before, tokens_after)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                ticket_id, extraction_data['decisions'], extraction_data['problems_solved'],
-                extraction_data['files_modified'], extraction_data['current_status'],
-                extraction_data['blocking_issues'], extraction_data['waiting_for_user'],
-                extraction_data['key_code_snippets'], extraction_data['tests_status'],
-                extraction_data['error_patterns'], extraction_data['important_notes'],
-                extraction_data['covers_msg_from_id'], extraction_data['covers_msg_to_id'],
-                extraction_data['messages_summarized'], extraction_data['tokens_before'],
-                extraction_data['tokens_after']
-            ))
+            # Save to database; the extraction and the is_summarized flags land
+            # together (the pool is autocommit, so open the transaction explicitly)
+            with self._db() as (conn, cursor):
+                conn.start_transaction()
+                cursor.execute("""
+                    INSERT INTO conversation_extractions
+                    (ticket_id, decisions, problems_solved, files_modified, current_status,
+                     blocking_issues, waiting_for_user, key_code_snippets, tests_status, error_patterns,
+                     important_notes, covers_msg_from_id, covers_msg_to_id, messages_summarized, tokens_before, tokens_after)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """, (
+                    ticket_id, extraction_data['decisions'], extraction_data['problems_solved'],
+                    extraction_data['files_modified'], extraction_data['current_status'],
+                    extraction_data['blocking_issues'], extraction_data['waiting_for_user'],
+                    extraction_data['key_code_snippets'], extraction_data['tests_status'],
+                    extraction_data['error_patterns'], extraction_data['important_notes'],
+                    extraction_data['covers_msg_from_id'], extraction_data['covers_msg_to_id'],
+                    extraction_data['messages_summarized'], extraction_data['tokens_before'],
+                    extraction_data['tokens_after']
+                ))
 
-            # Mark messages as summarized
-            if messages:
+                # Mark exactly the extracted messages as summarized (history is
+                # ordered by created_at, so an id range could catch a kept message)
                 msg_ids = [m.get('id') for m in messages if m.get('id')]
                 if msg_ids:
                     placeholders = ','.join(['%s'] * len(msg_ids))
@@ -1082,17 +1502,19 @@ Keep each item concise (under 100 chars). Focus on technical decisions and imple
                         WHERE id IN ({placeholders})
                     """, msg_ids)
 
-            conn.commit()
-            cursor.close()
-            conn.close()
+                conn.commit()
+            self._cache_invalidate(('extraction', ticket_id))
 
             self.log(f"Extraction created: {tokens_before} tokens -> {extraction_data['tokens_after']} tokens")
 
-            # Update project_knowledge with learnings from this ticket
+            # Update project_knowledge with learnings from this ticket; only later
+            # turns read it, so it runs in the background (it logs its own errors)
             try:
-                self._update_project_knowledge_from_extraction(
-                    ticket_id, decisions, problems, important_notes
-                )
+                threading.Thread(
+                    target=self._update_project_knowledge_from_extraction,
+                    args=(ticket_id, decisions, problems, important_notes),
+                    name='knowledge-update', daemon=True
+                ).start()
             except Exception as e:
                 self.log(f"Warning: Could not update project knowledge: {e}", "WARNING")
 
@@ -1106,98 +1528,75 @@ Keep each item concise (under 100 chars). Focus on technical decisions and imple
                                                    problems: List, important_notes: List):
         """Update project_knowledge table with learnings from extraction"""
         try:
-            # Get project_id from ticket
-            conn = self.get_db()
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute("SELECT project_id FROM tickets WHERE id = %s", (ticket_id,))
-            ticket = cursor.fetchone()
-
-            if not ticket:
-                cursor.close()
-                conn.close()
-                return
-
-            project_id = ticket['project_id']
-
-            # Check if project_knowledge exists
-            cursor.execute("SELECT id FROM project_knowledge WHERE project_id = %s", (project_id,))
-            existing = cursor.fetchone()
-
-            if not existing:
-                # Create new project_knowledge record
-                cursor.execute("""
-                    INSERT INTO project_knowledge (project_id, known_gotchas, error_solutions,
-                                                   architecture_decisions, learned_from_tickets)
-                    VALUES (%s, %s, %s, %s, %s)
-                """, (
-                    project_id,
-                    json.dumps(important_notes[:10]) if important_notes else '[]',
-                    json.dumps(problems[:10]) if problems else '[]',
-                    json.dumps(decisions[:10]) if decisions else '[]',
-                    json.dumps([ticket_id])
-                ))
-                self.log(f"Created project_knowledge for project {project_id}")
-            else:
-                # Update existing - merge with existing data
+            with self._db(dictionary=True) as (conn, cursor):
+                # Ticket's project and its knowledge row (if any) in one query
                 cursor.execute("""
-                    SELECT known_gotchas, error_solutions, architecture_decisions, learned_from_tickets
-                    FROM project_knowledge WHERE project_id = %s
-                """, (project_id,))
+                    SELECT t.project_id, pk.id AS knowledge_id, pk.known_gotchas, pk.error_solutions,
+                           pk.architecture_decisions, pk.learned_from_tickets
+                    FROM tickets t
+                    LEFT JOIN project_knowledge pk ON pk.project_id = t.project_id
+                    WHERE t.id = %s
+                    LIMIT 1
+                """, (ticket_id,))
                 existing_data = cursor.fetchone()
 
-                # Parse existing JSON
-                def parse_json_field(field):
-                    if not field:
-                        return []
-                    if isinstance(field, str):
-                        try:
-                            return json.loads(field)
-                        except:
-                            return []
-                    return field if isinstance(field, list) else []
-
-                existing_gotchas = parse_json_field(existing_data.get('known_gotchas'))
-                existing_errors = parse_json_field(existing_data.get('error_solutions'))
-                existing_decisions = parse_json_field(existing_data.get('architecture_decisions'))
-                existing_tickets = parse_json_field(existing_data.get('learned_from_tickets'))
-
-                # Merge new data (avoid duplicates)
-                for note in (important_notes or [])[:10]:
-                    if note and note not in existing_gotchas:
-                        existing_gotchas.append(note)
-
-                for prob in (problems or [])[:10]:
-                    if prob and prob not in existing_errors:
-                        existing_errors.append(prob)
-
-                for dec in (decisions or [])[:10]:
-                    if dec and dec not in existing_decisions:
-                        existing_decisions.append(dec)
-
-                if ticket_id not in existing_tickets:
-                    existing_tickets.append(ticket_id)
-
-                # Keep last 20 items max
-                cursor.execute("""
-                    UPDATE project_knowledge SET
-                        known_gotchas = %s,
-                        error_solutions = %s,
-                        architecture_decisions = %s,
-                        learned_from_tickets = %s,
-                        last_updated = NOW()
-                    WHERE project_id = %s
-                """, (
-                    json.dumps(existing_gotchas[-20:]),
-                    json.dumps(existing_errors[-20:]),
-                    json.dumps(existing_decisions[-20:]),
-                    json.dumps(existing_tickets[-50:]),
-                    project_id
-                ))
-                self.log(f"Updated project_knowledge for project {project_id} from ticket {ticket_id}")
-
-            conn.commit()
-            cursor.close()
-            conn.close()
+                if not existing_data:
+                    return
+
+                project_id = existing_data['project_id']
+
+                if existing_data['knowledge_id'] is None:
+                    # Create new project_knowledge record
+                    cursor.execute("""
+                        INSERT INTO project_knowledge (project_id, known_gotchas, error_solutions,
+                                                       architecture_decisions, learned_from_tickets)
+                        VALUES (%s, %s, %s, %s, %s)
+                    """, (
+                        project_id,
+                        to_json(important_notes[:10]) if important_notes else '[]',
+                        to_json(problems[:10]) if problems else '[]',
+                        to_json(decisions[:10]) if decisions else '[]',
+                        to_json([ticket_id])
+                    ))
+                    self.log(f"Created project_knowledge for project {project_id}")
+                else:
+                    # Update existing - merge with existing data
+                    decode_json_fields(existing_data, KNOWLEDGE_MERGE_JSON_FIELDS)
+
+                    def as_list(value):
+                        return value if isinstance(value, list) else []
+
+                    existing_gotchas = as_list(existing_data['known_gotchas'])
+                    existing_errors = as_list(existing_data['error_solutions'])
+                    existing_decisions = as_list(existing_data['architecture_decisions'])
+                    existing_tickets = as_list(existing_data['learned_from_tickets'])
+
+                    # Merge new data (avoid duplicates)
+                    existing_gotchas = unique_items([existing_gotchas, [n for n in (important_notes or [])[:10] if n]])
+                    existing_errors = unique_items([existing_errors, [p for p in (problems or [])[:10] if p]])
+                    existing_decisions = unique_items([existing_decisions, [d for d in (decisions or [])[:10] if d]])
+                    existing_tickets = list(dict.fromkeys(existing_tickets + [ticket_id]))
+
+                    # Keep last 20 items max
+                    cursor.execute("""
+                        UPDATE project_knowledge SET
+                            known_gotchas = %s,
+                            error_solutions = %s,
+                            architecture_decisions = %s,
+                            learned_from_tickets = %s,
+                            last_updated = NOW()
+                        WHERE id = %s
+                    """, (
+                        to_json(existing_gotchas[-20:]),
+                        to_json(existing_errors[-20:]),
+                        to_json(existing_decisions[-20:]),
+                        to_json(existing_tickets[-50:]),
+                        existing_data['knowledge_id']
+                    ))
+                    self.log(f"Updated project_knowledge for project {project_id} from ticket {ticket_id}")
+
+                conn.commit()
+            self._cache_invalidate(('project_knowledge', project_id))
 
         except Exception as e:
             self.log(f"Error updating project knowledge: {e}", "ERROR")
@@ -1207,61 +1606,83 @@ Keep each item concise (under 100 chars). Focus on technical decisions and imple
     # ═══════════════════════════════════════════════════════════════════════════
 
     def get_smart_history(self, ticket_id: int) -> List[Dict]:
-        """Get conversation history - ONLY unsummarized messages"""
-        try:
-            conn = self.get_db()
-            cursor = conn.cursor(dictionary=True)
-
-            # Get ONLY unsummarized messages
-            cursor.execute("""
-                SELECT id, role, content, tool_name, tool_input, token_count, is_summarized
-                FROM conversation_messages
-                WHERE ticket_id = %s AND is_summarized = FALSE
-                ORDER BY created_at ASC
-            """, (ticket_id,))
-            unsummarized_messages = cursor.fetchall()
-            cursor.close()
-            conn.close()
-
-            if not unsummarized_messages:
-                return []
-
-            # Calculate/update token counts if needed
-            for msg in unsummarized_messages:
-                if not msg.get('token_count') or msg['token_count'] == 0:
-                    msg['token_count'] = self.count_tokens(msg.get('content', ''))
-
-            # Calculate total tokens of unsummarized
-            total_tokens = sum(m.get('token_count', 0) for m in unsummarized_messages)
-
-            # If under threshold, return all unsummarized
-            if total_tokens < EXTRACTION_THRESHOLD:
-                return unsummarized_messages
-
-            # Over threshold - need to extract older messages
-            # Select recent messages within budget
-            recent = []
-            recent_tokens = 0
-
-            for msg in reversed(unsummarized_messages):
-                msg_tokens = msg.get('token_count', 0)
+        """Get conversation history - ONLY unsummarized messages.
 
+        Budgeting runs on (id, token_count) rows; message bodies are only
+        fetched for the messages that are actually returned or extracted.
+        """
+        try:
+            with self._db(dictionary=True) as (conn, cursor):
+                # Get ONLY unsummarized messages (metadata first)
+                cursor.execute("""
+                    SELECT id, token_count
+                    FROM conversation_messages
+                    WHERE ticket_id = %s AND is_summarized = FALSE
+                    ORDER BY created_at ASC, id ASC
+                """, (ticket_id,))
+                message_meta = cursor.fetchall()
+                if not message_meta:
+                    return []
+
+                # Count each message once: missing counts are tokenized here and
+                # stored, so later turns only add up the stored column
+                token_counts = {}
+                uncounted_ids = []
+                for meta in message_meta:
+                    # 0 is the column default, i.e. not counted yet
+                    if meta['token_count']:
+                        token_counts[meta['id']] = meta['token_count']
+                    else:
+                        uncounted_ids.append(meta['id'])
+
+                if uncounted_ids:
+                    rows = self._fetch_messages(cursor, "id, content", uncounted_ids)
+                    counts = self.count_tokens_batch([row['content'] for row in rows])
+                    counted = []
+                    for row, token_count in zip(rows, counts):
+                        token_counts[row['id']] = token_count
+                        if token_count:  # an empty message would store 0 again
+                            counted.append((token_count, row['id']))
+                    if counted:
+                        cursor.executemany(
+                            "UPDATE conversation_messages SET token_count = %s WHERE id = %s",
+                            counted
+                        )
+                        conn.commit()
+
+                message_ids = [meta['id'] for meta in message_meta]
+                total_tokens = sum(token_counts.get(msg_id, 0) for msg_id in message_ids)
+
+                # If under threshold, return all unsummarized
+                over_threshold = total_tokens >= EXTRACTION_THRESHOLD
+                if not over_threshold:
+                    recent_ids, older_ids = message_ids, []
+                else:
+                    # Over threshold - keep the newest messages within budget
+                    # (oversized ones count as truncated) and extract the rest
+                    recent_tokens = 0
+                    cutoff = len(message_ids)
+                    for msg_id in reversed(message_ids):
+                        msg_tokens = min(token_counts.get(msg_id, 0), MAX_SINGLE_MESSAGE)
+                        if recent_tokens + msg_tokens > RECENT_TOKENS_BUDGET:
+                            break
+                        recent_tokens += msg_tokens
+                        cutoff -= 1
+                    recent_ids, older_ids = message_ids[cutoff:], message_ids[:cutoff]
+
+                columns = "id, role, content, tool_name, tool_input, token_count, is_summarized"
+                recent = self._fetch_messages(cursor, columns, recent_ids)
+                older_messages = self._fetch_messages(cursor, columns, older_ids)
+
+            for msg in recent:
+                msg['token_count'] = token_counts.get(msg['id'], msg['token_count'])
                 # Truncate very large messages
-                if msg_tokens > MAX_SINGLE_MESSAGE:
+                if over_threshold and msg['token_count'] > MAX_SINGLE_MESSAGE:
                     msg['content'] = self.truncate_message(msg.get('content', ''), MAX_SINGLE_MESSAGE)
-                    msg_tokens = MAX_SINGLE_MESSAGE
-
-                if recent_tokens + msg_tokens > RECENT_TOKENS_BUDGET:
-                    break
-
-                recent.insert(0, msg)
-                recent_tokens += msg_tokens
 
             # Extract older unsummarized messages
-            if len(recent) < len(unsummarized_messages):
-                older_messages = unsummarized_messages[:-len(recent)] if recent else unsummarized_messages
-                if older_messages:
-                    self.create_extraction(ticket_id, older_messages)
+            if older_messages:
+                self.create_extraction(ticket_id, older_messages)
 
             return recent
 
@@ -1269,17 +1690,27 @@ Keep each item concise (under 100 chars). Focus on technical decisions and imple
             self.log(f"Error getting smart history: {e}", "ERROR")
             return []
 
+    @staticmethod
+    def _fetch_messages(cursor, columns: str, message_ids: List[int]) -> List[Dict]:
+        """Fetch the given conversation_messages rows in conversation order"""
+        if not message_ids:
+            return []
+        placeholders = ','.join(['%s'] * len(message_ids))
+        cursor.execute(f"""
+            SELECT {columns} FROM conversation_messages
+            WHERE id IN ({placeholders})
+            ORDER BY created_at ASC, id ASC
+        """, message_ids)
+        return cursor.fetchall()
+
     def update_message_token_count(self, message_id: int, token_count: int):
         """Update token count for a message"""
         try:
-            conn = self.get_db()
-            cursor = conn.cursor()
-            cursor.execute("""
-                UPDATE conversation_messages SET token_count = %s WHERE id = %s
-            """, (token_count, message_id))
-            conn.commit()
-            cursor.close()
-            conn.close()
+            with self._db() as (conn, cursor):
+                cursor.execute("""
+                    UPDATE conversation_messages SET token_count = %s WHERE id = %s
+                """, (token_count, message_id))
+                conn.commit()
         except Exception as e:
             self.log(f"Error updating token count: {e}", "ERROR")
 
@@ -1292,153 +1723,104 @@ Keep each item concise (under 100 chars). Focus on technical decisions and imple
         project_type = ticket.get('project_type', '')
         android_device_type = ticket.get('android_device_type', 'none')
 
-        mobile_types = ['capacitor', 'react_native', 'flutter', 'native_android']
-        if project_type not in mobile_types or android_device_type == 'none':
+        if project_type not in ANDROID_PROJECT_TYPES or android_device_type == 'none':
             return ""
 
-        parts = ["\n=== ANDROID DEVELOPMENT ==="]
-        parts.append(f"Project Type: {project_type}")
-
-        if android_device_type == 'server':
-            parts.append("""
-Android Emulator: Server-based (Redroid)
-- ADB device: localhost:5556
-- Use 'adb connect localhost:5556' if disconnected
-- Install APK: adb -s localhost:5556 install app.apk
-- View logs: adb -s localhost:5556 logcat
-- Screen capture: adb -s localhost:5556 exec-out screencap -p > screen.png
-- The emulator runs in Docker, accessible via web interface""")
-        elif android_device_type == 'remote':
-            remote_host = ticket.get('android_remote_host', '')
-            remote_port = ticket.get('android_remote_port', 5555)
-            parts.append(f"""
-Android Device: Remote ADB
-- ADB device: {remote_host}:{remote_port}
-- Connect: adb connect {remote_host}:{remote_port}
-- Install APK: adb -s {remote_host}:{remote_port} install app.apk
-- View logs: adb -s {remote_host}:{remote_port} logcat""")
-
-        # Framework-specific guidance
-        if project_type == 'capacitor':
-            parts.append("""
-Capacitor.js Commands:
-- Build: npx cap build android
-- Sync: npx cap sync android
-- Open Android Studio: npx cap open android
-- Run on device: npx cap run android""")
-        elif project_type == 'react_native':
-            parts.append("""
-React Native Commands:
-- Start Metro: npx react-native start
-- Run Android: npx react-native run-android
-- Build APK: cd android && ./gradlew assembleRelease
-- Logs: npx react-native log-android""")
-        elif project_type == 'flutter':
-            parts.append("""
-Flutter Commands:
-- Run: flutter run
-- Build APK: flutter build apk
-- Build App Bundle: flutter build appbundle
-- Logs: flutter logs""")
-        elif project_type == 'native_android':
-            parts.append("""
-Android Native Commands:
-- Build: ./gradlew build
-- Install: ./gradlew installDebug
-- Run tests: ./gradlew test
-- Clean: ./gradlew clean""")
-
-        parts.append("============================\n")
-        return '\n'.join(parts)
+        if android_device_type == 'remote':
+            return android_block(project_type, android_device_type,
+                                 ticket.get('android_remote_host', ''),
+                                 ticket.get('android_remote_port', 5555))
+        return android_block(project_type, android_device_type)
 
     def build_dotnet_context(self, ticket: Dict) -> str:
         """Build .NET development context when project is dotnet type"""
-        project_type = ticket.get('project_type', '')
-
-        if project_type != 'dotnet':
+        if ticket.get('project_type', '') != 'dotnet':
             return ""
 
-        dotnet_port = ticket.get('dotnet_port', 5001)
-        app_path = ticket.get('app_path', '')
-        project_code = ticket.get('code', '').lower()
+        return dotnet_block(ticket.get('code', '').lower(),
+                            ticket.get('dotnet_port', 5001),
+                            ticket.get('app_path', ''))
 
-        parts = ["\n=== .NET DEVELOPMENT ==="]
-        parts.append(f"Project Type: ASP.NET Core / .NET 8")
-        parts.append(f"App Directory: {app_path}")
-        parts.append(f"Internal Port: {dotnet_port}")
-        parts.append(f"""
-.NET Commands:
-- Create console app: dotnet new console
-- Create web API: dotnet new webapi
-- Create MVC app: dotnet new mvc
-- Create Blazor app: dotnet new blazor
-- Build: dotnet build
-- Run: dotnet run
-- Run with port: dotnet run --urls=http://127.0.0.1:{dotnet_port}
-- Test: dotnet test
-- Publish: dotnet publish -c Release
-
-After building, the app will be accessible at:
-  https://SERVER_IP:9867/{project_code}/
-
-Service Management:
-- Start: sudo systemctl start codehero-dotnet-{project_code}
-- Stop: sudo systemctl stop codehero-dotnet-{project_code}
-- Status: sudo systemctl status codehero-dotnet-{project_code}
-- Logs: journalctl -u codehero-dotnet-{project_code} -f
-
-Important: After publishing, restart the service to apply changes.
-""")
-        parts.append("============================\n")
-        return '\n'.join(parts)
+    def _prefetch_context(self, user_id: str = None, project_id: int = None, ticket_id: int = None):
+        """Load every uncached row build_full_context needs over one connection"""
+        loads = []
+        if user_id:
+            loads.append((('user_preferences', user_id), self._load_user_preferences))
+        if project_id:
+            loads.append((('project_map', project_id), self._load_project_map))
+            loads.append((('project_knowledge', project_id), self._load_project_knowledge))
+        if ticket_id:
+            loads.append((('extraction', ticket_id), self._load_extraction))
+        loads = [(key, load) for key, load in loads if self._cache_get(key) is _CACHE_MISS]
+        if not loads:
+            return
+        try:
+            with self._db(dictionary=True) as (conn, cursor):
+                for (_, arg), load in loads:
+                    load(cursor, arg)
+        except Exception as e:
+            # The individual getters retry on their own connections
+            self.log(f"Error prefetching context: {e}", "WARNING")
 
     def build_full_context(self, ticket: Dict, user_id: str = None) -> Dict:
-        """Build complete context for Claude API call"""
+        """Build complete context for Claude API call.
+
+        Blocks are ordered from least to most volatile so the prompt prefix
+        stays byte-identical across turns and keeps hitting the prompt cache:
+        platform instructions and preferences first, then project structure
+        and knowledge, and the ticket extraction last.
+        """
         project_id = ticket.get('project_id')
         ticket_id = ticket.get('id')
         project_path = ticket.get('web_path') or ticket.get('app_path')
 
-        context_parts = []
+        self._prefetch_context(user_id, project_id, ticket_id)
+
+        static_parts = []
+        project_parts = []
+        ticket_parts = []
+
+        # 1. Android development context (for mobile projects)
+        android_context = self.build_android_context(ticket)
+        if android_context:
+            static_parts.append(android_context)
+
+        # 2. .NET development context (for dotnet projects)
+        dotnet_context = self.build_dotnet_context(ticket)
+        if dotnet_context:
+            static_parts.append(dotnet_context)
 
-        # 1. User preferences
+        # 3. User preferences
         if user_id:
             user_context = self.build_user_context(user_id)
             if user_context:
-                context_parts.append(user_context)
+                static_parts.append(user_context)
 
-        # 2. Project map
+        # 4. Project map
         if project_id and project_path:
             map_context = self.build_project_map_context(project_id, project_path)
             if map_context:
-                context_parts.append(map_context)
+                project_parts.append(map_context)
 
-        # 3. Project knowledge
+        # 5. Project knowledge
         if project_id:
             knowledge_context = self.build_project_knowledge_context(project_id)
             if knowledge_context:
-                context_parts.append(knowledge_context)
-
-        # 4. Android development context (for mobile projects)
-        android_context = self.build_android_context(ticket)
-        if android_context:
-            context_parts.append(android_context)
-
-        # 5. .NET development context (for dotnet projects)
-        dotnet_context = self.build_dotnet_context(ticket)
-        if dotnet_context:
-            context_parts.append(dotnet_context)
+                project_parts.append(knowledge_context)
 
-        # 7. Ticket extraction (if exists)
+        # 6. Ticket extraction (if exists)
         if ticket_id:
             extraction_context = self.build_extraction_context(ticket_id)
             if extraction_context:
-                context_parts.append(extraction_context)
+                ticket_parts.append(extraction_context)
 
-        # 8. Recent messages
+        # 7. Recent messages
         history = self.get_smart_history(ticket_id) if ticket_id else []
 
+        blocks = ['\n'.join(parts) for parts in (static_parts, project_parts, ticket_parts) if parts]
         return {
-            'system_context': '\n'.join(context_parts),
+            'system_context': '\n'.join(blocks),
+            'system_context_blocks': blocks,
             'history': history,
             'has_extraction': bool(self.get_extraction(ticket_id)) if ticket_id else False
         }
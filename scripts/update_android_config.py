@@ -1,17 +1,12 @@
 #!/usr/bin/env python3
 """Update Android config.json after setup"""
-import json
-import os
+
+from config_file import load_config, save_config
 
 config_path = '/opt/codehero/android/config.json'
 
 # Load existing config
-if os.path.exists(config_path):
-    with open(config_path, 'r') as f:
-        config = json.load(f)
-else:
-    os.makedirs(os.path.dirname(config_path), exist_ok=True)
-    config = {}
+config = load_config(config_path, create_dir=True)
 
 # Update with Android setup info
 config['setup_complete'] = True
@@ -29,7 +24,7 @@ config['services'] = ['ws-scrcpy', 'adb-connect']
 config['env_file'] = '/etc/profile.d/android-dev.sh'
 
 # Save
-with open(config_path, 'w') as f:
-    json.dump(config, f, indent=2)
-
-print(f"Updated {config_path}")
+if save_config(config_path, config):
+    print(f"Updated {config_path}")
+else:
+    print(f"{config_path} already up to date")
@@ -1,8 +1,8 @@
 #!/usr/bin/env python3
 """Update Windows config.json after setup"""
-import json
 import os
-import shutil
+
+from config_file import save_config, which
 
 config_path = '/opt/codehero/windows/config.json'
 
@@ -12,21 +12,23 @@ os.makedirs(os.path.dirname(config_path), exist_ok=True)
 config = {}
 config['setup_complete'] = True
 
-if shutil.which('dotnet'):
-    config['dotnet'] = shutil.which('dotnet')
-if shutil.which('pwsh'):
-    config['powershell'] = shutil.which('pwsh')
-if shutil.which('wine'):
-    config['wine'] = shutil.which('wine')
-if shutil.which('mono'):
-    config['mono'] = shutil.which('mono')
-if shutil.which('nuget'):
-    config['nuget'] = shutil.which('nuget')
+# One PATH lookup per tool
+TOOLS = {
+    'dotnet': 'dotnet',
+    'powershell': 'pwsh',
+    'wine': 'wine',
+    'mono': 'mono',
+    'nuget': 'nuget',
+}
+for key, binary in TOOLS.items():
+    path = which(binary)
+    if path:
+        config[key] = path
 
 config['env_file'] = '/etc/profile.d/windows-dev.sh'
 
 # Save
-with open(config_path, 'w') as f:
-    json.dump(config, f, indent=2)
-
-print(f"Updated {config_path}")
+if save_config(config_path, config):
+    print(f"Updated {config_path}")
+else:
+    print(f"{config_path} already up to date")
@@ -2,23 +2,75 @@
 """
 @file: verify_ui.py
 @description: Complete UI verification - screenshots, console errors, links
-@usage: python verify_ui.py <url> [output_path]
+@usage: python verify_ui.py <url> [url ...] [output_path] [--test-links] [--reuse-screenshots] [--format=png|jpeg]
 @tags: #testing #ui #playwright
 """
 
 import sys
 import os
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urljoin
 
-def verify_page(url, output_path="/tmp"):
+LINK_CHECK_WORKERS = 16
+MAX_CAPTURED_EVENTS = 200  # Per list, per page
+
+# Raw href/src attribute values, resolved against the page URL in Python
+COLLECT_LINKS_JS = """() => [
+    Array.from(document.querySelectorAll('a[href]'), a => a.getAttribute('href')),
+    Array.from(document.querySelectorAll('img[src]'), img => img.getAttribute('src')),
+]"""
+
+SCREENSHOT_VIEWPORTS = (
+    ("desktop", {"width": 1920, "height": 1080}),
+    ("mobile", {"width": 375, "height": 667}),
+)
+SCREENSHOT_HASHES_FILE = ".screenshot_hashes.json"
+# JPEG encodes long full-page shots several times faster and smaller than
+# PNG; PNG stays the default since it is lossless for visual review
+SCREENSHOT_FORMATS = ("png", "jpeg")
+JPEG_QUALITY = 75
+
+# What a screenshot depends on besides images: the DOM and the CSS rules
+# (cross-origin sheets can't be read, their URL stands in)
+RENDER_FINGERPRINT_JS = """() => document.documentElement.outerHTML + Array.from(
+    document.styleSheets,
+    sheet => { try { return Array.from(sheet.cssRules, rule => rule.cssText).join('\\n'); }
+               catch (e) { return sheet.href || ''; } }
+).join('\\n')"""
+
+def load_screenshot_hashes(output_path):
+    try:
+        with open(os.path.join(output_path, SCREENSHOT_HASHES_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def verify_page(url, output_path="/tmp", context=None, reuse_screenshots=False,
+                screenshot_format="png"):
     """
     Complete page verification:
     - Desktop + Mobile screenshots
     - Console errors capture
     - Failed requests capture
     - All links extraction
+
+    Pass an open browser context to reuse it; otherwise a browser is
+    launched just for this page. With reuse_screenshots, a screenshot whose
+    page fingerprint (URL, DOM and CSS) matches the previous run is kept
+    instead of being taken again. screenshot_format is "png" or "jpeg".
     """
-    from playwright.sync_api import sync_playwright
+    if context is None:
+        from playwright.sync_api import sync_playwright
+
+        with sync_playwright() as p:
+            browser = p.chromium.launch()
+            try:
+                return verify_page(url, output_path, browser.new_context(ignore_https_errors=True),
+                                   reuse_screenshots, screenshot_format)
+            finally:
+                browser.close()
 
     results = {
         "url": url,
@@ -26,57 +78,94 @@ def verify_page(url, output_path="/tmp"):
         "console_warnings": [],
         "failed_requests": [],
         "all_links": [],
-        "screenshots": {}
+        "screenshots": {},
+        "dropped": {"console_errors": 0, "console_warnings": 0, "failed_requests": 0}
     }
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch()
-        context = browser.new_context(ignore_https_errors=True)
-        page = context.new_page()
+    def capture(key, item):
+        # Bounded per page; overflow is only counted
+        if len(results[key]) < MAX_CAPTURED_EVENTS:
+            results[key].append(item)
+        else:
+            results["dropped"][key] += 1
 
+    page = context.new_page()
+    try:
         # Capture console messages
         def handle_console(msg):
             if msg.type == "error":
-                results["console_errors"].append(msg.text)
+                capture("console_errors", msg.text)
             elif msg.type == "warning":
-                results["console_warnings"].append(msg.text)
+                capture("console_warnings", msg.text)
 
         page.on("console", handle_console)
 
-        # Capture failed requests (404, CORS, etc.)
+        # Capture failed requests (404, CORS, etc.); formatted when printed
         page.on("requestfailed", lambda req:
-            results["failed_requests"].append(f"{req.url} - {req.failure}")
+            capture("failed_requests", (req.url, req.failure))
         )
 
-        # Navigate to page
-        page.goto(url)
-        page.wait_for_load_state("networkidle")
+        # Navigate to page; "load" already covers images, scripts and styles
+        # (so failed subresources are reported), then wait for web fonts
+        # instead of 500ms of network silence
+        page.goto(url, wait_until="load")
+        page.evaluate("() => document.fonts.ready.then(() => true)")
 
-        # Desktop screenshot
-        page.set_viewport_size({"width": 1920, "height": 1080})
-        desktop_path = f"{output_path}/screenshot_desktop.png"
-        page.screenshot(path=desktop_path, full_page=True)
-        results["screenshots"]["desktop"] = desktop_path
+        # Desktop + mobile screenshots
+        previous_hashes = load_screenshot_hashes(output_path) if reuse_screenshots else {}
+        hashes = {}
+        screenshot_options = {"type": screenshot_format, "full_page": True}
+        if screenshot_format == "jpeg":
+            screenshot_options["quality"] = JPEG_QUALITY
+        for name, viewport in SCREENSHOT_VIEWPORTS:
+            page.set_viewport_size(viewport)
+            screenshot_path = f"{output_path}/screenshot_{name}.{screenshot_format}"
+            if reuse_screenshots:
+                fingerprint = url + page.evaluate(RENDER_FINGERPRINT_JS)
+                hashes[name] = hashlib.blake2b(fingerprint.encode(), digest_size=16).hexdigest()
+            if not (hashes.get(name) and previous_hashes.get(name) == hashes[name]
+                    and os.path.exists(screenshot_path)):
+                page.screenshot(path=screenshot_path, **screenshot_options)
+            results["screenshots"][name] = screenshot_path
 
-        # Mobile screenshot
-        page.set_viewport_size({"width": 375, "height": 667})
-        mobile_path = f"{output_path}/screenshot_mobile.png"
-        page.screenshot(path=mobile_path, full_page=True)
-        results["screenshots"]["mobile"] = mobile_path
+        if reuse_screenshots:
+            with open(os.path.join(output_path, SCREENSHOT_HASHES_FILE), "w") as f:
+                json.dump(hashes, f)
 
-        # Extract all links
-        for a in page.query_selector_all("a[href]"):
-            href = a.get_attribute("href")
-            if href and not href.startswith("#") and not href.startswith("javascript:"):
-                results["all_links"].append(urljoin(url, href))
+        # Extract all link and image attributes in one browser round-trip
+        # (repeated nav/footer links are kept once, in first-seen order)
+        hrefs, srcs = page.evaluate(COLLECT_LINKS_JS)
+        links = dict.fromkeys(
+            urljoin(url, href) for href in hrefs
+            if href and not href.startswith("#") and not href.startswith("javascript:")
+        )
+        links.update(dict.fromkeys(urljoin(url, src) for src in srcs))
+        results["all_links"] = list(links)
+    finally:
+        page.close()
+
+    return results
 
-        # Extract all images
-        for img in page.query_selector_all("img[src]"):
-            results["all_links"].append(urljoin(url, img.get_attribute("src")))
+def verify_pages(urls, output_path="/tmp", reuse_screenshots=False, screenshot_format="png"):
+    """Verify several pages with a single browser launch.
 
+    With more than one URL each page gets its own page<N> subdirectory
+    of output_path for its screenshots.
+    """
+    from playwright.sync_api import sync_playwright
+
+    all_results = []
+    with sync_playwright() as p:
+        browser = p.chromium.launch()
+        context = browser.new_context(ignore_https_errors=True)
+        for i, url in enumerate(urls, 1):
+            page_output = output_path if len(urls) == 1 else os.path.join(output_path, f"page{i}")
+            os.makedirs(page_output, exist_ok=True)
+            all_results.append(verify_page(url, page_output, context, reuse_screenshots,
+                                           screenshot_format))
         browser.close()
 
-    return results
+    return all_results
 
 def print_results(results):
     """Print verification results in readable format."""
@@ -88,10 +177,14 @@ def print_results(results):
     print(f"Desktop: {results['screenshots']['desktop']}")
     print(f"Mobile:  {results['screenshots']['mobile']}")
 
+    dropped = results["dropped"]
+
     print("\n=== CONSOLE ERRORS ===")
     if results["console_errors"]:
         for e in results["console_errors"]:
             print(f"  {e}")
+        if dropped["console_errors"]:
+            print(f"  ... and {dropped['console_errors']} more")
     else:
         print("  None")
 
@@ -99,13 +192,17 @@ def print_results(results):
     if results["console_warnings"]:
         for w in results["console_warnings"]:
             print(f"  {w}")
+        if dropped["console_warnings"]:
+            print(f"  ... and {dropped['console_warnings']} more")
     else:
         print("  None")
 
     print("\n=== FAILED REQUESTS ===")
     if results["failed_requests"]:
-        for f in results["failed_requests"]:
-            print(f"  {f}")
+        for request_url, failure in results["failed_requests"]:
+            print(f"  {request_url} - {failure}")
+        if dropped["failed_requests"]:
+            print(f"  ... and {dropped['failed_requests']} more")
     else:
         print("  None")
 
@@ -117,7 +214,8 @@ def print_results(results):
 
     # Summary
     print("\n" + "=" * 50)
-    errors = len(results["console_errors"]) + len(results["failed_requests"])
+    errors = (len(results["console_errors"]) + dropped["console_errors"]
+              + len(results["failed_requests"]) + dropped["failed_requests"])
     if errors == 0:
         print("RESULT: All checks passed")
     else:
@@ -126,46 +224,75 @@ def print_results(results):
 
     return errors == 0
 
-def test_links(links, verify_ssl=False):
-    """Test all links for 404s."""
+def test_links(links, verify_ssl=False, workers=LINK_CHECK_WORKERS):
+    """Test all links for 404s (concurrently, over one pooled session)."""
     import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    def check(url):
+        try:
+            r = session.head(url, timeout=10, verify=verify_ssl, allow_redirects=True)
+            return r.status_code
+        except Exception as e:
+            return e
 
     print("\n=== TESTING LINKS ===")
+    urls = [url for url in dict.fromkeys(links) if url and not url.startswith('#')]
     broken = []
-    for url in set(links):
-        if url and not url.startswith('#'):
-            try:
-                r = requests.head(url, timeout=10, verify=verify_ssl, allow_redirects=True)
-                status = "OK" if r.status_code < 400 else "BROKEN"
-                if r.status_code >= 400:
-                    broken.append((url, r.status_code))
-                    print(f"  {r.status_code} {url}")
-            except Exception as e:
-                broken.append((url, str(e)))
-                print(f"  ERROR {url}: {e}")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for url, outcome in zip(urls, executor.map(check, urls)):
+            if isinstance(outcome, Exception):
+                broken.append((url, str(outcome)))
+                print(f"  ERROR {url}: {outcome}")
+            elif outcome >= 400:
+                broken.append((url, outcome))
+                print(f"  {outcome} {url}")
+    session.close()
 
     if not broken:
         print("  All links OK!")
     return broken
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python verify_ui.py <url> [output_path]")
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    # Positionals are URLs, except a trailing one without a scheme: the output path
+    if len(args) > 1 and "://" not in args[-1]:
+        urls, output_path = args[:-1], args[-1]
+    else:
+        urls, output_path = args, "/tmp"
+    if not urls:
+        print("Usage: python verify_ui.py <url> [url ...] [output_path] [--test-links] [--reuse-screenshots] [--format=png|jpeg]")
         print("Example: python verify_ui.py https://127.0.0.1:9867/myproject/")
         sys.exit(1)
 
-    url = sys.argv[1]
-    output_path = sys.argv[2] if len(sys.argv) > 2 else "/tmp"
+    screenshot_format = next((arg.split("=", 1)[1] for arg in sys.argv[1:]
+                              if arg.startswith("--format=")), "png")
+    if screenshot_format not in SCREENSHOT_FORMATS:
+        print(f"Unsupported --format={screenshot_format} (choose from: {', '.join(SCREENSHOT_FORMATS)})")
+        sys.exit(1)
+
+    for url in urls:
+        if "://" not in url:
+            print(f"Warning: {url} has no scheme (e.g. https:// or file://), navigation may fail")
 
     # Ensure output path exists
     os.makedirs(output_path, exist_ok=True)
 
-    # Run verification
-    results = verify_page(url, output_path)
-    success = print_results(results)
+    # Run verification (one browser for all pages)
+    success = True
+    all_links = []
+    for results in verify_pages(urls, output_path, "--reuse-screenshots" in sys.argv,
+                                screenshot_format):
+        success = print_results(results) and success
+        all_links.extend(results["all_links"])
 
     # Optionally test all links
     if "--test-links" in sys.argv:
-        test_links(results["all_links"])
+        test_links(all_links)
 
     sys.exit(0 if success else 1)
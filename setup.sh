@@ -242,8 +242,13 @@ fi
 # [6/12] PYTHON PACKAGES
 # =====================================================
 echo -e "${YELLOW}[6/12] Installing Python packages...${NC}"
-pip3 install --ignore-installed flask flask-socketio flask-cors mysql-connector-python bcrypt eventlet pyotp qrcode pillow --break-system-packages 2>&1 || \
-pip3 install --ignore-installed flask flask-socketio flask-cors mysql-connector-python bcrypt eventlet pyotp qrcode pillow 2>&1 || true
+pip3 install --ignore-installed flask flask-socketio flask-cors mysql-connector-python bcrypt eventlet pyotp qrcode pillow orjson tiktoken --break-system-packages 2>&1 || \
+pip3 install --ignore-installed flask flask-socketio flask-cors mysql-connector-python bcrypt eventlet pyotp qrcode pillow orjson tiktoken 2>&1 || true
+
+# Pre-fetch the tokenizer encoding into a persistent cache (smart_context.py reads it from there)
+echo "  Caching tokenizer encoding..."
+mkdir -p ${INSTALL_DIR}/cache/tiktoken
+TIKTOKEN_CACHE_DIR=${INSTALL_DIR}/cache/tiktoken python3 -c "import tiktoken; tiktoken.get_encoding('cl100k_base')" 2>/dev/null || true
 
 # Playwright (browser automation for visual verification)
 echo "  Installing Playwright browser dependencies..."
@@ -4,205 +4,277 @@ Comprehensive Playwright tests for CodeHero Admin Panel
 Tests all major functionality
 """
 
-from playwright.sync_api import sync_playwright, expect
-import time
+import asyncio
+import os
+import re
+
+from playwright.async_api import async_playwright
 
 BASE_URL = "https://localhost:9453"
 
-def test_all():
-    with sync_playwright() as p:
-        # Launch browser (ignore SSL errors for self-signed cert)
-        browser = p.chromium.launch(headless=True)
-        context = browser.new_context(ignore_https_errors=True)
-        page = context.new_page()
+# No section asserts on images, fonts or media, so they are not downloaded
+# (CSS still loads: locators rely on it). TEST_LOAD_ASSETS=1 turns this off.
+BLOCKED_ASSETS = re.compile(r'\.(png|jpe?g|webp|gif|ico|woff2?|ttf|eot|mp4)(\?.*)?$', re.IGNORECASE)
+
+
+async def block_asset(route):
+    await route.abort()
+
+
+async def check_login(page, log):
+    # ============ 1. LOGIN ============
+    log("\n[1] Testing Login...")
+    await page.goto(f"{BASE_URL}/login")
+    assert "Login" in await page.title()
+
+    await page.fill('input[name="username"]', 'admin')
+    await page.fill('input[name="password"]', 'admin123')
+    await page.click('button[type="submit"]')
+    await page.wait_for_url("**/dashboard")
+    log("    ✅ Login successful")
+
+
+async def check_dashboard(page, log):
+    # ============ 2. DASHBOARD ============
+    log("\n[2] Testing Dashboard...")
+    assert "Dashboard" in await page.title()
+
+    # Read every stat card in one round-trip: total count + (label, href) of the links
+    stat_cards = await page.evaluate("""() => ({
+        count: document.querySelectorAll('.stat-card').length,
+        links: Array.from(document.querySelectorAll('a.stat-card'),
+                          a => [a.innerText.toLowerCase(), a.getAttribute('href')]),
+    })""")
+
+    def stat_card_href(label):
+        return next((href for text, href in stat_cards['links'] if label.lower() in text), None)
+
+    # Check stats are visible
+    stats = stat_cards['count']
+    log(f"    Found {stats} stat cards")
+    assert stats >= 5, "Expected at least 5 stat cards"
+
+    # Check clickable boxes
+    log("    Testing clickable stat boxes...")
+
+    # Test Projects link
+    href = stat_card_href("Projects")
+    assert href == '/projects', f"Projects link should go to /projects, got {href}"
+    log("    ✅ Projects box links correctly")
+
+    # Test Open Tickets link
+    href = stat_card_href("Open Tickets")
+    assert href and 'status=open' in href, f"Open Tickets should filter by status=open"
+    log("    ✅ Open Tickets box links correctly")
+
+    # Test In Progress link
+    href = stat_card_href("In Progress")
+    assert href and 'status=in_progress' in href
+    log("    ✅ In Progress box links correctly")
+
+    # Test Pending Review link
+    href = stat_card_href("Pending Review")
+    assert href and 'status=pending_review' in href
+    log("    ✅ Pending Review box links correctly")
+
+
+async def check_tickets_list(page, log):
+    # ============ 3. TICKETS LIST ============
+    log("\n[3] Testing Tickets List...")
+    await page.goto(f"{BASE_URL}/tickets")
+    assert "Tickets" in await page.title() or "All Tickets" in await page.content()
+
+    # Check filters exist
+    filters = await page.locator('.filter-btn').count()
+    log(f"    Found {filters} filter buttons")
+    assert filters >= 4, "Expected at least 4 filter buttons"
+
+    # Test filter navigation
+    await page.click('.filter-btn:has-text("In Progress")')
+    await page.wait_for_url("**/tickets?status=in_progress")
+    log("    ✅ Filter navigation works")
+
+    # Go back to all
+    await page.click('.filter-btn:has-text("All")')
+    await page.wait_for_url("**/tickets")
+    log("    ✅ Tickets list working")
+
+
+async def check_projects(page, log):
+    # ============ 4. PROJECTS LIST ============
+    log("\n[4] Testing Projects List...")
+    await page.goto(f"{BASE_URL}/projects")
+
+    # Check projects exist
+    projects = await page.locator('.card').count()
+    log(f"    Found {projects} project cards")
+
+    # Check Show Archived checkbox
+    checkbox = page.locator('#showArchived')
+    assert await checkbox.is_visible(), "Show Archived checkbox should be visible"
+    log("    ✅ Show Archived checkbox exists")
+
+    # ============ 5. PROJECT DETAIL & ARCHIVE ============
+    log("\n[5] Testing Project Detail...")
+    # Click first project
+    await page.click('.card-actions a:first-child')
+    await page.wait_for_url("**/project/*")
+
+    # Check archive/reopen button exists (one evaluation for both)
+    labels = await page.locator('button').all_text_contents()
+    if any("Archive" in label for label in labels):
+        log("    ✅ Archive button visible for active project")
+    elif any("Reopen" in label for label in labels):
+        log("    ✅ Reopen button visible for archived project")
+
+
+async def check_ticket_detail(page, log):
+    # ============ 6. TICKET DETAIL ============
+    log("\n[6] Testing Ticket Detail...")
+    await page.goto(f"{BASE_URL}/tickets")
+
+    # Find a ticket and click it
+    ticket_link = page.locator('.ticket-row').first
+    if await ticket_link.count():
+        await ticket_link.click()
+        await page.wait_for_url("**/ticket/*")
+
+        # Check page elements
+        assert await page.locator('.conversation, #conversation').count()
+        log("    ✅ Ticket detail page loads")
+
+        # Check for status-specific buttons (all labels in one evaluation)
+        labels = await page.locator('button').all_text_contents()
+        if any("Approve" in label for label in labels):
+            log("    ✅ Approve button visible for pending_review ticket")
+        if any("Request Changes" in label for label in labels):
+            log("    ✅ Request Changes button visible")
+        if any("Reopen" in label for label in labels):
+            log("    ✅ Reopen button visible for closed ticket")
+    else:
+        log("    ⚠️  No tickets found to test")
+
+
+async def check_console(page, log):
+    # ============ 7. CONSOLE ============
+    log("\n[7] Testing Console...")
+    await page.goto(f"{BASE_URL}/console")
+
+    # Check ticket selector exists
+    ticket_select = page.locator('#ticket-select')
+    assert await ticket_select.is_visible(), "Ticket selector should be visible"
+    log("    ✅ Ticket selector dropdown exists")
+
+    # Check daemon controls
+    start_btn = page.locator('button:has-text("Start Daemon")')
+    stop_btn = page.locator('button:has-text("Stop Daemon")')
+    assert await start_btn.is_visible() and await stop_btn.is_visible()
+    log("    ✅ Daemon controls visible")
+
+    # Check conversation area
+    conversation = page.locator('.conversation, #conversation')
+    assert await conversation.count()
+    log("    ✅ Conversation area exists")
+
+
+async def check_history(page, log):
+    # ============ 8. HISTORY ============
+    log("\n[8] Testing History...")
+    await page.goto(f"{BASE_URL}/history")
+    assert "History" in await page.title() or "Execution History" in await page.content()
+
+    # Check session cards
+    sessions = await page.locator('.session-card').count()
+    log(f"    Found {sessions} session cards")
+
+    if sessions:
+        # Click View Details on first session
+        await page.locator('.view-btn').first.click()
+        await page.wait_for_url("**/session/*")
+        log("    ✅ Session detail page loads")
+
+        # Check View Ticket link exists
+        ticket_link = page.locator('a:has-text("View Ticket")')
+        if await ticket_link.count():
+            log("    ✅ View Ticket link exists in session detail")
+    else:
+        log("    ⚠️  No sessions found")
+
+
+async def check_timezone(page, log):
+    # ============ 9. TIMEZONE CHECK ============
+    log("\n[9] Testing Timezone Display...")
+    await page.goto(f"{BASE_URL}/tickets")
+
+    # Check if times are displayed (we can't verify timezone easily, but check format)
+    time_elements = await page.locator('.ticket-meta').all_text_contents()
+    if time_elements:
+        log(f"    Sample time display: {time_elements[0][:50]}...")
+        log("    ✅ Times are displayed")
+
+
+async def check_logout(page, log):
+    # ============ 10. LOGOUT ============
+    log("\n[10] Testing Logout...")
+    await page.click('a:has-text("Logout")')
+    await page.wait_for_url("**/login")
+    log("    ✅ Logout successful")
+
+
+# Independent read-only sections: each gets its own tab and they run concurrently
+PARALLEL_SECTIONS = (check_tickets_list, check_projects, check_ticket_detail,
+                     check_console, check_history, check_timezone)
+
+
+async def run_parallel_sections(context):
+    """Run PARALLEL_SECTIONS in separate tabs; output is printed in section order"""
+    outputs = [[] for _ in PARALLEL_SECTIONS]
+    pages = [await context.new_page() for _ in PARALLEL_SECTIONS]
+    results = await asyncio.gather(
+        *(section(page, output.append) for section, page, output in zip(PARALLEL_SECTIONS, pages, outputs)),
+        return_exceptions=True
+    )
+    for output in outputs:
+        for line in output:
+            print(line)
+    for page in pages:
+        await page.close()
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+
+async def run_all():
+    async with async_playwright() as p:
+        # Launch browser once (ignore SSL errors for self-signed cert); all
+        # tabs share this context, so the login cookie carries over
+        browser = await p.chromium.launch(headless=True)
+        context = await browser.new_context(ignore_https_errors=True)
+        if os.environ.get("TEST_LOAD_ASSETS") != "1":
+            await context.route(BLOCKED_ASSETS, block_asset)
+        page = await context.new_page()
 
         print("\n" + "="*60)
         print("CODEHERO ADMIN PANEL - COMPREHENSIVE TEST")
         print("="*60)
 
-        # ============ 1. LOGIN ============
-        print("\n[1] Testing Login...")
-        page.goto(f"{BASE_URL}/login")
-        assert "Login" in page.title()
-
-        page.fill('input[name="username"]', 'admin')
-        page.fill('input[name="password"]', 'admin123')
-        page.click('button[type="submit"]')
-        page.wait_for_url("**/dashboard")
-        print("    ✅ Login successful")
-
-        # ============ 2. DASHBOARD ============
-        print("\n[2] Testing Dashboard...")
-        assert "Dashboard" in page.title()
-
-        # Check stats are visible
-        stats = page.locator('.stat-card').count()
-        print(f"    Found {stats} stat cards")
-        assert stats >= 5, "Expected at least 5 stat cards"
-
-        # Check clickable boxes
-        print("    Testing clickable stat boxes...")
-
-        # Test Projects link
-        projects_link = page.locator('a.stat-card:has-text("Projects")')
-        href = projects_link.get_attribute('href')
-        assert href == '/projects', f"Projects link should go to /projects, got {href}"
-        print("    ✅ Projects box links correctly")
-
-        # Test Open Tickets link
-        open_link = page.locator('a.stat-card:has-text("Open Tickets")')
-        href = open_link.get_attribute('href')
-        assert 'status=open' in href, f"Open Tickets should filter by status=open"
-        print("    ✅ Open Tickets box links correctly")
-
-        # Test In Progress link
-        progress_link = page.locator('a.stat-card:has-text("In Progress")')
-        href = progress_link.get_attribute('href')
-        assert 'status=in_progress' in href
-        print("    ✅ In Progress box links correctly")
-
-        # Test Pending Review link
-        review_link = page.locator('a.stat-card:has-text("Pending Review")')
-        href = review_link.get_attribute('href')
-        assert 'status=pending_review' in href
-        print("    ✅ Pending Review box links correctly")
-
-        # ============ 3. TICKETS LIST ============
-        print("\n[3] Testing Tickets List...")
-        page.goto(f"{BASE_URL}/tickets")
-        assert "Tickets" in page.title() or "All Tickets" in page.content()
-
-        # Check filters exist
-        filters = page.locator('.filter-btn').count()
-        print(f"    Found {filters} filter buttons")
-        assert filters >= 4, "Expected at least 4 filter buttons"
-
-        # Test filter navigation
-        page.click('.filter-btn:has-text("In Progress")')
-        page.wait_for_url("**/tickets?status=in_progress")
-        print("    ✅ Filter navigation works")
-
-        # Go back to all
-        page.click('.filter-btn:has-text("All")')
-        page.wait_for_url("**/tickets")
-        print("    ✅ Tickets list working")
-
-        # ============ 4. PROJECTS LIST ============
-        print("\n[4] Testing Projects List...")
-        page.goto(f"{BASE_URL}/projects")
-
-        # Check projects exist
-        projects = page.locator('.card').count()
-        print(f"    Found {projects} project cards")
-
-        # Check Show Archived checkbox
-        checkbox = page.locator('#showArchived')
-        assert checkbox.is_visible(), "Show Archived checkbox should be visible"
-        print("    ✅ Show Archived checkbox exists")
-
-        # ============ 5. PROJECT DETAIL & ARCHIVE ============
-        print("\n[5] Testing Project Detail...")
-        # Click first project
-        page.click('.card-actions a:first-child')
-        page.wait_for_url("**/project/*")
-
-        # Check archive button exists
-        archive_btn = page.locator('button:has-text("Archive")')
-        if archive_btn.count() > 0:
-            print("    ✅ Archive button visible for active project")
-        else:
-            reopen_btn = page.locator('button:has-text("Reopen")')
-            if reopen_btn.count() > 0:
-                print("    ✅ Reopen button visible for archived project")
-
-        # ============ 6. TICKET DETAIL ============
-        print("\n[6] Testing Ticket Detail...")
-        page.goto(f"{BASE_URL}/tickets")
-
-        # Find a ticket and click it
-        ticket_link = page.locator('.ticket-row').first
-        if ticket_link.count() > 0:
-            ticket_link.click()
-            page.wait_for_url("**/ticket/*")
-
-            # Check page elements
-            assert page.locator('.conversation').count() > 0 or page.locator('#conversation').count() > 0
-            print("    ✅ Ticket detail page loads")
-
-            # Check for status-specific buttons
-            if page.locator('button:has-text("Approve")').count() > 0:
-                print("    ✅ Approve button visible for pending_review ticket")
-            if page.locator('button:has-text("Request Changes")').count() > 0:
-                print("    ✅ Request Changes button visible")
-            if page.locator('button:has-text("Reopen")').count() > 0:
-                print("    ✅ Reopen button visible for closed ticket")
-        else:
-            print("    ⚠️  No tickets found to test")
-
-        # ============ 7. CONSOLE ============
-        print("\n[7] Testing Console...")
-        page.goto(f"{BASE_URL}/console")
-
-        # Check ticket selector exists
-        ticket_select = page.locator('#ticket-select')
-        assert ticket_select.is_visible(), "Ticket selector should be visible"
-        print("    ✅ Ticket selector dropdown exists")
-
-        # Check daemon controls
-        start_btn = page.locator('button:has-text("Start Daemon")')
-        stop_btn = page.locator('button:has-text("Stop Daemon")')
-        assert start_btn.is_visible() and stop_btn.is_visible()
-        print("    ✅ Daemon controls visible")
-
-        # Check conversation area
-        conversation = page.locator('.conversation, #conversation')
-        assert conversation.count() > 0
-        print("    ✅ Conversation area exists")
-
-        # ============ 8. HISTORY ============
-        print("\n[8] Testing History...")
-        page.goto(f"{BASE_URL}/history")
-        assert "History" in page.title() or "Execution History" in page.content()
-
-        # Check session cards
-        sessions = page.locator('.session-card').count()
-        print(f"    Found {sessions} session cards")
-
-        if sessions > 0:
-            # Click View Details on first session
-            page.locator('.view-btn').first.click()
-            page.wait_for_url("**/session/*")
-            print("    ✅ Session detail page loads")
-
-            # Check View Ticket link exists
-            ticket_link = page.locator('a:has-text("View Ticket")')
-            if ticket_link.count() > 0:
-                print("    ✅ View Ticket link exists in session detail")
-        else:
-            print("    ⚠️  No sessions found")
-
-        # ============ 9. TIMEZONE CHECK ============
-        print("\n[9] Testing Timezone Display...")
-        page.goto(f"{BASE_URL}/tickets")
-
-        # Check if times are displayed (we can't verify timezone easily, but check format)
-        time_elements = page.locator('.ticket-meta').all_text_contents()
-        if time_elements:
-            print(f"    Sample time display: {time_elements[0][:50]}...")
-            print("    ✅ Times are displayed")
-
-        # ============ 10. LOGOUT ============
-        print("\n[10] Testing Logout...")
-        page.click('a:has-text("Logout")')
-        page.wait_for_url("**/login")
-        print("    ✅ Logout successful")
+        # Login must finish first (it sets the session cookie); logout must be last
+        await check_login(page, print)
+        await check_dashboard(page, print)
+        await run_parallel_sections(context)
+        await check_logout(page, print)
 
         # ============ SUMMARY ============
         print("\n" + "="*60)
         print("ALL TESTS PASSED!")
         print("="*60 + "\n")
 
-        browser.close()
+        await browser.close()
+
+
+def test_all():
+    # Sync entry point: pytest collects it and actually runs the async suite
+    asyncio.run(run_all())
 
 if __name__ == "__main__":
     test_all()
@@ -396,8 +396,13 @@ log_success "Files copied"
 # =====================================================
 
 log_info "Checking Python dependencies..."
-pip3 install --quiet --ignore-installed eventlet --break-system-packages 2>/dev/null || \
-pip3 install --quiet --ignore-installed eventlet 2>/dev/null || true
+pip3 install --quiet --ignore-installed eventlet orjson tiktoken --break-system-packages 2>/dev/null || \
+pip3 install --quiet --ignore-installed eventlet orjson tiktoken 2>/dev/null || true
+
+# Pre-fetch the tokenizer encoding into a persistent cache (smart_context.py reads it from there)
+mkdir -p "${INSTALL_DIR}/cache/tiktoken"
+TIKTOKEN_CACHE_DIR="${INSTALL_DIR}/cache/tiktoken" python3 -c "import tiktoken; tiktoken.get_encoding('cl100k_base')" 2>/dev/null || true
+chown -R claude:claude "${INSTALL_DIR}/cache" 2>/dev/null || true
 log_success "Python dependencies OK"
 
 # =====================================================
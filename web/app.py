@@ -1609,28 +1609,30 @@ def get_file_tree(project_id):
     def build_tree(path, rel_path=''):
         items = []
         try:
-            entries = sorted(os.listdir(path), key=lambda x: (not os.path.isdir(os.path.join(path, x)), x.lower()))
+            # scandir: is_dir() comes from d_type and stat() is cached on the
+            # entry, instead of isdir/isdir/getsize stat calls per name
+            with os.scandir(path) as it:
+                entries = sorted(it, key=lambda e: (not e.is_dir(), e.name.lower()))
             for entry in entries:
                 # Skip hidden and common ignored files
-                if entry.startswith('.') or entry in ['node_modules', '__pycache__', 'vendor', '.git']:
+                if entry.name.startswith('.') or entry.name in ['node_modules', '__pycache__', 'vendor', '.git']:
                     continue
 
-                full_path = os.path.join(path, entry)
-                entry_rel = os.path.join(rel_path, entry) if rel_path else entry
+                entry_rel = os.path.join(rel_path, entry.name) if rel_path else entry.name
 
-                if os.path.isdir(full_path):
+                if entry.is_dir():
                     items.append({
-                        'name': entry,
+                        'name': entry.name,
                         'path': entry_rel,
                         'type': 'dir',
-                        'children': build_tree(full_path, entry_rel)
+                        'children': build_tree(entry.path, entry_rel)
                     })
                 else:
                     items.append({
-                        'name': entry,
+                        'name': entry.name,
                         'path': entry_rel,
                         'type': 'file',
-                        'size': os.path.getsize(full_path)
+                        'size': entry.stat().st_size
                     })
         except PermissionError:
             pass